@@ -115,20 +115,22 @@ class SpatialExtent(object):
             # use rastermask if provided.
             if rastermask is not None:
                 vectorfile = os.path.join(os.path.dirname(rastermask), os.path.basename(rastermask)[:-4] + '.shp')
-                features = open_vector(utils.vectorize(rastermask, vectorfile), where='DN=1')
-                for f in features:
-                    extents.append(cls(dataclass, feature=f, rastermask=rastermask,
-                                        tiles=tiles, pcov=pcov, ptile=ptile))
+                features = list(open_vector(utils.vectorize(rastermask, vectorfile), where='DN=1'))
             else:
-                features = open_vector(site, key, where)
-                for f in features:
-                    extents.append(cls(dataclass, feature=f, rastermask=rastermask,
-                                       tiles=tiles, pcov=pcov, ptile=ptile))
+                features = list(open_vector(site, key, where))
+            # find every feature's tiles at once
+            coverages = dataclass.Asset.Repository.vector2tiles_many(features, pcov, ptile, tiles)
+            for f, coverage in zip(features, coverages):
+                extents.append(cls(dataclass, feature=f, rastermask=rastermask,
+                                   tiles=tiles, pcov=pcov, ptile=ptile, coverage=coverage))
         return extents
 
     def __init__(self, dataclass, tiles, pcov=None, ptile=None,
-                 feature=None, rastermask=None):
-        """ Create spatial extent with a GeoFeature instance or list of tiles """
+                 feature=None, rastermask=None, coverage=None):
+        """ Create spatial extent with a GeoFeature instance or list of tiles
+
+        coverage is the feature's vector2tiles result, if it's already known.
+        """
         self.repo = dataclass.Asset.Repository
 
         # TODO - try and close this and only open on demand (make site property)
@@ -136,7 +138,9 @@ class SpatialExtent(object):
         self.rastermask = rastermask
 
         if feature is not None:
-            tiles = self.repo.vector2tiles(feature, pcov, ptile, tiles)
+            if coverage is None:
+                coverage = self.repo.vector2tiles(feature, pcov, ptile, tiles)
+            tiles = coverage
             self.feature = (feature.Filename(), feature.LayerName(), feature.FID())
             self.sitename = feature.Basename()
         else:
@@ -149,12 +153,17 @@ class SpatialExtent(object):
         """ List of tile ids """
         return self.coverage.keys()
 
+    @property
+    def tile_dates(self):
+        """ Dict of tile id: set of dates that tile has data for """
+        return {t: set(self.repo.find_dates(t)) for t in self.tiles}
+
     @property
     def available_dates(self):
         """ Get list of all dates for these tiles """
         dates = []
-        for t in self.tiles:
-            dates.extend(self.repo.find_dates(t))
+        for d in self.tile_dates.values():
+            dates.extend(d)
         return dates
 
     def print_tile_coverage(self):
@@ -27,9 +27,9 @@ import errno
 from osgeo import gdal, ogr
 from datetime import datetime, timedelta
 import glob
+import fnmatch
 import re
 from itertools import groupby
-from shapely.wkt import loads
 import tarfile
 import zipfile
 import json
@@ -37,7 +37,11 @@ import traceback
 import ftplib
 import shutil
 import commands
+import threading
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
 from urllib import urlencode
+from urlparse import urlparse
 import urllib2
 from cookielib import CookieJar
 import argparse
@@ -53,6 +57,8 @@ from gips import __version__
 from gips.utils import (settings, VerboseOut, RemoveFiles, File2List, List2File, Colors,
         basename, mkdir, open_vector)
 from gips import utils
+from gips.data import query_cache
+from gips.data import tile_index
 from ..inventory import dbinv, orm
 
 
@@ -101,6 +107,35 @@ def _gs_stop_trying(e):
             and not (499 < e.response.status_code < 600))
 
 
+# held while a fetch archives inline, so concurrent fetches modify the
+# archive one asset at a time; see Data._fetch_concurrently
+_archive_lock = threading.Lock()
+
+
+class _HostThrottle(object):
+    """Caps the number of concurrent downloads from each host.
+
+    `limits` maps hostnames to caps; hosts not listed there get `default`.
+    """
+    def __init__(self, limits, default):
+        self.limits = limits
+        self.default = default
+        self._lock = threading.Lock()
+        self._semaphores = {}
+
+    @contextmanager
+    def slot(self, url):
+        """Hold one of the url's host's download slots for the duration."""
+        host = urlparse(url or '').netloc
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(
+                    max(1, int(self.limits.get(host, self.default))))
+            semaphore = self._semaphores[host]
+        with semaphore:
+            yield
+
+
 class GoogleStorageMixin(object):
     """Mix this into a class (probably Asset) to use data in google storage.
 
@@ -115,16 +150,36 @@ class GoogleStorageMixin(object):
                           requests.exceptions.RequestException,
                           max_time=_gs_backoff_max,
                           giveup=_gs_stop_trying)
-    def gs_api_search(cls, prefix, delimiter='/'):
+    def gs_api_search(cls, prefix, delimiter='/', page_token=None):
         """Convenience wrapper for searching in google cloud storage."""
         params = {'prefix': prefix}
         if delimiter is not None:
             params['delimiter'] = delimiter
+        if page_token is not None:
+            params['pageToken'] = page_token
         r = requests.get(cls._gs_query_url_base.format(cls.gs_bucket_name),
                          params=params)
         r.raise_for_status()
         return r.json()
 
+    @classmethod
+    @lru_cache(maxsize=100) # cache size chosen arbitrarily
+    def gs_list_prefixes(cls, prefix):
+        """Return all the 'directories' starting with the given prefix.
+
+        Follows pagination, so it's suitable for range queries, such as
+        listing a tile's scenes for a whole year at once; per-date lookups
+        can then be answered from the cached listing.
+        """
+        prefixes = []
+        page_token = None
+        while True:
+            r = cls.gs_api_search(prefix, page_token=page_token)
+            prefixes.extend(r.get('prefixes', []))
+            page_token = r.get('nextPageToken')
+            if page_token is None:
+                return tuple(prefixes)
+
     @classmethod
     def gs_object_url_base(cls):
         """Return the google store URL for the driver's bucket."""
@@ -193,9 +248,13 @@ class S3Mixin(object):
         * set up query & fetch methods to call the methods below
     """
     @classmethod
-    @lru_cache(maxsize=1)
+    @lru_cache(maxsize=100) # cache size chosen arbitrarily
     def s3_prefix_search(cls, prefix, profile=None, creds=None, requester_pays=False):
-        # find the layer and metadata files matching the current scene
+        """Return all the keys in the bucket starting with the given prefix.
+
+        Drivers can list a whole range at once, eg a tile-year, then answer
+        per-date queries by filtering the cached result.
+        """
         import boto3 # import here so it only breaks if it's actually needed
         if profile is None and creds is None:
             validate_s3_env_vars()
@@ -237,6 +296,18 @@ class Repository(object):
 
     default_settings = {}
 
+    # settings every driver understands; consulted after default_settings
+    common_default_settings = {
+        'fetch-workers': 1,         # concurrent (asset, tile, date) fetches
+        'fetch-host-limits': {},    # {hostname: max concurrent downloads}
+        'fetch-host-default-limit': 2, # for hosts not in fetch-host-limits
+        # persistent query_service cache; see Asset.cached_query_service
+        'query-cache': True,
+        'query-cache-ttl': 7,           # days positive results are kept
+        'query-cache-negative-ttl': 1,  # days negative results are kept
+        'query-cache-settled-days': 30, # see Asset.query_cache_ttl
+    }
+
     @classmethod
     def in_stage(cls, basename):
         """Tests for the existence of the file in this driver's stage dir."""
@@ -307,8 +378,9 @@ class Repository(object):
         """Get given setting from settings.REPOS[driver].
 
         If the key isn't found, it attempts to load a default from
-        cls.default_settings, a dict of such things.  If still not found,
-        resorts to magic for 'driver' and 'tiles', ValueError otherwise.
+        cls.default_settings, a dict of such things, then from
+        cls.common_default_settings.  If still not found, resorts to
+        magic for 'driver' and 'tiles', ValueError otherwise.
         """
         dataclass = cls.__name__[:-10] # name of a class, not the class object
         r = settings().REPOS[dataclass]
@@ -316,6 +388,8 @@ class Repository(object):
             return cls.validate_setting(key, r[key])
         if key in cls.default_settings:
             return cls.default_settings[key]
+        if key in cls.common_default_settings:
+            return cls.common_default_settings[key]
 
         # not in settings file nor default, so resort to magic
         exec('import gips.data.%s as clsname' % dataclass)
@@ -328,14 +402,16 @@ class Repository(object):
                          " {} driver".format(key, cls.name))
 
     @classmethod
-    def managed_request(cls, url, verbosity=1, debuglevel=0):
+    def managed_request(cls, url, verbosity=1, debuglevel=0, raise_errors=False):
         """Visit the given http URL and return the response.
 
         Uses auth settings and cls._manager_url, and also follows custom
         weird redirects (specific to Earthdata servers seemingly).
         Returns urllib2.urlopen(...), or None if errors are encountered.
-        debuglevel is ultimately passed in to httplib; if >0, http info,
-        such as headers, will be printed on standard out.
+        If raise_errors is set, only a 404 returns None; other errors
+        raise IOError, so callers can tell a missing page from a failed
+        request.  debuglevel is ultimately passed in to httplib; if >0,
+        http info, such as headers, will be printed on standard out.
         """
         username = cls.get_setting('username')
         password = cls.get_setting('password')
@@ -361,13 +437,17 @@ class Repository(object):
                 request = urllib2.Request(redirect_url)
                 response = urllib2.urlopen(request)
             return response
-        except urllib2.URLError as e:
-            utils.verbose_out('{} gave bad response: {}'.format(url, e.reason),
+        except urllib2.HTTPError as e: # a subclass of URLError, so goes first
+            utils.verbose_out('{} gave bad response: {} {}'.format(url, e.code, e.reason),
                               verbosity, sys.stderr)
+            if raise_errors and e.code != 404:
+                raise IOError('{} gave bad response: {} {}'.format(url, e.code, e.reason))
             return None
-        except urllib2.HTTPError as e:
-            utils.verbose_out('{} gave bad response: {} {}'.format(url, e.code, e.reason),
+        except urllib2.URLError as e:
+            utils.verbose_out('{} gave bad response: {}'.format(url, e.reason),
                               verbosity, sys.stderr)
+            if raise_errors:
+                raise IOError('{} gave bad response: {}'.format(url, e.reason))
             return None
 
     @classmethod
@@ -376,52 +456,25 @@ class Repository(object):
         return os.path.join(cls.get_setting('repository'), subdir)
 
 
+    @classmethod
+    def tile_index(cls):
+        """ Spatial index of the driver's tiles vector (see gips.data.tile_index) """
+        return tile_index.get(cls.__name__[:-10], cls.get_setting('tiles'), cls.feature2tile)
+
     @classmethod
     def vector2tiles(cls, vector, pcov=0.0, ptile=0.0, tilelist=None):
         """ Return matching tiles and coverage % for provided vector """
-        from osgeo import ogr, osr
+        return cls.vector2tiles_many([vector], pcov, ptile, tilelist)[0]
 
-        # open tiles vector
-        v = open_vector(cls.get_setting('tiles'))
-        shp = ogr.Open(v.Filename())
-        if v.LayerName() == '':
-            layer = shp.GetLayer(0)
-        else:
-            layer = shp.GetLayer(v.LayerName())
-
-        # create and warp site geometry
-        ogrgeom = ogr.CreateGeometryFromWkt(vector.WKT())
-        srs = osr.SpatialReference(vector.Projection())
-        trans = osr.CoordinateTransformation(srs, layer.GetSpatialRef())
-        ogrgeom.Transform(trans)
-        # convert to shapely
-        geom = loads(ogrgeom.ExportToWkt())
-        geom = geom if geom.is_valid else geom.buffer(0)  # bugfix: attempt to fix topology errors
-
-        # find overlapping tiles
-        tiles = {}
-        layer.SetSpatialFilter(ogrgeom)
-        layer.ResetReading()
-        feat = layer.GetNextFeature()
-        while feat is not None:
-            tgeom = loads(feat.GetGeometryRef().ExportToWkt())
-            if tgeom.intersects(geom):
-                area = geom.intersection(tgeom).area
-                if area != 0:
-                    tile = cls.feature2tile(feat)
-                    tiles[tile] = (area / geom.area, area / tgeom.area)
-            feat = layer.GetNextFeature()
-
-        # remove any tiles not in tilelist or that do not meet thresholds for % cover
-        remove_tiles = []
-        if tilelist is None:
-            tilelist = tiles.keys()
-        for t in tiles:
-            if (tiles[t][0] < (pcov / 100.0)) or (tiles[t][1] < (ptile / 100.0)) or t not in tilelist:
-                remove_tiles.append(t)
-        for t in remove_tiles:
-            tiles.pop(t, None)
-        return tiles
+    @classmethod
+    def vector2tiles_many(cls, vectors, pcov=0.0, ptile=0.0, tilelist=None):
+        """ vector2tiles of each of vectors, in order, from one tile index """
+        if cls.vector2tiles.__func__ is not Repository.vector2tiles.__func__:
+            # the driver finds tiles its own way, so it can't use the index
+            return [cls.vector2tiles(v, pcov, ptile, tilelist) for v in vectors]
+        index = cls.tile_index()
+        return [index.coverage(index.warp(v.WKT(), v.Projection()), pcov, ptile, tilelist)
+                for v in vectors]
 
 
 class Asset(object):
@@ -590,6 +643,67 @@ class Asset(object):
                 return datafiles
             return [self.filename]
 
+    def read_sidecar(self):
+        """Return the dict of scalar metadata stored beside the asset file.
+
+        The sidecar is a small JSON file named after the asset, in the
+        same way as the '.index' file written by datafiles().  Returns
+        an empty dict if there is no sidecar or it can't be read.
+        """
+        sidecar = self.filename + '.meta'
+        if not os.path.exists(sidecar):
+            return {}
+        try:
+            with open(sidecar) as fp:
+                md = json.load(fp)
+        except (IOError, ValueError) as e:
+            utils.verbose_out('Ignoring unreadable metadata sidecar {}: {}'
+                              .format(sidecar, e), 2)
+            return {}
+        return md if isinstance(md, dict) else {}
+
+    def write_sidecar(self, md):
+        """Merge the given dict into the asset's metadata sidecar.
+
+        The file is replaced atomically so concurrent readers never see
+        a partial sidecar.
+        """
+        sidecar = self.filename + '.meta'
+        merged = self.read_sidecar()
+        merged.update(md)
+        tmp_fn = '{}.{}.tmp'.format(sidecar, os.getpid())
+        with open(tmp_fn, 'w') as fp:
+            json.dump(merged, fp)
+        os.rename(tmp_fn, sidecar)
+        return merged
+
+    def persistent_meta(self):
+        """Return scalar metadata to persist in the sidecar at archive time.
+
+        Drivers override this (see CloudCoverAsset); the default is to
+        persist nothing.
+        """
+        return {}
+
+    def cached_meta(self, key, compute):
+        """Return metadata value `key`, consulting the sidecar first.
+
+        On a miss, `compute()` is called and its result is written to the
+        sidecar, so later runs needn't open the asset at all.
+        """
+        md = self.read_sidecar()
+        meta = getattr(self, 'meta', None)
+        if key in md:
+            if isinstance(meta, dict):
+                meta.update(md)
+            return md[key]
+        value = compute()
+        try:
+            self.write_sidecar({key: value})
+        except (IOError, OSError) as e:
+            utils.verbose_out('Unable to write metadata sidecar for {}: {}'
+                              .format(self.filename, e), 2)
+        return value
 
     def extract(self, filenames=tuple(), path=None):
         """Extract given files from asset (if it's a tar or zip).
@@ -669,7 +783,16 @@ class Asset(object):
         asset:  Asset type string, eg for modis could be 'MCD43A2'
         """
         a_types = cls._assets.keys() if asset is None else [asset]
-        found = [cls.discover_asset(a, tile, date) for a in a_types]
+        if orm.use_orm():
+            found = [cls.discover_asset(a, tile, date) for a in a_types]
+        else:
+            # filesystem inventory:  match every asset type in one pass
+            try:
+                matches = cls.match_asset_files(
+                    cls.Repository.data_path(tile, date), a_types)
+            except OSError: # no such directory, so no assets
+                return []
+            found = [cls._asset_from_files(matches[a]) for a in a_types]
         return [a for a in found if a is not None] # lastly filter Nones
 
     @classmethod
@@ -686,9 +809,15 @@ class Asset(object):
 
         # The rest of this fn uses the filesystem inventory
         d_path = cls.Repository.data_path(tile, date)
-        if not os.path.isdir(d_path):
+        try:
+            files = cls.match_asset_files(d_path, [asset_type])[asset_type]
+        except OSError: # no such directory, so no asset
             return None
-        files = utils.find_files(cls._assets[asset_type]['pattern'], d_path)
+        return cls._asset_from_files(files)
+
+    @classmethod
+    def _asset_from_files(cls, files):
+        """Return an object for the one asset file given, else None."""
         # Confirm only one asset
         if len(files) > 1:
             raise IOError("Duplicate(?) assets found: {}".format(files))
@@ -696,6 +825,32 @@ class Asset(object):
             return cls(files[0])
         return None
 
+    @classmethod
+    @lru_cache(maxsize=None)
+    def asset_regexes(cls):
+        """Return the driver's asset patterns, compiled, by asset type."""
+        return {a: re.compile(av['pattern']) for a, av in cls._assets.items()}
+
+    @classmethod
+    def match_asset_files(cls, path, a_types=None, filenames=None):
+        """Match the files in the directory against asset patterns.
+
+        All the given asset types (default all of them) are matched in a
+        single pass over the directory listing, which is shared with other
+        callers (see utils.list_files); pass `filenames` to match a listing
+        already in hand instead.  Returns {asset type: [full paths]}.
+        """
+        regexes = cls.asset_regexes()
+        a_types = regexes.keys() if a_types is None else a_types
+        if filenames is None:
+            filenames = utils.list_files(path)
+        matches = {a: [] for a in a_types}
+        for f in filenames:
+            for a in a_types:
+                if regexes[a].match(f):
+                    matches[a].append(os.path.join(path, f))
+        return matches
+
 
     @classmethod
     def start_date(cls, asset):
@@ -779,7 +934,15 @@ class Asset(object):
         anything is available for fetching. Must return a dict containing an
         available asset filename.  The dict is passed to the driver's
         Asset.fetch method so additional data can be passed along in other
-        keys. When nothing is available, must return None.
+        keys. When nothing is available, must return None; when the query
+        itself fails, raise instead, so the failure isn't cached as a
+        negative result (see cached_query_service).  A listing that doesn't
+        exist (eg a 404 for a date directory, see managed_request's
+        raise_errors) means nothing is available, not a failure.
+
+        Where the provider allows it, drivers should answer from a cached
+        listing of a whole range (eg a tile-year, see gs_list_prefixes and
+        s3_prefix_search) rather than making a remote query per date.
         """
         if not cls.available(asset, date):
             return None
@@ -791,6 +954,63 @@ class Asset(object):
             return None
         return {'basename': bn, 'url': url}
 
+    # fetch_kwargs that affect query_service's results, and so are part of
+    # the query cache key; see cached_query_service
+    _query_cache_kwargs = ()
+
+    @classmethod
+    def query_cache_path(cls):
+        """Full path to the driver's persistent query cache."""
+        return cls.Repository.path('query-cache.sqlite3')
+
+    @classmethod
+    def query_cache_ttl(cls, asset, date, result):
+        """Seconds a query result stays in the cache; None means forever.
+
+        Dates at least 'query-cache-settled-days' older than the asset's
+        end date (see end_date, which accounts for latency) are assumed to
+        be settled in the provider's catalog, so their results never
+        expire.  Otherwise positive and negative results have separate
+        TTLs, given in days by driver settings.
+        """
+        d = date.date() if type(date) is datetime else date
+        settled_days = cls.get_setting('query-cache-settled-days')
+        if d <= cls.end_date(asset) - timedelta(settled_days):
+            return None
+        ttl_key = ('query-cache-ttl' if result is not None
+                   else 'query-cache-negative-ttl')
+        return cls.get_setting(ttl_key) * 24 * 60 * 60
+
+    @classmethod
+    def cached_query_service(cls, asset, tile, date, refresh=False, **fetch_kwargs):
+        """As query_service, but consult the persistent query cache first.
+
+        Unlike query_service's lru_cache, the cache persists across runs
+        (see gips.data.query_cache); gips_query_cache can inspect and
+        purge it.  Results are cached negative or positive alike, but
+        failed queries raise (see query_service), so nothing is cached
+        for them and the next call queries again.  If refresh is set, the
+        service is queried regardless, and the cache updated with its
+        answer.
+        """
+        if (not cls.available(asset, date)
+                or not cls.get_setting('query-cache')):
+            return cls.query_service(asset, tile, date, **fetch_kwargs)
+        driver = cls.Repository.name.lower()
+        key_kwargs = {k: fetch_kwargs[k] for k in cls._query_cache_kwargs
+                      if k in fetch_kwargs}
+        path = cls.query_cache_path()
+        hit, result = (False, None) if refresh else query_cache.lookup(
+            path, driver, asset, tile, date, key_kwargs)
+        if hit:
+            utils.verbose_out('query cache hit for ATD {} {} {}'.format(
+                asset, tile, date), 5)
+            return result
+        result = cls.query_service(asset, tile, date, **fetch_kwargs)
+        query_cache.store(path, driver, asset, tile, date, key_kwargs, result,
+                          cls.query_cache_ttl(asset, date, result))
+        return result
+
     @classmethod
     def download(cls, url, download_fp, **kwargs):
         """Override this method to provide custom download code.
@@ -820,7 +1040,7 @@ class Asset(object):
         are archived directly.  Once issue 365 is fixed it should be
         removed.
         """
-        qs_rv = cls.query_service(a_type, tile, date, **fetch_kwargs)
+        qs_rv = cls.cached_query_service(a_type, tile, date, **fetch_kwargs)
         if qs_rv is None:
             return []
         if cls.Repository.in_stage(qs_rv['basename']): # skip if there already
@@ -831,7 +1051,8 @@ class Asset(object):
             fetch_kwargs.update(**qs_rv)
             if cls.download(**fetch_kwargs):
                 if archive:
-                    ao, _, _ = cls._archivefile(qs_rv['download_fp'], update)
+                    with _archive_lock:
+                        ao, _, _ = cls._archivefile(qs_rv['download_fp'], update)
                     return [ao]
                 cls.stage_asset(qs_rv['download_fp'])
         return []
@@ -873,13 +1094,14 @@ class Asset(object):
             fnames.append(path)
         elif recursive:
             for root, subdirs, files in os.walk(path):
-                for a in cls._assets.values():
-                    files = utils.find_files(a['pattern'], root)
-                    fnames.extend(files)
+                files = [f for f in files
+                         if os.path.isfile(os.path.join(root, f))]
+                for matched in cls.match_asset_files(
+                        root, filenames=files).values():
+                    fnames.extend(matched)
         else:
-            for a in cls._assets.values():
-                files = utils.find_files(a['pattern'], path)
-                fnames.extend(files)
+            for matched in cls.match_asset_files(path).values():
+                fnames.extend(matched)
         numlinks = 0
         numfiles = 0
         assets = []
@@ -894,7 +1116,7 @@ class Asset(object):
             if link_count >= 0:
                 if not keep:
                     # user wants to remove the original hardlink to the file
-                    RemoveFiles([f], ['.index', '.aux.xml'])
+                    RemoveFiles([f], ['.index', '.meta', '.aux.xml'])
             if link_count > 0:
                 numfiles = numfiles + 1
                 numlinks = numlinks + link_count
@@ -970,7 +1192,7 @@ class Asset(object):
                         VerboseOut('\t%s' % os.path.basename(ef.filename), 1)
                         errmsg = 'Unable to remove existing version: ' + ef.filename
                         with utils.error_handler(errmsg):
-                            RemoveFiles([ef.filename], ['.index', '.aux.xml'])
+                            RemoveFiles([ef.filename], ['.index', '.meta', '.aux.xml'])
                     with utils.error_handler('Problem adding {} to archive'.format(filename)):
                         os.link(os.path.abspath(filename), newfilename)
                         asset.archived_filename = newfilename
@@ -998,6 +1220,20 @@ class Asset(object):
             new_asset_obj.archived_filename = asset.archived_filename
             asset = new_asset_obj
 
+        # persist scalar metadata now, while the asset is fresh, so later
+        # filtering needn't reopen it; failure isn't an archiving error since
+        # cached_meta() will fill in the sidecar on demand
+        if numlinks > 0:
+            try:
+                archived_ao = (asset if asset.filename == asset.archived_filename
+                               else cls(asset.archived_filename))
+                md = archived_ao.persistent_meta()
+                if md:
+                    archived_ao.write_sidecar(md)
+            except Exception as e:
+                VerboseOut('Unable to record metadata for {}: {}'.format(
+                    asset.archived_filename, e), 2)
+
         if otherversions and numlinks == 0:
             return (asset, -1, overwritten_ao)
         else:
@@ -1207,9 +1443,15 @@ class Data(object):
         These must match the shell glob in self._pattern, and must not
         be assets, index files, nor xml files.
         """
-        filenames = glob.glob(os.path.join(self.path, self._pattern))
+        try:
+            # like glob, skip hidden files
+            filenames = [os.path.join(self.path, f) for f in
+                         fnmatch.filter(utils.list_files(self.path), self._pattern)
+                         if not f.startswith('.')]
+        except OSError: # no such directory
+            filenames = []
         assetnames = [a.filename for a in self.assets.values()]
-        badexts = ['.index', '.xml']
+        badexts = ['.index', '.meta', '.xml']
         test = lambda x: x not in assetnames and os.path.splitext(f)[1] not in badexts
         filenames[:] = [f for f in filenames if test(f)]
         return filenames
@@ -1525,7 +1767,9 @@ class Data(object):
         # so the decision is easy
         if local_ao is not None and not update:
             return False
-        qs_rv = cls.Asset.query_service(a_type, tile, date, **fetch_kwargs)
+        # updating means checking for reprocessed assets, so don't trust the cache
+        qs_rv = cls.Asset.cached_query_service(
+            a_type, tile, date, refresh=update, **fetch_kwargs)
         if qs_rv is None: # nothing remote; done
             return False
         # if we don't have it already, or if `update` flag
@@ -1535,8 +1779,13 @@ class Data(object):
     need_fetch_kwargs = False # feature toggle:  set in driver's subclass
 
     @classmethod
-    def fetch(cls, products, tiles, textent, update=False, **kwargs):
-        """ Download data for tiles and add to archive. update forces fetch """
+    def fetch(cls, products, tiles, textent, update=False,
+              fetch_workers=None, **kwargs):
+        """Download data for tiles and add to archive. update forces fetch
+
+        If fetch_workers (default is the driver's 'fetch-workers' setting)
+        is more than 1, see _fetch_concurrently.
+        """
         fetched = []
         fetch_kwargs = kwargs if cls.need_fetch_kwargs else {}
         atd_pile = ((a, t, d)
@@ -1544,6 +1793,11 @@ class Data(object):
             for t in tiles
             for d in cls.Asset.dates(
                 a, t, textent.datebounds, textent.daybounds))
+        if fetch_workers is None:
+            fetch_workers = cls.Asset.get_setting('fetch-workers')
+        if fetch_workers > 1:
+            return cls._fetch_concurrently(
+                atd_pile, update, fetch_workers, **fetch_kwargs)
         for a, t, d in atd_pile:
             err_msg = 'Problem fetching asset for {}, {}, {}'.format(
                 a, t, d.strftime("%y-%m-%d"))
@@ -1562,6 +1816,78 @@ class Data(object):
                         cls.Asset.Repository.path('stage'), update=update)
         return fetched
 
+    @classmethod
+    def _fetch_concurrently(cls, atd_pile, update, workers, **fetch_kwargs):
+        """Fetch the given (asset, tile, date)s using a pool of threads.
+
+        Downloads run concurrently, at most `workers` at once and at most
+        the driver's 'fetch-host-limits' setting from any one host, or
+        'fetch-host-default-limit' for hosts it doesn't list.  As in
+        serial fetching, drivers that archive inline do so as each download
+        finishes, one asset at a time (see _archive_lock).  Other drivers'
+        downloads land in the stage, which may be written to by every
+        thread, so it's archived once all of them are done.
+        """
+        throttle = _HostThrottle(
+            cls.Asset.get_setting('fetch-host-limits'),
+            cls.Asset.get_setting('fetch-host-default-limit'))
+        inline = getattr(cls, 'inline_archive', False)
+        pool = ThreadPool(workers)
+        try:
+            jobs = [((a, t, d), update, inline, throttle, fetch_kwargs)
+                    for (a, t, d) in atd_pile]
+            results = pool.imap_unordered(cls._fetch_one, jobs)
+            fetched = []
+            staged = False
+            for (a, t, d), downloaded, exc_info in results:
+                err_msg = 'Problem fetching asset for {}, {}, {}'.format(
+                    a, t, d.strftime("%y-%m-%d"))
+                with utils.error_handler(err_msg, continuable=True):
+                    if exc_info is not None:
+                        # re-raise with the worker's traceback intact
+                        raise exc_info[0], exc_info[1], exc_info[2]
+                    if inline:
+                        fetched += downloaded
+                    else:
+                        staged = staged or downloaded
+        finally:
+            pool.close()
+            pool.join()
+        if staged:
+            with utils.error_handler('Problem archiving fetched assets',
+                                     continuable=True):
+                fetched += cls.archive_assets(
+                    cls.Asset.Repository.path('stage'), update=update)
+        return fetched
+
+    @classmethod
+    def _fetch_one(cls, job):
+        """Download one (asset, tile, date); run in a thread.
+
+        If inline, the download is archived, and the archived assets are
+        returned, else it goes to the stage.  Returns ((asset, tile, date),
+        archived assets if inline else whether anything was downloaded,
+        sys.exc_info() or None).
+        """
+        (a, t, d), update, inline, throttle, fetch_kwargs = job
+        try:
+            if not cls.need_to_fetch(a, t, d, update, **fetch_kwargs):
+                return (a, t, d), [] if inline else False, None
+            # need the URL's host for throttling; need_to_fetch just cached
+            # the query's result, so this doesn't cost another request
+            qs_rv = cls.Asset.cached_query_service(
+                a, t, d, **fetch_kwargs) or {}
+            with throttle.slot(qs_rv.get('url')):
+                if inline:
+                    return (a, t, d), cls.Asset.fetch(
+                        a, t, d, update, archive=True, **fetch_kwargs), None
+                cls.Asset.fetch(a, t, d, **fetch_kwargs)
+            return (a, t, d), True, None
+        # queries' non-continuable error handlers raise SystemExit from the
+        # command line; it would kill the thread & leave the pool waiting
+        except BaseException:
+            return (a, t, d), False, sys.exc_info()
+
     @classmethod
     def product_groups(cls):
         """ Return dict of groups and products in each one """
@@ -1709,12 +2035,25 @@ class CloudCoverAsset(Asset):
 
     Together with CloudCoverData, lets Assets and Data objects work
     together to filter by cloud cover. It needs Asset.cloud_cover() to
-    be implemented.
+    be implemented.  Cloud cover is persisted in the asset's metadata
+    sidecar so filtering doesn't have to reopen the asset each time.
     """
+    _query_cache_kwargs = ('pclouds',)
+
+    def persistent_meta(self):
+        """Persist cloud cover at archive time.
+
+        cloud_cover() may extract metadata from the asset or query the
+        provider (eg USGS or SciHub) if it isn't already known, slowing
+        archiving; if it fails, the failure is only reported (see
+        _archivefile) and the sidecar is filled in by the first filter.
+        """
+        return {'cloud-cover': self.cloud_cover()}
+
     def filter(self, pclouds=100.0, **kwargs):
         if pclouds >= 100.0:
             return True
-        cc = self.cloud_cover()
+        cc = self.cached_meta('cloud-cover', self.cloud_cover)
         asset_passes_filter = cc <= pclouds
         msg = ('Asset cloud cover is {}%, meets pclouds threshold of {}%'
                if asset_passes_filter else
@@ -193,15 +193,18 @@ class hlsAsset(gips.data.core.CloudCoverAsset,
         basename = 'HLS.{}.T{}.{}.v{}.hdf'.format(
             asset, tile, date.strftime('%Y%j'), _hls_version)
 
-        x30_key = '{base}/{asset}/{year}/{tile1}/{tile2}/{tile3}/{tile4}/'\
-                  'HLS.{asset}.T{tile}.{datestr}.v{version}.hdf'\
-                  .format(base=cls._s3_base_key, asset=asset, year=date.year,
-                          tile1=tile[0:2], tile2=tile[2], tile3=tile[3], tile4=tile[4],
-                          tile=tile, datestr=date.strftime('%Y%j'),
+        # list the whole tile-year once; s3_prefix_search caches it
+        year_prefix = '{base}/{asset}/{year}/{tile1}/{tile2}/{tile3}/{tile4}/'\
+                      .format(base=cls._s3_base_key, asset=asset, year=date.year,
+                              tile1=tile[0:2], tile2=tile[2], tile3=tile[3], tile4=tile[4])
+        x30_key = year_prefix + 'HLS.{asset}.T{tile}.{datestr}.v{version}.hdf'\
+                  .format(asset=asset, tile=tile, datestr=date.strftime('%Y%j'),
                           version='1.4')
 
         creds = cls.get_creds()
-        x30keys = cls.s3_prefix_search(x30_key, creds=creds, requester_pays=True)
+        x30keys = [k for k in cls.s3_prefix_search(
+                        year_prefix, creds=creds, requester_pays=True)
+                   if k.startswith(x30_key)]
 
         if len(x30keys) > 0:
             key = [k for k in x30keys if '.hdf' in k][0]
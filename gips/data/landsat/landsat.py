@@ -515,7 +515,10 @@ class landsatAsset(gips.data.core.CloudCoverAsset,
             # find best correction level in desc order of preference
             for cl in ('L1TP', 'L1GT', 'L1GS'):
                 search_prefix = p_template.format(c, c, cl)
-                full_prefixes = cls.gs_api_search(search_prefix).get('prefixes', [])
+                # list the whole tile-year once; gs_list_prefixes caches it
+                full_prefixes = [p for p in cls.gs_list_prefixes(
+                                    search_prefix[:-len('MMDD_')])
+                                 if p.startswith(search_prefix)]
                 for t in ('T1', 'T2', 'RT'):  # get best C1 tier available
                     for p in full_prefixes:
                         if p.endswith(t + '/'):
@@ -195,7 +195,10 @@ class merraAsset(Asset):
         cpattern = re.compile(pattern)
         with utils.error_handler("Error downloading"):
             # obtain the list of files
-            response = cls.Repository.managed_request(mainurl, verbosity=2)
+            # failures raise, so aren't cached as negative results; see
+            # cached_query_service.  A 404 just means nothing is there yet.
+            response = cls.Repository.managed_request(
+                mainurl, verbosity=2, raise_errors=True)
             if response is None:
                 return None, None
         for item in response.readlines():
@@ -207,6 +207,21 @@ class modisAsset(Asset, gips.data.core.S3Mixin):
         file_version = int(parts[4]) # datetimestamp near end of the filename
         self._version = float('{}.{}'.format(collection, file_version))
 
+    @classmethod
+    @lru_cache(maxsize=100) # cache size chosen arbitrarily
+    def earthdata_listing(cls, url):
+        """Return the lines of the directory index page at the given URL.
+
+        Each date directory holds every tile's assets, so caching the index
+        lets one request answer the queries for all tiles on that date.
+        A missing directory (eg for a day with no 8-day composite) gives an
+        empty listing; other failures raise IOError, so they aren't cached.
+        """
+        response = cls.Repository.managed_request(url, verbosity=2, raise_errors=True)
+        if response is None:
+            return ()
+        return tuple(response.readlines())
+
     @classmethod
     def query_earthdata(cls, asset, tile, date):
         """Find out from the modis servers what assets are available.
@@ -232,11 +247,11 @@ class modisAsset(Asset, gips.data.core.S3Mixin):
         else:
             err_msg = "Error downloading: " + mainurl
         with utils.error_handler(err_msg):
-            response = cls.Repository.managed_request(mainurl, verbosity=2)
-            if response is None:
-                return None
+            # a failed listing raises, so it isn't taken (& cached) as no asset;
+            # a missing one is empty
+            listing = cls.earthdata_listing(mainurl)
 
-        for item in response.readlines():
+        for item in listing:
             # screen-scrape the content of the page and extract the full name of the needed file
             # (this step is needed because part of the filename, the creation timestamp, is
             # effectively random).
@@ -266,8 +281,11 @@ class modisAsset(Asset, gips.data.core.S3Mixin):
     def query_s3(cls, tile, date):
         """Look in S3 for modis asset components and assemble links to same."""
         h, v = cls.parse_tile(tile)
+        # list the whole tile-year once; s3_prefix_search caches it
+        year_prefix = 'MCD43A4.006/{}/{}/{}'.format(h, v, date.year)
         prefix = 'MCD43A4.006/{}/{}/{}/'.format(h, v, date.strftime('%Y%j'))
-        keys = cls.s3_prefix_search(prefix)
+        keys = [k for k in cls.s3_prefix_search(year_prefix)
+                if k.startswith(prefix)]
         tifs = []
         qa_tifs = []
         json_md = None
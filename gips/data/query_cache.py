@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+################################################################################
+#    GIPS: Geospatial Image Processing System
+#
+#    Copyright (C) 2014-2018 Applied Geosolutions
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>
+################################################################################
+
+"""Persistent cache of Asset.query_service results.
+
+Each driver keeps its cache in an SQLite file in its repository (see
+Asset.cached_query_service).  Entries are keyed on (driver, asset, tile,
+date, relevant fetch kwargs), and hold the JSON-encoded result, which is
+null for negative results.  An entry whose expiry is NULL never expires.
+The functions here treat database errors as cache misses, so a broken or
+read-only cache never stops a fetch.
+"""
+
+import json
+import sqlite3
+import time
+
+from gips import utils
+
+
+_schema = """CREATE TABLE IF NOT EXISTS query_cache (
+    driver  TEXT NOT NULL,
+    asset   TEXT NOT NULL,
+    tile    TEXT NOT NULL,
+    date    TEXT NOT NULL,
+    kwargs  TEXT NOT NULL,
+    result  TEXT,
+    stored  REAL NOT NULL,
+    expires REAL,
+    PRIMARY KEY (driver, asset, tile, date, kwargs)
+)"""
+
+_columns = ('driver', 'asset', 'tile', 'date', 'kwargs',
+            'result', 'stored', 'expires')
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute(_schema)
+    return conn
+
+
+def _key(driver, asset, tile, date, kwargs):
+    return (driver, asset, tile, date.strftime('%Y-%m-%d'),
+            json.dumps(kwargs, sort_keys=True))
+
+
+def _str_ify(o):
+    """json returns unicode, which gippy & friends dislike; convert to str."""
+    if isinstance(o, dict):
+        return {_str_ify(k): _str_ify(v) for k, v in o.items()}
+    if isinstance(o, list):
+        return [_str_ify(i) for i in o]
+    if isinstance(o, unicode):
+        return o.encode('utf-8')
+    return o
+
+
+def lookup(path, driver, asset, tile, date, kwargs):
+    """Return (True, result) for an unexpired entry, else (False, None)."""
+    try:
+        conn = _connect(path)
+        try:
+            row = conn.execute(
+                'SELECT result, expires FROM query_cache WHERE driver=?'
+                ' AND asset=? AND tile=? AND date=? AND kwargs=?',
+                _key(driver, asset, tile, date, kwargs)).fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        utils.verbose_out('Query cache {} unusable: {}'.format(path, e), 4)
+        return False, None
+    if row is None or (row[1] is not None and row[1] < time.time()):
+        return False, None
+    return True, _str_ify(json.loads(row[0]))
+
+
+def store(path, driver, asset, tile, date, kwargs, result, ttl):
+    """Save the result; it expires in ttl seconds, or never if ttl is None."""
+    try:
+        encoded = json.dumps(result)
+    except (TypeError, ValueError) as e:
+        utils.verbose_out('Not caching unserializable query result for'
+                          ' {} {} {}: {}'.format(asset, tile, date, e), 4)
+        return
+    now = time.time()
+    expires = None if ttl is None else now + ttl
+    try:
+        conn = _connect(path)
+        try:
+            with conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO query_cache VALUES'
+                    ' (?, ?, ?, ?, ?, ?, ?, ?)',
+                    _key(driver, asset, tile, date, kwargs)
+                    + (encoded, now, expires))
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        utils.verbose_out('Query cache {} unusable: {}'.format(path, e), 4)
+
+
+def _where(asset=None, tile=None, negative=False, expired=False):
+    """Build a WHERE clause & its parameters from the given filters."""
+    clauses, params = [], []
+    if asset is not None:
+        clauses.append('asset=?')
+        params.append(asset)
+    if tile is not None:
+        clauses.append('tile=?')
+        params.append(tile)
+    if negative:
+        clauses.append("result='null'")
+    if expired:
+        clauses.append('expires IS NOT NULL AND expires < ?')
+        params.append(time.time())
+    return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+
+def entries(path, **filters):
+    """Return a list of dicts, one per cache entry matching the filters.
+
+    Filters are asset, tile, negative, and expired; see _where.
+    """
+    where, params = _where(**filters)
+    conn = _connect(path)
+    try:
+        rows = conn.execute('SELECT * FROM query_cache' + where
+                            + ' ORDER BY asset, tile, date', params).fetchall()
+    finally:
+        conn.close()
+    return [dict(zip(_columns, r)) for r in rows]
+
+
+def purge(path, **filters):
+    """Delete cache entries matching the filters; returns the count."""
+    where, params = _where(**filters)
+    conn = _connect(path)
+    try:
+        with conn:
+            count = conn.execute(
+                'DELETE FROM query_cache' + where, params).rowcount
+    finally:
+        conn.close()
+    return count
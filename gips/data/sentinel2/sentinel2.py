@@ -413,9 +413,11 @@ class sentinel2Asset(gips.data.core.CloudCoverAsset,
         prefix_template = tile_prefix + '{}_MSIL1C_' + date.strftime('%Y%m%d')
         for sensor in cls._sensors.keys():
             search_prefix = prefix_template.format(sensor)
+            # list the whole tile-year once; gs_list_prefixes caches it
+            year_prefix = search_prefix[:-len('MMDD')]
             # only going to be one prefix, if any are found
-            prefix = cls.gs_api_search(search_prefix).get(
-                'prefixes', [None])[0]
+            prefix = next((p for p in cls.gs_list_prefixes(year_prefix)
+                           if p.startswith(search_prefix)), None)
             if prefix is not None:
                 break
         if prefix is None:
@@ -564,7 +566,7 @@ class sentinel2Asset(gips.data.core.CloudCoverAsset,
                 assets += orig_aol
                 overwritten_assets += orig_overwritten_aol
             if not keep:
-                utils.RemoveFiles([fn], ['.index', '.aux.xml'])
+                utils.RemoveFiles([fn], ['.index', '.meta', '.aux.xml'])
 
         return assets, overwritten_assets
 
@@ -80,7 +80,10 @@ class smapAsset(Asset):
         cpattern = re.compile(pattern)
         err_msg = "Error downloading: " + mainurl
         with utils.error_handler(err_msg):
-            response = cls.Repository.managed_request(mainurl, verbosity=2)
+            # failures raise, so aren't cached as negative results; see
+            # cached_query_service.  A 404 just means nothing is there yet.
+            response = cls.Repository.managed_request(
+                mainurl, verbosity=2, raise_errors=True)
             if response is None:
                 return None, None
 
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+################################################################################
+#    GIPS: Geospatial Image Processing System
+#
+#    Copyright (C) 2014-2018 Applied Geosolutions
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>
+################################################################################
+
+"""Spatial index of a driver's tiles vector, for Repository.vector2tiles.
+
+The tiles vector is read once per process into a TileIndex, which holds
+each tile's designation and shapely geometry in an STRtree.  When the tiles
+vector is a file, the index is also saved beside it, as
+'<tiles>.<driver>.tileindex', and reused by later processes until the file
+changes.  Failing to read or write that file only means the index is built
+from the vector again, so a read-only driver directory is fine.
+"""
+
+import os
+import pickle
+
+from osgeo import ogr, osr
+from shapely import wkb
+from shapely.wkt import loads
+from shapely.strtree import STRtree
+from shapely.geometry.base import BaseGeometry
+
+from gips import utils
+
+_version = 1
+_indexes = {} # {(driver, tiles): TileIndex}; see get
+
+
+class TileIndex(object):
+    """ Tile designations & geometries of a tiles vector, with an STRtree """
+
+    def __init__(self, tiles, geoms, projection):
+        self.tiles = tiles
+        self.geoms = geoms
+        self.projection = projection
+        self.tree = STRtree(geoms) if geoms else None
+        self._position = {id(g): i for i, g in enumerate(geoms)}
+        self._transforms = {}
+
+    def warp(self, wkt, projection):
+        """ shapely geometry of wkt (in projection) in the tiles' projection """
+        if projection not in self._transforms:
+            self._transforms[projection] = osr.CoordinateTransformation(
+                osr.SpatialReference(projection), osr.SpatialReference(self.projection))
+        ogrgeom = ogr.CreateGeometryFromWkt(wkt)
+        ogrgeom.Transform(self._transforms[projection])
+        geom = loads(ogrgeom.ExportToWkt())
+        return geom if geom.is_valid else geom.buffer(0)  # bugfix: attempt to fix topology errors
+
+    def candidates(self, geom):
+        """ Positions, in order, of the tiles whose envelopes intersect geom's """
+        if self.tree is None:
+            return []
+        # shapely < 2 returns the geometries themselves, later versions their positions
+        return sorted(self._position[id(h)] if isinstance(h, BaseGeometry) else int(h)
+                      for h in self.tree.query(geom))
+
+    def coverage(self, geom, pcov=0.0, ptile=0.0, tilelist=None):
+        """ {tile: (fraction of geom covered, fraction of tile covered)}, as for vector2tiles """
+        tiles = {}
+        for i in self.candidates(geom):
+            tgeom = self.geoms[i]
+            if tgeom.intersects(geom):
+                area = geom.intersection(tgeom).area
+                if area != 0:
+                    tiles[self.tiles[i]] = (area / geom.area, area / tgeom.area)
+        # remove any tiles not in tilelist or that do not meet thresholds for % cover
+        if tilelist is None:
+            tilelist = tiles.keys()
+        return {t: c for t, c in tiles.items()
+                if c[0] >= pcov / 100.0 and c[1] >= ptile / 100.0 and t in tilelist}
+
+
+def build(tiles, feature2tile):
+    """ Read a TileIndex from the tiles vector (file or db, as for open_vector) """
+    v = utils.open_vector(tiles)
+    shp = ogr.Open(v.Filename())
+    layer = shp.GetLayer(0) if v.LayerName() == '' else shp.GetLayer(v.LayerName())
+    names, geoms = [], []
+    for feat in layer:
+        names.append(feature2tile(feat))
+        geoms.append(loads(feat.GetGeometryRef().ExportToWkt()))
+    return TileIndex(names, geoms, layer.GetSpatialRef().ExportToWkt())
+
+
+def cache_path(driver, tiles):
+    """ Path of the saved index of a tiles vector, or None if it isn't a file """
+    if not os.path.isfile(tiles):
+        return None
+    return '{}.{}.tileindex'.format(os.path.splitext(tiles)[0], driver)
+
+
+def _source(tiles):
+    stat = os.stat(tiles)
+    return [os.path.abspath(tiles), stat.st_size, stat.st_mtime]
+
+
+def _read(path, tiles):
+    """ Saved TileIndex in path, or None if there's none for the current tiles vector """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            saved = pickle.load(f)
+        if saved['version'] != _version or saved['source'] != _source(tiles):
+            return None
+        return TileIndex(saved['tiles'], [wkb.loads(g) for g in saved['geoms']],
+                         saved['projection'])
+    except Exception as e:
+        utils.verbose_out('Ignoring tile index {}: {}'.format(path, e), 3)
+        return None
+
+
+def _write(path, tiles, index):
+    saved = {
+        'version': _version,
+        'source': _source(tiles),
+        'tiles': index.tiles,
+        'geoms': [g.wkb for g in index.geoms],
+        'projection': index.projection,
+    }
+    try:
+        # written under a temporary name, so an index file is only read once complete
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp, 'wb') as f:
+            pickle.dump(saved, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, path)
+    except (IOError, OSError) as e:
+        utils.verbose_out('Unable to save tile index {}: {}'.format(path, e), 3)
+
+
+def get(driver, tiles, feature2tile):
+    """ TileIndex of driver's tiles vector, built at most once per process """
+    key = (driver, tiles)
+    if key not in _indexes:
+        path = cache_path(driver, tiles)
+        index = _read(path, tiles) if path is not None else None
+        if index is None:
+            utils.verbose_out('Building tile index of {}'.format(tiles), 3)
+            index = build(tiles, feature2tile)
+            if path is not None:
+                _write(path, tiles, index)
+        _indexes[key] = index
+    return _indexes[key]
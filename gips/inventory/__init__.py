@@ -23,18 +23,73 @@
 
 import sys
 import os
+import resource
 from datetime import datetime as dt
 import traceback
+import multiprocessing
 import numpy
 from copy import deepcopy
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 
 import gippy
-from gips.tiles import Tiles
+from gips.tiles import Tiles, LazyTiles
 from gips.utils import VerboseOut, Colors
 from gips import utils
 from gips.mapreduce import MapReduce
-from . import dbinv, orm
+from . import dbinv, orm, cube, extract
+
+
+def _close_db_connections():
+    """ Close django's connections before forking workers, so none is shared
+
+    Each process then opens its own connection when it needs one.  The
+    sqlite backend needs no django setup, and reopens its connection in
+    each process by itself.
+    """
+    if orm.use_orm() and orm.inventory_backend() != 'sqlite':
+        import django.db
+        django.db.connections.close_all()
+
+
+def _process_init(_units):
+    """ Initializer sets globals for processing & mosaicking workers (see DataInventory)
+
+    Workers use the library error handler, so errors are raised to the worker
+    function to be returned, rather than exiting the worker as the command
+    line handler does.
+    """
+    global units
+    units = _units
+    utils.set_error_handler(utils.lib_error_handler)
+
+
+def _process_worker(args):
+    """ Process a single (date, tile) unit; errors are returned, not raised.
+
+    Returns (date, tile, filenames, sensors, error), where error is None on
+    success and a (message, traceback text) pair on failure.
+    """
+    key, pargs, pkwargs = args
+    data_obj = units[key]
+    try:
+        data_obj.process(*pargs, **pkwargs)
+    except BaseException as e: # eg SystemExit, which would leave the pool waiting forever
+        return key + (None, None, (str(e), traceback.format_exc()))
+    return key + (data_obj.filenames, data_obj.sensors, None)
+
+
+def _mosaic_worker(args):
+    """ Mosaic a single (date, sensor, product) unit; errors are returned, not raised.
+
+    Returns (date, sensor, product, error), where error is as for _process_worker.
+    """
+    key, mkwargs = args
+    tiles_obj, datadir = units[key]
+    try:
+        tiles_obj.mosaic_product(key[1], key[2], datadir, **mkwargs)
+    except BaseException as e: # as for _process_worker
+        return key + ((str(e), traceback.format_exc()),)
+    return key + (None,)
 
 
 class Inventory(object):
@@ -72,10 +127,15 @@ class Inventory(object):
         """ Get sorted list of dates """
         return sorted(self.data.keys())
 
+    def _iter_dates(self):
+        """ Yield (date, item) for each date in date order """
+        for date in self.dates:
+            yield date, self.data[date]
+
     @property
     def numfiles(self):
         """ Total number of files in inventory """
-        return sum([len(dat) for dat in self.data.values()])
+        return sum([len(dat) for _, dat in self._iter_dates()])
 
     @property
     def datestr(self):
@@ -95,24 +155,27 @@ class Inventory(object):
         oldyear = 0
         formatstr = '{:<12}\n'
         colors = {k: self.color(k) for k in self.sensor_set}
-        for date in self.dates:
+        numfiles = numdates = total_size = 0
+        for date, dat in self._iter_dates():
             # if new year then write out the year
             if date.year != oldyear:
                 sys.stdout.write(Colors.BOLD + formatstr.format(date.year) + Colors.OFF)
-            self.data[date].pprint(dformat, colors)
+            dat.pprint(dformat, colors)
             oldyear = date.year
-        if self.numfiles != 0:
-            VerboseOut("\n\n%s files on %s dates" % (self.numfiles, len(self.dates)), 1)
+            numfiles += len(dat)
+            numdates += 1
+            if size:
+                filelist_gen = (
+                    tile.filenames.values() + [a.filename for a in tile.assets.values()]
+                    for tile in dat.tiles.values()
+                )
+                total_size += sum(
+                    sum(os.stat(f).st_size for f in fl)
+                    for fl in filelist_gen
+                )
+        if numfiles != 0:
+            VerboseOut("\n\n%s files on %s dates" % (numfiles, numdates), 1)
         if size:
-            filelist_gen = (
-                tile.filenames.values() + [a.filename for a in tile.assets.values()]
-                for tiles in self.data.values()
-                for tile in tiles.tiles.values()
-            )
-            total_size = sum(
-                sum(os.stat(f).st_size for f in fl)
-                for fl in filelist_gen
-            )
             sitename = self.spatial.sitename
             if sitename == 'tiles':
                 sitename += str(self.spatial.tiles)
@@ -120,6 +183,60 @@ class Inventory(object):
                   .format(sitename, total_size / 2 ** 20))
 
 
+class _ImageCache(object):
+    """ LRU cache of open time series GeoImages, within a budget of open files
+
+    Entries belong to the process that opened them; a forked process (eg a
+    MapReduce worker) starts with an empty cache rather than sharing handles.
+    """
+
+    def __init__(self, maxfiles):
+        self.maxfiles = maxfiles
+        self.images = OrderedDict()
+        self.nfiles = 0
+        self.pid = os.getpid()
+
+    def get(self, filenames):
+        """ Get GeoImage of filenames, opening it & closing older ones if needed """
+        if self.pid != os.getpid():
+            self.clear()
+            self.pid = os.getpid()
+        key = tuple(filenames)
+        img = self.images.pop(key, None)
+        if img is None:
+            img = gippy.GeoImage(list(key))
+            self.nfiles += len(key)
+            # the newest image is kept even if it alone exceeds the budget
+            while self.nfiles > self.maxfiles and self.images:
+                oldkey, _ = self.images.popitem(last=False)
+                self.nfiles -= len(oldkey)
+        self.images[key] = img
+        return img
+
+    def clear(self):
+        """ Close all cached images """
+        self.images.clear()
+        self.nfiles = 0
+
+
+_image_cache = None
+
+
+def image_cache():
+    """ This process's GeoImage cache, limited to GIPS_OPEN_FILES open files
+
+    The limit defaults to 256, and is capped to half the process's open file limit.
+    """
+    global _image_cache
+    if _image_cache is None:
+        maxfiles = getattr(utils.settings(), 'GIPS_OPEN_FILES', 256)
+        soft = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+        if soft != resource.RLIM_INFINITY:
+            maxfiles = min(maxfiles, soft // 2)
+        _image_cache = _ImageCache(maxfiles)
+    return _image_cache
+
+
 class ProjectInventory(Inventory):
     """ Inventory of project directory (collection of Data class) """
 
@@ -145,6 +262,7 @@ class ProjectInventory(Inventory):
                 products = list(product_set)
             self.requested_products = products
             self.sensors = sensor_set
+            self.cube = cube.Cube.open(self.projdir)
 
     def products(self, date=None):
         """ Intersection of available products and requested products for this date """
@@ -172,7 +290,13 @@ class ProjectInventory(Inventory):
         return sz
 
     def get_data(self, dates=None, products=None, chunk=None):
-        """ Read all files as time series, stacking all products """
+        """ Read all files as time series, stacking all products
+
+        Products in the project's time series cube (see build_cube) are read
+        from it; others are read from the files, with time series images kept
+        open between calls (see image_cache) so reading many chunks of a
+        project doesn't reopen its files each time.
+        """
         # TODO - change to absolute dates
 
         if dates is None:
@@ -184,7 +308,10 @@ class ProjectInventory(Inventory):
             products = self.requested_products
 
         for p in products:
-            gimg = self.get_timeseries(p, dates=dates)
+            if self.cube is not None and self.cube.covers(self, p, dates):
+                imgarr.append(self.cube.read(p, dates, chunk))
+                continue
+            gimg = self.get_timeseries(p, dates=dates, cache=True)
             # TODO - move numpy.squeeze into swig interface file?
             ch = gippy.Recti(chunk[0], chunk[1], chunk[2], chunk[3])
             arr = numpy.squeeze(gimg.TimeSeries(days.astype('float64'), ch))
@@ -202,39 +329,102 @@ class ProjectInventory(Inventory):
         location = os.path.split(os.path.split(data.filenames.values()[0])[0])[1]
         return location
 
-    def get_timeseries(self, product='', dates=None):
-        """ Read all files as time series """
+    def build_cube(self, products=None, overwrite=False):
+        """ Build the project's time series cube, for faster get_data (see gips.inventory.cube) """
+        self.cube = cube.build(self, products, overwrite)
+        return self.cube
+
+    def get_timeseries(self, product='', dates=None, cache=False):
+        """ Read all files as time series
+
+        This always reads the files, as a GeoImage; get_data reads from the
+        project's cube when there is one.  If cache is set the image may be
+        shared with other callers and is left open (see image_cache); don't
+        modify or close it.
+        """
         if dates is None:
             dates = self.dates
         # TODO - multiple sensors
         filenames = [self.data[date][product] for date in dates]
+        if cache:
+            return image_cache().get(filenames)
         img = gippy.GeoImage(filenames)
         return img
 
-    def map_reduce(self, func, numbands=1, products=None, readfunc=None, nchunks=100, **kwargs):
-        """ Apply func to inventory to generate an image with numdim output bands """
+    def block_size(self):
+        """ Get (X, Y) block size of the files in project """
+        from osgeo import gdal
+        ds = gdal.Open(self.data[self.dates[0]][self.requested_products[0]])
+        return tuple(ds.GetRasterBand(1).GetBlockSize())
+
+    def map_reduce(self, func, numbands=1, products=None, readfunc=None, nchunks=None,
+                   memory=None, filename=None, dtype=gippy.GDT_Float32, nodata=None, **kwargs):
+        """ Apply func to inventory to generate an image with numdim output bands
+
+        Unless nchunks is given, the image is split into chunks aligned to the
+        files' blocks and using about memory MB each, defaulting to gippy's
+        chunk size (--chunksize); see MapReduce.plan_chunks.  Other keywords
+        (eg nproc, keepnodata, shared, outdtype) are passed to MapReduce,
+        along with nodata.
+
+        Returns the output as an array, or if filename is given, writes each
+        chunk to a new image of that name (see new_image) as soon as it is
+        done, and returns the filename; NaNs are written as nodata if given.
+        shared is ignored when writing to filename, as no output array is
+        assembled.
+        """
         if products is None:
             products = self.requested_products
         if readfunc is None:
             readfunc = lambda x: self.get_data(products=products, chunk=x)
         inshape = self.data_size()
         outshape = [numbands, inshape[1], inshape[2]]
-        mr = MapReduce(inshape, outshape, readfunc, func, **kwargs)
-        mr.run(nchunks=nchunks)
-        return mr.assemble()
+        chunks = None
+        if nchunks is None:
+            if memory is None:
+                memory = gippy.Options.ChunkSize()
+            # readfunc's stack has a band per product per date
+            stackshape = (len(products) * len(self.dates), inshape[1], inshape[2])
+            chunks = MapReduce.plan_chunks(stackshape, numbands, memory,
+                                           outdtype=kwargs.get('outdtype', 'float64'),
+                                           blocksize=self.block_size(),
+                                           minchunks=kwargs.get('nproc', 2))
+        if filename is not None:
+            kwargs.pop('shared', None)
+        mr = MapReduce(inshape, outshape, readfunc, func, nodata=nodata, **kwargs)
+        if filename is None:
+            mr.run(nchunks=nchunks, chunks=chunks)
+            return mr.assemble()
+
+        imgout = self.new_image(filename, dtype, numbands, nodata)
+
+        def write(output, chunk):
+            if nodata is not None and output.dtype.kind == 'f':
+                output[numpy.isnan(output)] = nodata
+            for b in range(numbands):
+                imgout[b].Write(output[b], gippy.Recti(*chunk))
+
+        mr.stream(write, nchunks=nchunks, chunks=chunks)
+        imgout = None # close the file
+        return filename
 
 
 class DataInventory(Inventory):
     """ Manager class for data inventories (collection of Tiles class) """
 
     def __init__(self, dataclass, spatial, temporal, products=None,
-                 fetch=False, update=False, **kwargs):
+                 fetch=False, update=False, lazy=False, **kwargs):
         """ Create a new inventory
         :dataclass: The Data class to use (e.g., LandsatData, ModisData)
         :spatial: The SpatialExtent requested
         :temporal: The temporal extent requested
         :products: List of requested products of interest
         :fetch: bool indicated if missing data should be downloaded
+        :lazy: bool; if set, a filesystem inventory only records which tiles
+            have data on which dates, searching for each date's Data objects
+            when first needed and releasing them once a date is worked through.
+            Dates whose tiles are all invalid or filtered out are then still
+            listed in self.dates, but have no tiles.
         """
         VerboseOut('Retrieving inventory for site %s for date range %s' % (spatial.sitename, temporal) , 2)
 
@@ -245,6 +435,7 @@ class DataInventory(Inventory):
         self.products = dataclass.RequestedProducts(products)
 
         self.update = update
+        self.lazy = lazy and not orm.use_orm()
 
         if fetch:
             # command-line arguments could have lists, which lru_cache chokes
@@ -258,20 +449,23 @@ class DataInventory(Inventory):
             if orm.use_orm():
                 # save metadata about the fetched assets in the database
                 driver = dataclass.name.lower()
-                for a in archived_assets:
-                    dbinv.update_or_add_asset(
-                            asset=a.asset, sensor=a.sensor, tile=a.tile, date=a.date,
-                            name=a.archived_filename, driver=driver)
-                    # if the new asset comes with any "free" products, save that info:
-                    for (prod_type, fp) in a.products.items():
-                        dbinv.update_or_add_product(
-                                product=prod_type, sensor=a.sensor, tile=a.tile, date=a.date,
-                                name=fp, driver=driver)
+                with dbinv.batch():
+                    for a in archived_assets:
+                        dbinv.update_or_add_asset(
+                                asset=a.asset, sensor=a.sensor, tile=a.tile, date=a.date,
+                                name=a.archived_filename, driver=driver)
+                        # if the new asset comes with any "free" products, save that info:
+                        for (prod_type, fp) in a.products.items():
+                            dbinv.update_or_add_product(
+                                    product=prod_type, sensor=a.sensor, tile=a.tile, date=a.date,
+                                    name=fp, driver=driver)
 
         # Build up the inventory:  One Tiles object per date.  Each contains one Data object.  Each
         # of those contain one or more Asset objects.
         self.data = {}
-        dates = self.temporal.prune_dates(spatial.available_dates)
+        tile_dates = spatial.tile_dates
+        dates = self.temporal.prune_dates(
+            [d for ds in tile_dates.values() for d in ds])
         if orm.use_orm():
             # populate the object tree under the DataInventory (Tiles, Data, Asset) by querying the
             # DB quick-like then assigning things we iterate:  The DB is a flat table of data; we
@@ -318,11 +512,23 @@ class DataInventory(Inventory):
             return
 
         # Perform filesystem search since user wants that.  Data object instantiation results
-        # in filesystem search (thanks to search=True).
+        # in filesystem search (thanks to search=True).  Only visit (tile, date) pairs that
+        # actually have a directory in the repo; tiles rarely share all their dates, so the
+        # full tiles x dates cross product is mostly empty for large tile sets.
         self.data = {} # clear out data dict in case it has partial results
-        for date in dates:
+        date_tiles = defaultdict(list)
+        wanted = set(dates)
+        for t, tdates in tile_dates.items():
+            for d in tdates & wanted:
+                date_tiles[d].append(t)
+        if self.lazy:
+            for date, tiles in date_tiles.items():
+                self.data[date] = LazyTiles(dataclass, spatial, date, self.products,
+                                            tile_ids=tiles, **kwargs)
+            return
+        for date in sorted(date_tiles):
             tiles_obj = Tiles(dataclass, spatial, date, self.products, **kwargs)
-            for t in spatial.tiles:
+            for t in sorted(date_tiles[date]):
                 data_obj = dataclass(t, date, search=True)
                 if data_obj.valid and data_obj.filter(**kwargs):
                     tiles_obj.tiles[t] = data_obj
@@ -330,41 +536,212 @@ class DataInventory(Inventory):
                 self.data[date] = tiles_obj
 
 
+    def _iter_dates(self):
+        """ Yield (date, Tiles) in date order, releasing lazy Tiles after use
+
+        Lazy Tiles left empty by validation and filtering are skipped.
+        """
+        for date in self.dates:
+            tiles = self.data[date]
+            if not self.lazy:
+                yield date, tiles
+                continue
+            if len(tiles) > 0:
+                yield date, tiles
+            tiles.release()
+
     @property
     def sensor_set(self):
         """ The set of all sensors used in this inventory """
         return sorted(self.dataclass.Asset._sensors.keys())
 
     def process(self, *args, **kwargs):
-        """ Process assets into requested products """
+        """ Process assets into requested products
+
+        Set workers > 1 to process (date, tile) units concurrently in a
+        pool of that many processes.
+        """
         # TODO - some check on if any processing was done
+        workers = kwargs.pop('workers', 1)
         start = dt.now()
-        VerboseOut('Processing [%s] on %s dates (%s files)' % (self.products, len(self.dates), self.numfiles), 3)
+        if gippy.Options.Verbose() >= 3:
+            VerboseOut('Processing [%s] on %s dates (%s files)' % (self.products, len(self.dates), self.numfiles), 3)
         if len(self.products.standard) > 0:
-            for date in self.dates:
-                with utils.error_handler(continuable=True):
-                    self.data[date].process(*args, **kwargs)
+            if workers > 1:
+                self._process_parallel(workers, *args, **kwargs)
+            else:
+                for date, tiles in self._iter_dates():
+                    with utils.error_handler(continuable=True):
+                        tiles.process(*args, **kwargs)
         if len(self.products.composite) > 0:
             self.dataclass.process_composites(self, self.products.composite, **kwargs)
         VerboseOut('Processing completed in %s' % (dt.now() - start), 2)
 
-    def mosaic(self, datadir='./', tree=False, **kwargs):
-        """ Create project files for data in inventory """
+    def _date_batches(self, size, count):
+        """ Yield lists of (date, Tiles) in date order, to be worked through together
+
+        Unless the inventory is lazy, all dates are one batch.  Otherwise
+        dates are added to a batch until the sum of count(tiles) reaches
+        size, and each batch's Tiles are released once it has been worked
+        through, so only one batch's Data objects are held at a time.
+        """
+        dates = self.dates # sorted once; the property sorts on every access
+        if not self.lazy:
+            yield [(date, self.data[date]) for date in dates]
+            return
+        batch, n = [], 0
+        for date in dates:
+            tiles = self.data[date]
+            batch.append((date, tiles))
+            n += count(tiles)
+            if n >= size or date == dates[-1]:
+                yield batch
+                for _, t in batch:
+                    t.release()
+                batch, n = [], 0
+
+    @staticmethod
+    def _run_pool(workers, units, worker, jobs):
+        """ Results of worker for each of jobs, in order, from a pool with units (see _process_init) """
+        _close_db_connections()
+        pool = multiprocessing.Pool(workers, initializer=_process_init, initargs=(units,))
+        try:
+            # imap preserves submission order so results arrive deterministically
+            return list(pool.imap(worker, jobs, chunksize=1))
+        finally:
+            pool.close()
+            pool.join()
+
+    def _process_parallel(self, workers, *args, **kwargs):
+        """ Process each (date, tile) unit in a pool of worker processes.
+
+        Each unit is an independent call to Data.process.  A failure in
+        one unit is reported through utils.error_handler and doesn't
+        stop the others.  Products made by the workers are added to the
+        inventory's Data objects, then a summary is printed in (date,
+        tile) order.  Lazy inventories are worked through a batch of
+        dates at a time (see _date_batches).
+        """
+        kwargs['products'] = self.products.products
+        total, failures = 0, []
+        for batch in self._date_batches(workers * 4, lambda tiles: len(tiles.tiles)):
+            units = {(date, tile): data_obj
+                     for date, tiles in batch
+                     for tile, data_obj in tiles.tiles.items()}
+            keys = sorted(units.keys())
+            if len(keys) == 0:
+                continue
+            total += len(keys)
+            nworkers = min(workers, len(keys))
+            VerboseOut('Processing %s (date, tile) units with %s workers' % (len(keys), nworkers), 2)
+            results = self._run_pool(nworkers, units, _process_worker,
+                                     [(k, args, kwargs) for k in keys])
+
+            for date, tile, filenames, sensors, error in results:
+                if error is None:
+                    units[(date, tile)].filenames.update(filenames)
+                    units[(date, tile)].sensors.update(sensors)
+                    continue
+                failures.append((date, tile))
+                msg, tb_text = error
+                VerboseOut(tb_text, 3, sys.stderr)
+                with utils.error_handler('Error processing %s %s' % (tile, date), continuable=True):
+                    raise RuntimeError(msg)
+
+        if total == 0:
+            return
+        VerboseOut('Processed %s of %s (date, tile) units' % (total - len(failures), total), 1)
+        for date, tile in failures:
+            VerboseOut('  failed: %s %s' % (date, tile), 1)
+
+    def mosaic(self, datadir='./', tree=False, workers=1, process_workers=1, **kwargs):
+        """ Create project files for data in inventory
+
+        Set workers > 1 to create the file of each (date, sensor, product)
+        concurrently in a pool of that many processes.  Products are first
+        processed with process_workers workers (see process).
+        """
         # make sure products have been processed first
-        self.process(overwrite=False)
+        self.process(overwrite=False, workers=process_workers)
         start = dt.now()
         VerboseOut('Creating mosaic project %s' % datadir, 2)
         VerboseOut('  Dates: %s' % self.datestr)
         VerboseOut('  Products: %s' % self.products)
 
-        dout = datadir
-        for d in self.dates:
-            if tree:
-                dout = os.path.join(datadir, d.strftime('%Y%j'))
-            self.data[d].mosaic(dout, **kwargs)
+        if workers > 1:
+            self._mosaic_parallel(workers, datadir, tree, **kwargs)
+        else:
+            dout = datadir
+            for d, tiles in self._iter_dates():
+                if tree:
+                    dout = os.path.join(datadir, d.strftime('%Y%j'))
+                tiles.mosaic(dout, **kwargs)
 
         VerboseOut('Completed mosaic project in %s' % (dt.now() - start), 2)
 
+    def _mosaic_parallel(self, workers, datadir, tree, **kwargs):
+        """ Mosaic each (date, sensor, product) unit in a pool of worker processes.
+
+        Each unit is an independent call to Tiles.mosaic_product, which
+        writes to a temporary directory and renames the result into place.
+        A failure in one unit is reported through utils.error_handler and
+        doesn't stop the others.  Lazy inventories are worked through a
+        batch of dates at a time (see _date_batches).
+        """
+        count = lambda tiles: len(tiles.mosaic_pile()) if len(tiles) > 0 else 0
+        for batch in self._date_batches(workers * 4, count):
+            units = {}
+            for d, tiles in batch:
+                if len(tiles) == 0:
+                    continue
+                if tiles.spatial.site is None:
+                    raise Exception('Site required for creating mosaics')
+                dout = os.path.join(datadir, d.strftime('%Y%j')) if tree else datadir
+                for sensor, product in tiles.mosaic_pile():
+                    units[(d, sensor, product)] = (tiles, dout)
+            keys = sorted(units.keys())
+            if len(keys) == 0:
+                continue
+            nworkers = min(workers, len(keys))
+            VerboseOut('Mosaicking %s (date, sensor, product) units with %s workers' % (len(keys), nworkers), 2)
+            results = self._run_pool(nworkers, units, _mosaic_worker,
+                                     [(k, kwargs) for k in keys])
+
+            for date, sensor, product, error in results:
+                if error is None:
+                    continue
+                msg, tb_text = error
+                VerboseOut(tb_text, 3, sys.stderr)
+                err_msg = 'Error mosaicking %s %s %s' % (date, sensor, product)
+                with utils.error_handler(err_msg, continuable=True):
+                    raise RuntimeError(msg)
+
+    def extract(self, features):
+        """ Yield (feature, date, product, band, value) for features, without mosaicking
+
+        features are gippy GeoFeatures of points or small polygons, given in
+        rows by their key value.  Each tile's product files are opened with
+        Data.open and only the pixels covering the features are read (see
+        gips.inventory.extract).  Where a feature has valid pixels in more
+        than one tile on a date, the first tile's are used.
+        """
+        # make sure products have been processed first
+        self.process(overwrite=False)
+        targets = extract.Targets(features)
+        for date, tiles in self._iter_dates():
+            for p in self.products.products:
+                done = set()
+                for t in sorted(tiles.tiles):
+                    data = tiles.tiles[t]
+                    if p not in data.products:
+                        continue
+                    img = data.open(p)
+                    for key, band, value in extract.sample(img, targets):
+                        if (key, band) not in done:
+                            done.add((key, band))
+                            yield key, date, p, band, value
+                    img = None
+
     # def warptiles(self):
     #    """ Just copy or warp all tiles in the inventory """
 
@@ -0,0 +1,174 @@
+"""Time series cubes of project directories.
+
+A project directory's products are one file per date, so reading the time
+series of a block of pixels means reading every date's file.  A cube holds
+each product in a single .npy file of shape Y x X x dates, so a pixel's time
+series is contiguous and a strip of rows is a contiguous run of the file.
+Values are float32, with NaN for nodata.  The cube's index, cube.json in the
+project directory, records each product's array file, dates, and the files it
+was built from, so a cube is only used while those files are unchanged.
+"""
+
+import os
+import json
+import time
+from datetime import datetime as dt
+
+import numpy
+from numpy.lib.format import open_memmap
+import gippy
+
+from gips import utils
+
+INDEX = 'cube.json'
+_version = 1
+_datefmt = '%Y%j'
+
+
+def index_path(projdir):
+    """ Path of the cube index for a project directory """
+    return os.path.join(projdir, INDEX)
+
+
+def _write_json(path, obj):
+    """ Write obj to path as json, replacing any existing file atomically """
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(obj, f, indent=2, sort_keys=True)
+    os.rename(tmp, path)
+
+
+class Cube(object):
+    """ Time series cube of a project directory (see module docstring) """
+
+    def __init__(self, projdir, index):
+        self.projdir = projdir
+        self.index = index
+        self._arrays = {}
+        self._covered = {}
+
+    @classmethod
+    def open(cls, projdir):
+        """ Open the project directory's cube, or return None if it has none """
+        path = index_path(projdir)
+        if not os.path.exists(path):
+            return None
+        with utils.error_handler('Error reading cube index ' + path):
+            with open(path) as f:
+                index = json.load(f)
+        if index.get('version') != _version:
+            utils.verbose_out('Ignoring cube index {} of an old version'.format(path), 2)
+            return None
+        return cls(projdir, index)
+
+    @property
+    def products(self):
+        """ Products in the cube """
+        return sorted(self.index['products'])
+
+    def dates(self, product):
+        """ Dates the cube has for product """
+        return [dt.strptime(d, _datefmt).date() for d in self.index['products'][product]['dates']]
+
+    def covers(self, inv, product, dates):
+        """ True if the cube has product for all dates, built from inv's current files """
+        key = (product, tuple(dates))
+        if key not in self._covered:
+            self._covered[key] = self._covers(inv, product, dates)
+        return self._covered[key]
+
+    def _covers(self, inv, product, dates):
+        entry = self.index['products'].get(product)
+        if entry is None:
+            return False
+        sources = dict(zip(entry['dates'], entry['sources']))
+        for d in dates:
+            if product not in inv.data[d].products:
+                return False
+            filename = inv.data[d][product]
+            if sources.get(d.strftime(_datefmt)) != os.path.basename(filename):
+                return False
+            if os.path.getmtime(filename) > entry['built']:
+                return False
+        return True
+
+    def array(self, product):
+        """ Read-only memory map of product's Y x X x dates array """
+        if product not in self._arrays:
+            filename = os.path.join(self.projdir, self.index['products'][product]['filename'])
+            self._arrays[product] = numpy.load(filename, mmap_mode='r')
+        return self._arrays[product]
+
+    def read(self, product, dates, chunk=None):
+        """ Read product's time series as a dates x Y x X array
+
+        chunk is [x, y, width, height] as for ProjectInventory.get_data, or
+        None for the whole image.
+        """
+        arr = self.array(product)
+        if chunk is not None:
+            x, y, w, h = chunk
+            arr = arr[y:y + h, x:x + w]
+        position = {d: i for i, d in enumerate(self.index['products'][product]['dates'])}
+        idx = [position[d.strftime(_datefmt)] for d in dates]
+        if idx and idx == range(idx[0], idx[-1] + 1):
+            arr = arr[:, :, idx[0]:idx[-1] + 1]
+        else:
+            arr = arr[:, :, idx]
+        return numpy.ascontiguousarray(arr.transpose(2, 0, 1))
+
+
+def build(inv, products=None, overwrite=False, rows=None):
+    """ Build or update the time series cube of a ProjectInventory, returning it
+
+    Products already in the cube and up to date are kept unless overwrite is
+    set.  Each product is read rows at a time, by default as many as fit in
+    gippy's chunk size (--chunksize).
+    """
+    if products is None:
+        products = inv.requested_products
+    cube = Cube.open(inv.projdir)
+    index = cube.index if cube is not None else {'version': _version, 'products': {}}
+    for p in products:
+        dates = [d for d in inv.dates if p in inv.data[d].products]
+        if not dates:
+            continue
+        if not overwrite and cube is not None and cube.covers(inv, p, dates):
+            utils.verbose_out('Cube of {} is up to date'.format(p), 2)
+            continue
+        utils.verbose_out('Building cube of {} over {} dates'.format(p, len(dates)), 2)
+        index['products'][p] = _build_product(inv, p, dates, rows)
+        _write_json(index_path(inv.projdir), index)
+    return Cube.open(inv.projdir)
+
+
+def _build_product(inv, product, dates, rows=None):
+    """ Write the cube array of product, returning its index entry """
+    built = time.time()
+    img = inv.get_timeseries(product, dates=dates)
+    ysize, xsize = img.YSize(), img.XSize()
+    nodata = img[0].NoDataValue()
+    days = numpy.array([int(d.strftime('%j')) for d in dates]).astype('float64')
+    if rows is None:
+        rows = max(int(gippy.Options.ChunkSize() * 2 ** 20 / (xsize * len(dates) * 4 * 2)), 1)
+
+    filename = 'cube_{}.npy'.format(product)
+    path = os.path.join(inv.projdir, filename)
+    out = open_memmap(path + '.tmp', mode='w+', dtype='float32',
+                      shape=(ysize, xsize, len(dates)))
+    for y in range(0, ysize, rows):
+        h = min(rows, ysize - y)
+        arr = numpy.array(img.TimeSeries(days, gippy.Recti(0, y, xsize, h)), dtype='float32')
+        arr = arr.reshape((len(dates), h, xsize))
+        arr[arr == nodata] = numpy.nan
+        out[y:y + h] = arr.transpose(1, 2, 0)
+    out.flush()
+    del out
+    img = None
+    os.rename(path + '.tmp', path)
+    return {
+        'filename': filename,
+        'dates': [d.strftime(_datefmt) for d in dates],
+        'sources': [os.path.basename(inv.data[d][product]) for d in dates],
+        'built': built,
+    }
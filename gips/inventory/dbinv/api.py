@@ -1,9 +1,10 @@
-import os, glob, sys, traceback, datetime, time, itertools, re
-
-import django.db.transaction
+import os, glob, sys, traceback, datetime, time, itertools, re, functools, json
+from collections import defaultdict
+from multiprocessing.pool import ThreadPool
 
 from gips.utils import verbose_out, basename
 from gips import utils
+from gips.inventory import orm
 
 
 """API for the DB inventory for GIPS.
@@ -11,10 +12,29 @@ from gips import utils
 Provides a clean interface layer for GIPS callers to do CRUD ops on the
 inventory DB, mostly by interfacing with dbinv.models.  Due to Django
 bootstrapping weirdness, some imports have to be done in each function's
-body.
+body.  If GIPS_INVENTORY_BACKEND is 'sqlite', calls are instead routed to
+the embedded backend in dbinv.sqlite, which doesn't need Django.
 """
 
 
+def _backend_dispatch(function):
+    """Route calls to dbinv.sqlite's function of the same name if configured."""
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if orm.inventory_backend() == 'sqlite':
+            from . import sqlite
+            return getattr(sqlite, function.__name__)(*args, **kwargs)
+        return function(*args, **kwargs)
+    return wrapper
+
+
+@_backend_dispatch
+def batch():
+    """Context manager making the inventory writes inside it one transaction."""
+    import django.db.transaction
+    return django.db.transaction.atomic()
+
+
 def _grouper(iterable, n, fillvalue=None):
     """Collect data into fixed-length chunks or blocks.
 
@@ -25,78 +45,192 @@ def _grouper(iterable, n, fillvalue=None):
     return itertools.izip_longest(fillvalue=fillvalue, *args)
 
 
-def _chunky_transaction(iterable, function, chunk_sz=1000, item_desc="items"):
-    """Iterate over items in chunks; each chunk is 1 database transaction."""
-    iter_cnt = 0
+def _scan_dirs(paths, scan_dir, workers=1):
+    """Yield the items returned by scan_dir(path) for each of the paths.
+
+    With workers > 1 the directories are scanned in that many threads;
+    items then arrive in no particular order.
+    """
+    if workers <= 1:
+        for path in paths:
+            for item in scan_dir(path):
+                yield item
+        return
+    pool = ThreadPool(workers)
+    try:
+        for items in pool.imap_unordered(scan_dir, paths, chunksize=8):
+            for item in items:
+                yield item
+    finally:
+        pool.terminate()
+
+
+# keeps each delete's key list under SQLite's limit on query parameters
+_delete_chunk_sz = 500
+
+
+def _bulk_rectify(desc, rows, existing, write, delete, chunk_sz=1000):
+    """Reconcile records streamed from the archive with the DB's records.
+
+    rows:  iterable of (key, values) pairs found in the archive; key
+        identifies a record, values is a dict of its other fields.
+    existing:  dict of key: (pk, values) for the records in the DB.
+    write(inserts, updates):  saves a chunk's new records, a list of
+        (key, values), and its changed ones, a list of (pk, values).
+    delete(pks):  deletes the given records.
+
+    Records are compared a chunk at a time, so each write is one bulk
+    operation; unchanged records aren't written at all.  Records not seen
+    in the archive are then deleted in chunks.  Returns (added, updated,
+    deleted) counts.
+    """
+    added = updated = scanned = 0
+    seen = set()
     chunk_start_time = start_time = time.time()
-    for chunk in _grouper(iterable, chunk_sz):
-        with django.db.transaction.atomic():
-            for item in chunk:
-                if item is None:
-                    break # need this due to izip_longest padding chunks with Nones
-                iter_cnt += 1
-                function(item)
+    for chunk in _grouper(rows, chunk_sz):
+        inserts, updates = [], []
+        for item in chunk:
+            if item is None:
+                break # need this due to izip_longest padding chunks with Nones
+            scanned += 1
+            key, values = item
+            seen.add(key)
+            if key not in existing:
+                inserts.append((key, values))
+                existing[key] = (None, values)
+                verbose_out("{} added to database:  {}".format(desc, values['name']), 5)
+            elif existing[key][1] != values and existing[key][0] is not None:
+                updates.append((existing[key][0], values))
+                verbose_out("{} updated in database:  {}".format(desc, values['name']), 5)
+        write(inserts, updates)
+        added += len(inserts)
+        updated += len(updates)
         # after each chunk report stats
         new_chunk_start_time = time.time()
-        print "{} {} scanned; chunk time {:0.2f}s, total time {:0.2f}s".format(
-                iter_cnt, item_desc,
+        print "{} {} files scanned; chunk time {:0.2f}s, total time {:0.2f}s ({:0.0f} files/s)".format(
+                scanned, desc,
                 new_chunk_start_time - chunk_start_time,
-                new_chunk_start_time - start_time)
+                new_chunk_start_time - start_time,
+                scanned / max(new_chunk_start_time - start_time, 1e-3))
         chunk_start_time = new_chunk_start_time
 
+    # Remove things from DB that are NOT in FS:
+    print "Deleting stale {} records . . . ".format(desc)
+    delete_start_time = time.time()
+    stale = [pk for (key, (pk, _)) in existing.items() if key not in seen]
+    for i in range(0, len(stale), _delete_chunk_sz):
+        delete(stale[i:i + _delete_chunk_sz])
+    print "Deleted {} stale {} records in {:0.2f}s.".format(
+            len(stale), desc, time.time() - delete_start_time)
+    return added, updated, len(stale)
+
+
+def _scope_paths(repository, scope):
+    """Paths to the date directories in scope, a dict of tile: dates."""
+    return [repository.data_path(tile, date)
+            for tile in sorted(scope) for date in sorted(scope[tile])]
+
 
-def rectify_assets(asset_class):
+def _scope_filters(scope):
+    """Yield search criteria covering the scope; None means everything."""
+    if scope is None:
+        yield {}
+        return
+    for tile, dates in sorted(scope.items()):
+        yield {'tile': tile, 'date__in': sorted(dates)}
+
+
+def _asset_rows(asset_class, pattern, workers=1, scope=None):
+    """Yield ((tile, date), {sensor, name}) for archived assets matching pattern.
+
+    If given, only the date directories in scope are scanned.
+    """
+    if scope is None:
+        # this assumes this directory layout:  /path-to-repo/tiles/*/*/
+        paths = glob.iglob(os.path.join(asset_class.Repository.data_path(), '*', '*'))
+    else:
+        paths = _scope_paths(asset_class.Repository, scope)
+
+    def scan_dir(path):
+        rows = []
+        if not os.path.isdir(path): # removed since it was listed
+            return rows
+        for f_name in utils.find_files(pattern, path):
+            a = asset_class(f_name)
+            # some drivers' assets have datetimes, but the inventory holds dates
+            date = a.date.date() if isinstance(a.date, datetime.datetime) else a.date
+            rows.append(((a.tile, date), {'sensor': a.sensor, 'name': f_name}))
+        return rows
+
+    return _scan_dirs(paths, scan_dir, workers)
+
+
+def _product_rows(data_class, workers=1, scope=None):
+    """Yield ((product, tile, date, sensor), {name}) for archived products.
+
+    If given, only the date directories in scope are scanned.
+    """
+    data_path = data_class.Asset.Repository.data_path()
+    # globs for supported drivers:  /path-to-repo/tiles/*/*/*.tif
+    assert data_class._pattern[-1] not in ('*', '?') # sanity check in case new drivers don't conform
+
+    def scan_dir(path):
+        rows = []
+        for full_fn in glob.iglob(path):
+            parsed = _parse_product_filename(data_class, full_fn)
+            if parsed is not None:
+                (tile, date, sensor, product) = parsed
+                rows.append(((product, tile, date, sensor), {'name': full_fn}))
+        return rows
+
+    if scope is not None:
+        scope_globs = [os.path.join(path, data_class._pattern)
+                       for path in _scope_paths(data_class.Asset.Repository, scope)]
+        return _scan_dirs(scope_globs, scan_dir, workers)
+    # one unit of work per tile directory, so rows stream a tile at a time
+    tile_globs = (os.path.join(tile_dir, '*', data_class._pattern)
+                  for tile_dir in glob.iglob(os.path.join(data_path, '*')))
+    return _scan_dirs(tile_globs, scan_dir, workers)
+
+
+@_backend_dispatch
+def rectify_assets(asset_class, workers=1, scope=None):
     """Rectify the asset inventory database against the filesystem archive.
 
     For the current driver, go through each asset in the filesystem
     and ensure it has an entry in the inventory database.  Also
-    remove any database entries that match no archived files.
+    remove any database entries that match no archived files.  The
+    archive is scanned in `workers` threads.  If scope, a dict of
+    tile: dates, is given, only those date directories are rectified.
     """
     # can't load this at module compile time because django initialization is crazytown
+    import django.db.transaction
     from . import models
     mao = models.Asset.objects
     driver = asset_class.Repository.name.lower()
-    # this assumes this directory layout:  /path-to-repo/tiles/*/*/
-    path_glob = os.path.join(asset_class.Repository.data_path(), '*', '*')
-
-    def rectify_asset(f_name): # work function for _chunky_transaction()
-        a = asset_class(f_name)
-        (asset, created) = mao.update_or_create(
-                asset=a.asset, sensor=a.sensor, tile=a.tile, date=a.date,
-                name=f_name, driver=driver)
-        asset.save()
-        touched_rows.add(asset.pk)
-        if created:
-            counts['add'] += 1
-            verbose_out("Asset added to database:  " + f_name, 5)
-        else:
-            counts['update'] += 1
-            verbose_out("Asset found in database:  " + f_name, 5)
 
     start_time = time.time()
     for (ak, av) in asset_class._assets.items():
         print "Starting on {} assets at {:0.2f}s".format(ak, time.time() - start_time)
-        counts = {'add': 0, 'update': 0} # A flaw in python scoping makes this necessary
-        touched_rows = set() # for removing entries that don't match the filesystem
-        # little optimization to make deleting stale records go faster:
-        starting_keys = set(mao.filter(driver=driver, asset=ak).values_list('id', flat=True))
-
-        # Use iterators to cut down on memory usage; some asset collections can be pretty big
-        imatches = itertools.chain.from_iterable(utils.find_files(av['pattern'], path)
-                                                 for path in glob.iglob(path_glob))
-        _chunky_transaction(imatches, rectify_asset)
-
-        # Remove things from DB that are NOT in FS:
-        print "Deleting stale asset records . . . "
-        delete_start_time = time.time()
-        deletia_keys = starting_keys - touched_rows
-        _chunky_transaction(deletia_keys, lambda key: mao.get(pk=key).delete())
-        delete_time = time.time() - delete_start_time
-
-        del_cnt = len(deletia_keys)
-        print "Deleted {} stale asset records in {:0.2f}s.".format(del_cnt, delete_time)
+        existing = {(tile, date): (pk, {'sensor': sensor, 'name': name})
+                    for f in _scope_filters(scope)
+                    for (pk, tile, date, sensor, name)
+                    in mao.filter(driver=driver, asset=ak, **f).values_list(
+                        'id', 'tile', 'date', 'sensor', 'name').iterator()}
+
+        def write(inserts, updates):
+            with django.db.transaction.atomic():
+                mao.bulk_create([
+                    models.Asset(driver=driver, asset=ak, tile=tile, date=date, **values)
+                    for ((tile, date), values) in inserts])
+                for (pk, values) in updates:
+                    mao.filter(pk=pk).update(**values)
+
+        counts = _bulk_rectify(ak, _asset_rows(asset_class, av['pattern'], workers, scope),
+                               existing, write,
+                               lambda pks: mao.filter(pk__in=pks).delete())
         msg = "{} complete, inventory records changed:  {} added, {} updated, {} deleted"
-        print msg.format(ak, counts['add'], counts['update'], del_cnt) # no -v for this important data
+        print msg.format(ak, *counts) # no -v for this important data
 
 
 def _match_failure_report(f_name, reason):
@@ -105,76 +239,157 @@ def _match_failure_report(f_name, reason):
     verbose_out(msg.format(f_name, reason), 2, sys.stderr)
 
 
-def rectify_products(data_class):
+def _parse_product_filename(data_class, full_fn):
+    """Return (tile, date, sensor, product) for a product file, or None."""
+    bfn_parts = basename(full_fn).split('_')
+    if not len(bfn_parts) == 4:
+        _match_failure_report(full_fn,
+                "Failure to parse:  Wrong number of '_'-delimited substrings.")
+        return None
+
+    # extract metadata about the file
+    (tile, date_str, sensor, product) = bfn_parts
+    date_pattern = data_class.Asset.Repository._datedir
+    try:
+        date = datetime.datetime.strptime(date_str, date_pattern).date()
+    except Exception:
+        verbose_out(traceback.format_exc(), 4, sys.stderr)
+        msg = "Failure to parse date:  '{}' didn't adhere to pattern '{}'."
+        _match_failure_report(full_fn, msg.format(date_str, date_pattern))
+        return None
+    return (tile, date, sensor, product)
+
+
+@_backend_dispatch
+def rectify_products(data_class, workers=1, scope=None):
     """Rectify the product inventory database against the filesystem archive.
 
     For the current driver, go through each product in the filesystem
     and ensure it has an entry in the inventory database.  Also
     remove any database entries that match no extant file.  Attempt to
     follow the process in Data() closely, in particular find_files and
-    ParseAndAddFiles.
+    ParseAndAddFiles.  The archive is scanned in `workers` threads.  If
+    scope, a dict of tile: dates, is given, only those date directories
+    are rectified.
     """
     # can't load this at module compile time because django initialization is crazytown
+    import django.db.transaction
     from . import models
-    # search_glob for supported drivers:  /path-to-repo/tiles/*/*/*.tif
-    search_glob = os.path.join(data_class.Asset.Repository.data_path(),
-                               '*', '*', data_class._pattern)
-    assert search_glob[-1] not in ('*', '?') # sanity check in case new drivers don't conform
-
     mpo = models.Product.objects
     driver = data_class.name.lower()
-    touched_rows = set() # for removing entries that don't match the filesystem
-    counts = {'add': 0, 'update': 0}
-    # TODO may need an outer loop like assets; if this explodes for big drivers, split it up by date
-    # or chunk somehow
-    starting_keys = set(mpo.filter(driver=driver).values_list('id', flat=True))
-
-    def rectify_product(full_fn):
-        bfn_parts = basename(full_fn).split('_')
-        if not len(bfn_parts) == 4:
-            _match_failure_report(full_fn,
-                    "Failure to parse:  Wrong number of '_'-delimited substrings.")
-            return
-
-        # extract metadata about the file
-        (tile, date_str, sensor, product) = bfn_parts
-        date_pattern = data_class.Asset.Repository._datedir
-        try:
-            date = datetime.datetime.strptime(date_str, date_pattern).date()
-        except Exception:
-            verbose_out(traceback.format_exc(), 4, sys.stderr)
-            msg = "Failure to parse date:  '{}' didn't adhere to pattern '{}'."
-            _match_failure_report(full_fn, msg.format(date_str, date_pattern))
-            return
-
-        (product, created) = mpo.update_or_create(
-                product=product, sensor=sensor, tile=tile, date=date,
-                driver=driver, name=full_fn)
-        product.save()
-        # TODO can subtract this item from starting_keys each time and possibly save some memory and time
-        touched_rows.add(product.pk)
-        if created:
-            counts['add'] += 1
-            verbose_out("Product added to database:  " + full_fn, 5)
-        else:
-            counts['update'] += 1
-            verbose_out("Product found in database:  " + full_fn, 5)
-
-    _chunky_transaction(glob.iglob(search_glob), rectify_product)
-
-    # Remove things from DB that are NOT in FS; do it in a loop to avoid an explosion.
-    print "Deleting stale product records . . . "
-    delete_start_time = time.time()
-    deletia_keys = starting_keys - touched_rows
-    _chunky_transaction(deletia_keys, lambda key: mpo.get(pk=key).delete())
-    delete_time = time.time() - delete_start_time
+    existing = {(product, tile, date, sensor): (pk, {'name': name})
+                for f in _scope_filters(scope)
+                for (pk, product, tile, date, sensor, name)
+                in mpo.filter(driver=driver, **f).values_list(
+                    'id', 'product', 'tile', 'date', 'sensor', 'name').iterator()}
 
-    del_cnt = len(deletia_keys)
-    print "Deleted {} stale product records in {:0.2f}s.".format(del_cnt, delete_time)
+    def write(inserts, updates):
+        with django.db.transaction.atomic():
+            mpo.bulk_create([
+                models.Product(driver=driver, product=product, tile=tile,
+                               date=date, sensor=sensor, **values)
+                for ((product, tile, date, sensor), values) in inserts])
+            for (pk, values) in updates:
+                mpo.filter(pk=pk).update(**values)
+
+    counts = _bulk_rectify('product', _product_rows(data_class, workers, scope),
+                           existing, write,
+                           lambda pks: mpo.filter(pk__in=pks).delete())
     msg = "{} complete, inventory records changed:  {} added, {} updated, {} deleted"
-    print msg.format(driver, counts['add'], counts['update'], del_cnt)
+    print msg.format(driver, *counts)
+
+
+# date directories modified up to this many seconds before the last rectify
+# began are visited again, allowing for clock skew on network filesystems
+_watermark_slack = 60
+
+
+def _watermark_path(repository):
+    return repository.path('rectify-watermark.json')
+
 
+def _read_watermark(repository):
+    """Return the start time of the last rectify, or None if unknown."""
+    try:
+        with open(_watermark_path(repository)) as f:
+            return json.load(f)['mtime']
+    except (IOError, ValueError, KeyError):
+        return None
 
+
+def _write_watermark(repository, mtime):
+    path = _watermark_path(repository)
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'mtime': mtime}, f)
+    os.rename(path + '.tmp', path)
+
+
+def _changed_scope(data_class, since):
+    """Return {tile: set(dates)} of date directories needing rectification.
+
+    These are the date directories modified after `since`, and the dates
+    the DB lists for tiles whose directories were modified after `since`
+    but which no longer have a date directory (eg it was deleted).
+    """
+    repo = data_class.Asset.Repository
+    driver = data_class.name.lower()
+    since -= _watermark_slack
+    changed = lambda path: os.stat(path).st_mtime > since
+    data_path = repo.data_path()
+    scope = defaultdict(set)
+
+    tiles_on_disk = [t for t in os.listdir(data_path)
+                     if os.path.isdir(os.path.join(data_path, t))]
+    changed_tiles = set()
+    for tile in tiles_on_disk:
+        tile_path = os.path.join(data_path, tile)
+        if changed(tile_path):
+            changed_tiles.add(tile)
+        for date_dir in os.listdir(tile_path):
+            path = os.path.join(tile_path, date_dir)
+            if not os.path.isdir(path) or not changed(path):
+                continue
+            try:
+                scope[tile].add(datetime.datetime.strptime(date_dir, repo._datedir).date())
+            except ValueError:
+                verbose_out('Skipping unrecognized directory ' + path, 3)
+    if changed(data_path): # look for removed tile directories
+        changed_tiles.update(t for t in list_tiles(driver) if t not in tiles_on_disk)
+
+    for tile in changed_tiles:
+        for date in list_dates(driver, tile):
+            if not os.path.isdir(repo.data_path(tile, date)):
+                scope[tile].add(date)
+    return dict(scope)
+
+
+def rectify(data_class, workers=1, full=False):
+    """Rectify the inventory DB's assets and products against the archive.
+
+    Unless full is set, and if a previous rectify recorded a watermark in
+    the driver's repository, only the date directories changed since that
+    rectify are rectified (see _changed_scope); otherwise the whole archive
+    is scanned.  The archive is scanned in `workers` threads.
+    """
+    repo = data_class.Asset.Repository
+    start_time = time.time()
+    since = None if full else _read_watermark(repo)
+    if since is None:
+        scope = None
+        print "Rectifying the whole archive"
+    else:
+        scope = _changed_scope(data_class, since)
+        print "Rectifying {} date directories changed since {}".format(
+                sum(len(dates) for dates in scope.values()), time.ctime(since))
+    if scope != {}:
+        print "Rectifying assets:"
+        rectify_assets(data_class.Asset, workers, scope)
+        print "Rectifying products:"
+        rectify_products(data_class, workers, scope)
+    _write_watermark(repo, start_time)
+
+
+@_backend_dispatch
 def list_tiles(driver):
     """List tiles for which there are extant asset files for the given driver."""
     from .models import Asset
@@ -182,6 +397,7 @@ def list_tiles(driver):
             'tile', flat=True).distinct().order_by('tile')
 
 
+@_backend_dispatch
 def list_dates(driver, tile):
     """For the given driver & tile, list dates for which assets exist."""
     from .models import Asset
@@ -189,6 +405,7 @@ def list_dates(driver, tile):
             'date', flat=True).distinct().order_by('date')
 
 
+@_backend_dispatch
 def add_asset(**values):
     """(very) thin convenience method that wraps models.Asset().save().
 
@@ -201,6 +418,7 @@ def add_asset(**values):
     return a # in case the user needs it
 
 
+@_backend_dispatch
 def add_product(**values):
     """(very) thin convenience method that wraps models.Product().save().
 
@@ -212,11 +430,13 @@ def add_product(**values):
     p.save()
     return p # in case the user needs it
 
+@_backend_dispatch
 def delete_product(**values):
     """Deletes the object found by get(**values)."""
     from .models import Product
     Product.objects.get(**values).delete()
 
+@_backend_dispatch
 def update_or_add_asset(driver, asset, tile, date, sensor, name):
     """Update an existing model or create it if it's not found.
 
@@ -235,6 +455,7 @@ def update_or_add_asset(driver, asset, tile, date, sensor, name):
     return asset # in case the user needs it
 
 
+@_backend_dispatch
 def update_or_add_product(driver, product, tile, date, sensor, name):
     """Update an existing model or create it if it's not found.
 
@@ -254,6 +475,7 @@ def update_or_add_product(driver, product, tile, date, sensor, name):
     return asset # in case the user needs it
 
 
+@_backend_dispatch
 def product_search(**criteria):
     """Perform a search for asset models matching the given criteria.
 
@@ -264,6 +486,7 @@ def product_search(**criteria):
     return models.Product.objects.filter(**criteria)
 
 
+@_backend_dispatch
 def asset_search(**criteria):
     """Perform a search for asset models matching the given criteria.
 
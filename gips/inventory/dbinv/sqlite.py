@@ -0,0 +1,338 @@
+"""Embedded SQLite backend for the GIPS inventory DB.
+
+Implements the dbinv.api functions with the standard library's sqlite3
+module, so a single-node deployment gets an indexed inventory without
+Django or a database server.  Select it with GIPS_INVENTORY_BACKEND =
+'sqlite' in the GIPS settings; the dbinv.api functions then route here.
+The database file is DATABASES['inventory']['NAME'].
+
+The tables match the ones Django creates for dbinv.models, so an existing
+Django-managed SQLite inventory can be opened by this backend as well.
+The database runs in WAL mode so readers don't block the writer, both
+tables are indexed on (driver, tile, date), and writes made inside
+batch() are committed together.
+"""
+
+import os, datetime, time, threading, sqlite3
+from collections import namedtuple
+from contextlib import contextmanager
+from operator import attrgetter
+
+from gips import utils
+from .api import _bulk_rectify, _asset_rows, _product_rows, _scope_filters
+
+
+_schema = (
+    """CREATE TABLE IF NOT EXISTS dbinv_asset (
+        id     INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+        driver TEXT NOT NULL,
+        asset  TEXT NOT NULL,
+        sensor TEXT NOT NULL,
+        tile   TEXT NOT NULL,
+        date   DATE NOT NULL,
+        name   TEXT NOT NULL,
+        UNIQUE (driver, asset, tile, date)
+    )""",
+    """CREATE TABLE IF NOT EXISTS dbinv_product (
+        id      INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+        driver  TEXT NOT NULL,
+        product TEXT NOT NULL,
+        sensor  TEXT NOT NULL,
+        tile    TEXT NOT NULL,
+        date    DATE NOT NULL,
+        name    TEXT NOT NULL,
+        UNIQUE (driver, product, sensor, tile, date)
+    )""",
+    'CREATE INDEX IF NOT EXISTS dbinv_asset_driver_tile_date'
+    ' ON dbinv_asset (driver, tile, date)',
+    'CREATE INDEX IF NOT EXISTS dbinv_product_driver_tile_date'
+    ' ON dbinv_product (driver, tile, date)',
+)
+
+# rows are returned as these instead of model instances
+Asset = namedtuple('Asset', 'id driver asset sensor tile date name')
+Product = namedtuple('Product', 'id driver product sensor tile date name')
+
+_tables = {Asset: 'dbinv_asset', Product: 'dbinv_product'}
+
+# stay well under SQLite's default limit of 999 parameters per statement
+_max_params = 500
+
+_local = threading.local() # sqlite3 connections can't be shared between threads
+
+
+class QueryResult(list):
+    """List of rows; order_by works like the QuerySet method of that name."""
+
+    def order_by(self, *fields):
+        return QueryResult(sorted(self, key=attrgetter(*fields)))
+
+
+def database_path():
+    """Return the path to the inventory's SQLite file."""
+    db = getattr(utils.settings(), 'DATABASES', {}).get('inventory', {})
+    engine = db.get('ENGINE', 'django.db.backends.sqlite3')
+    if not engine.endswith('sqlite3'):
+        raise ValueError("GIPS_INVENTORY_BACKEND = 'sqlite' requires an sqlite3"
+                         " inventory database, but its ENGINE is " + engine)
+    return db.get('NAME', '/tmp/gips-inv-db.sqlite3')
+
+
+def _connection():
+    """Return this thread's connection, opening it if needed."""
+    if getattr(_local, 'pid', None) != os.getpid(): # don't reuse a parent's
+        conn = sqlite3.connect(database_path(), timeout=60)
+        conn.text_factory = str
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        for statement in _schema:
+            conn.execute(statement)
+        conn.commit()
+        _local.conn, _local.pid, _local.depth = conn, os.getpid(), 0
+    return _local.conn
+
+
+@contextmanager
+def batch():
+    """Make all writes in the block in one transaction.
+
+    Batches nest; the outermost one commits on success & rolls back on
+    error.  Writes outside of any batch are committed immediately.
+    """
+    conn = _connection()
+    _local.depth += 1
+    try:
+        yield
+    except:
+        _local.depth -= 1
+        if _local.depth == 0:
+            conn.rollback()
+        raise
+    _local.depth -= 1
+    if _local.depth == 0:
+        conn.commit()
+
+
+def _write(sql, params=(), many=False):
+    """Run a write statement, committing unless a batch is in progress."""
+    conn = _connection()
+    cursor = (conn.executemany if many else conn.execute)(sql, params)
+    if _local.depth == 0:
+        conn.commit()
+    return cursor
+
+
+def _to_db(value):
+    if isinstance(value, datetime.datetime): # some drivers' assets have datetimes
+        value = value.date()
+    return value.isoformat() if isinstance(value, datetime.date) else value
+
+
+def _to_date(value):
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def _select(row_type, criteria):
+    """Return rows matching Django-style criteria (field=v or field__in=vs)."""
+    clauses, params, in_lists = [], [], []
+    for key, value in sorted(criteria.items()):
+        field, _, lookup = key.partition('__')
+        if field not in row_type._fields or lookup not in ('', 'in'):
+            raise ValueError('Unsupported inventory search criterion: ' + key)
+        if lookup == '':
+            clauses.append(field + '=?')
+            params.append(_to_db(value))
+            continue
+        values = list(set(_to_db(v) for v in value))
+        if len(values) == 0:
+            return QueryResult()
+        in_lists.append((field, values))
+
+    # split the longest list into chunks so no statement has too many parameters
+    in_lists.sort(key=lambda fv: len(fv[1]))
+    chunked_field, chunked_values = in_lists.pop() if in_lists else (None, [None])
+    for field, values in in_lists:
+        clauses.append(_in_clause(field, values))
+        params.extend(values)
+
+    sql = 'SELECT {} FROM {}'.format(', '.join(row_type._fields), _tables[row_type])
+    conn = _connection()
+    rows = QueryResult()
+    for i in range(0, len(chunked_values), _max_params):
+        chunk_clauses, chunk_params = list(clauses), list(params)
+        if chunked_field is not None:
+            chunk = chunked_values[i:i + _max_params]
+            chunk_clauses.append(_in_clause(chunked_field, chunk))
+            chunk_params.extend(chunk)
+        where = ' WHERE ' + ' AND '.join(chunk_clauses) if chunk_clauses else ''
+        for r in conn.execute(sql + where, chunk_params):
+            rows.append(row_type(*(r[:5] + (_to_date(r[5]), r[6]))))
+    return rows
+
+
+def _in_clause(field, values):
+    return '{} IN ({})'.format(field, ','.join('?' * len(values)))
+
+
+def asset_search(**criteria):
+    """Return the asset rows matching the given criteria; see _select."""
+    return _select(Asset, criteria)
+
+
+def product_search(**criteria):
+    """Return the product rows matching the given criteria; see _select."""
+    return _select(Product, criteria)
+
+
+def list_tiles(driver):
+    """List tiles for which there are extant asset files for the given driver."""
+    return [r[0] for r in _connection().execute(
+        'SELECT DISTINCT tile FROM dbinv_asset WHERE driver=? ORDER BY tile',
+        (driver,))]
+
+
+def list_dates(driver, tile):
+    """For the given driver & tile, list dates for which assets exist."""
+    return [_to_date(r[0]) for r in _connection().execute(
+        'SELECT DISTINCT date FROM dbinv_asset WHERE driver=? AND tile=?'
+        ' ORDER BY date', (driver, tile))]
+
+
+def _insert(row_type, values):
+    fields = [f for f in row_type._fields if f != 'id']
+    cursor = _write('INSERT INTO {} ({}) VALUES ({})'.format(
+        _tables[row_type], ', '.join(fields), ','.join('?' * len(fields))),
+        [_to_db(values[f]) for f in fields])
+    values = dict(values, id=cursor.lastrowid)
+    return row_type(**values)
+
+
+def add_asset(**values):
+    """Insert an asset row.
+
+    Arguments:  asset, sensor, tile, date, name, driver.
+    """
+    return _insert(Asset, values)
+
+
+def add_product(**values):
+    """Insert a product row.
+
+    Arguments:  driver, product, sensor, tile, date, name.
+    """
+    return _insert(Product, values)
+
+
+def delete_product(**values):
+    """Delete the one product row matching the given criteria."""
+    rows = product_search(**values)
+    if len(rows) != 1:
+        raise ValueError('Expected one product matching {}, found {}'.format(
+            values, len(rows)))
+    _write('DELETE FROM dbinv_product WHERE id=?', (rows[0].id,))
+
+
+def _update_or_add(row_type, query_vals, update_vals):
+    """Update the row matching query_vals, or add it if there isn't one."""
+    table = _tables[row_type]
+    where = ' AND '.join(k + '=?' for k in sorted(query_vals))
+    where_params = [_to_db(query_vals[k]) for k in sorted(query_vals)]
+    with batch():
+        cursor = _write('UPDATE {} SET {} WHERE {}'.format(
+            table, ', '.join(k + '=?' for k in sorted(update_vals)), where),
+            [update_vals[k] for k in sorted(update_vals)] + where_params)
+        if cursor.rowcount == 0:
+            return _insert(row_type, dict(query_vals, **update_vals))
+        row_id = _connection().execute(
+            'SELECT id FROM {} WHERE {}'.format(table, where),
+            where_params).fetchone()[0]
+    return row_type(id=row_id, **dict(query_vals, **update_vals))
+
+
+def update_or_add_asset(driver, asset, tile, date, sensor, name):
+    """Update an existing asset row or add it if it's not found.
+
+    The first four arguments identify the row.
+    """
+    return _update_or_add(
+        Asset, {'driver': driver, 'asset': asset, 'tile': tile, 'date': date},
+        {'sensor': sensor, 'name': name})
+
+
+def update_or_add_product(driver, product, tile, date, sensor, name):
+    """Update an existing product row or add it if it's not found.
+
+    The first five arguments identify the row.
+    """
+    return _update_or_add(
+        Product, {'driver': driver, 'product': product, 'tile': tile,
+                  'date': date, 'sensor': sensor},
+        {'name': name})
+
+
+def _delete_ids(table, ids):
+    with batch():
+        _write('DELETE FROM {} WHERE {}'.format(table, _in_clause('id', ids)), ids)
+
+
+def rectify_assets(asset_class, workers=1, scope=None):
+    """Rectify the asset inventory database against the filesystem archive.
+
+    For the current driver, go through each asset in the filesystem
+    and ensure it has an entry in the inventory database.  Also
+    remove any database entries that match no archived files.  The
+    archive is scanned in `workers` threads.  If scope, a dict of
+    tile: dates, is given, only those date directories are rectified.
+    """
+    driver = asset_class.Repository.name.lower()
+    start_time = time.time()
+    for (ak, av) in asset_class._assets.items():
+        print "Starting on {} assets at {:0.2f}s".format(ak, time.time() - start_time)
+        existing = {(r.tile, r.date): (r.id, {'sensor': r.sensor, 'name': r.name})
+                    for f in _scope_filters(scope)
+                    for r in asset_search(driver=driver, asset=ak, **f)}
+
+        def write(inserts, updates):
+            with batch():
+                _write('INSERT INTO dbinv_asset (driver, asset, sensor, tile, date, name)'
+                       ' VALUES (?, ?, ?, ?, ?, ?)',
+                       [(driver, ak, v['sensor'], tile, _to_db(date), v['name'])
+                        for ((tile, date), v) in inserts], many=True)
+                _write('UPDATE dbinv_asset SET sensor=?, name=? WHERE id=?',
+                       [(v['sensor'], v['name'], pk) for (pk, v) in updates], many=True)
+
+        counts = _bulk_rectify(ak, _asset_rows(asset_class, av['pattern'], workers, scope),
+                               existing, write,
+                               lambda ids: _delete_ids('dbinv_asset', ids))
+        msg = "{} complete, inventory records changed:  {} added, {} updated, {} deleted"
+        print msg.format(ak, *counts) # no -v for this important data
+
+
+def rectify_products(data_class, workers=1, scope=None):
+    """Rectify the product inventory database against the filesystem archive.
+
+    For the current driver, go through each product in the filesystem
+    and ensure it has an entry in the inventory database.  Also
+    remove any database entries that match no extant file.  The archive
+    is scanned in `workers` threads.  If scope, a dict of tile: dates,
+    is given, only those date directories are rectified.
+    """
+    driver = data_class.name.lower()
+    existing = {(r.product, r.tile, r.date, r.sensor): (r.id, {'name': r.name})
+                for f in _scope_filters(scope)
+                for r in product_search(driver=driver, **f)}
+
+    def write(inserts, updates):
+        with batch():
+            _write('INSERT INTO dbinv_product (driver, product, sensor, tile, date, name)'
+                   ' VALUES (?, ?, ?, ?, ?, ?)',
+                   [(driver, product, sensor, tile, _to_db(date), v['name'])
+                    for ((product, tile, date, sensor), v) in inserts], many=True)
+            _write('UPDATE dbinv_product SET name=? WHERE id=?',
+                   [(v['name'], pk) for (pk, v) in updates], many=True)
+
+    counts = _bulk_rectify('product', _product_rows(data_class, workers, scope),
+                           existing, write,
+                           lambda ids: _delete_ids('dbinv_product', ids))
+    msg = "{} complete, inventory records changed:  {} added, {} updated, {} deleted"
+    print msg.format(driver, *counts)
@@ -0,0 +1,118 @@
+"""Reading product values at points & small polygons from tile files.
+
+Instead of mosaicking every date's tiles and sampling the mosaics, each
+tile's product files are opened directly and only the window of pixels
+covering each feature is read.  A point takes the value of the pixel it
+falls in; a polygon takes the mean of the valid pixels whose centers it
+contains, or if it contains none, of the pixel its centroid falls in.
+Images are assumed to be north up, as GIPS products are.  Polygons'
+pixels are found by rasterizing them, and each feature's mask is kept
+for every grid it's been read on, as all products and dates of a tile
+share one.
+"""
+
+import math
+
+import numpy
+from osgeo import gdal, ogr, osr
+import gippy
+
+
+class Targets(object):
+    """ Features to extract values for, warped on demand to each image's projection """
+
+    def __init__(self, features):
+        """ features are gippy GeoFeatures; each is identified by its Value() """
+        self.features = [(f.Value(), f.WKT(), f.Projection()) for f in features]
+        self._warped = {}
+        self._masks = {}
+
+    def __len__(self):
+        return len(self.features)
+
+    def warped(self, projection):
+        """ List of (key, ogr geometry, envelope) in projection """
+        if projection not in self._warped:
+            target = osr.SpatialReference(projection)
+            warped = []
+            for key, wkt, fproj in self.features:
+                geom = ogr.CreateGeometryFromWkt(wkt)
+                geom.Transform(osr.CoordinateTransformation(osr.SpatialReference(fproj), target))
+                warped.append((key, geom, geom.GetEnvelope()))
+            self._warped[projection] = warped
+        return self._warped[projection]
+
+    def mask(self, projection, affine, win, key, geom):
+        """ pixel_mask of the feature, cached per grid & window """
+        mkey = (projection, tuple(affine[:6]), tuple(win), key)
+        if mkey not in self._masks:
+            self._masks[mkey] = pixel_mask(affine, win, geom)
+        return self._masks[mkey]
+
+
+def window(affine, xsize, ysize, envelope):
+    """ Pixel window [x, y, w, h] covering envelope (minx, maxx, miny, maxy), or None """
+    x0, dx, _, y0, _, dy = affine[:6]
+    cols = sorted(((envelope[0] - x0) / dx, (envelope[1] - x0) / dx))
+    rows = sorted(((envelope[2] - y0) / dy, (envelope[3] - y0) / dy))
+    c0, c1 = int(math.floor(cols[0])), int(math.floor(cols[1]))
+    r0, r1 = int(math.floor(rows[0])), int(math.floor(rows[1]))
+    if c1 < 0 or r1 < 0 or c0 >= xsize or r0 >= ysize:
+        return None
+    c0, r0 = max(c0, 0), max(r0, 0)
+    c1, r1 = min(c1, xsize - 1), min(r1, ysize - 1)
+    return [c0, r0, c1 - c0 + 1, r1 - r0 + 1]
+
+
+def pixel_mask(affine, win, geom):
+    """ Mask of the pixels in win to use for geom (see module docstring) """
+    x0, dx, _, y0, _, dy = affine[:6]
+    mask = numpy.zeros((win[3], win[2]), dtype='bool')
+    if geom.GetDimension() == 0:
+        points = [geom.GetGeometryRef(i) for i in range(geom.GetGeometryCount())] or [geom]
+    else:
+        if geom.GetDimension() == 2:
+            mask = rasterize(affine, win, geom)
+            if mask.any():
+                return mask
+        points = [geom.Centroid()]
+    for p in points:
+        c = int(math.floor((p.GetX() - x0) / dx)) - win[0]
+        r = int(math.floor((p.GetY() - y0) / dy)) - win[1]
+        if 0 <= r < win[3] and 0 <= c < win[2]:
+            mask[r, c] = True
+    return mask
+
+
+def rasterize(affine, win, geom):
+    """ Mask of the pixels in win whose centers geom contains """
+    x0, dx, _, y0, _, dy = affine[:6]
+    mem = ogr.GetDriverByName('Memory').CreateDataSource('target')
+    layer = mem.CreateLayer('target', None, ogr.wkbUnknown)
+    feat = ogr.Feature(layer.GetLayerDefn())
+    feat.SetGeometry(geom)
+    layer.CreateFeature(feat)
+    ds = gdal.GetDriverByName('MEM').Create('', win[2], win[3], 1, gdal.GDT_Byte)
+    ds.SetGeoTransform([x0 + win[0] * dx, dx, 0, y0 + win[1] * dy, 0, dy])
+    gdal.RasterizeLayer(ds, [1], layer, burn_values=[1])
+    mask = ds.GetRasterBand(1).ReadAsArray().astype('bool')
+    ds = None
+    return mask
+
+
+def sample(img, targets):
+    """ Yield (key, band, value) for each target feature that img has valid pixels for """
+    affine = img.Affine()
+    projection = img.Projection()
+    for key, geom, envelope in targets.warped(projection):
+        win = window(affine, img.XSize(), img.YSize(), envelope)
+        if win is None:
+            continue
+        mask = targets.mask(projection, affine, win, key, geom)
+        if not mask.any():
+            continue
+        for band in img:
+            arr = numpy.array(band.Read(gippy.Recti(*win)), dtype='float64').reshape(mask.shape)
+            values = arr[mask & (arr != band.NoDataValue()) & ~numpy.isnan(arr)]
+            if values.size > 0:
+                yield key, band.Description(), values.mean()
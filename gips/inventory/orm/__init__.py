@@ -2,8 +2,6 @@ import os, sys
 from contextlib import contextmanager
 import traceback
 
-import django
-
 from gips import utils
 
 
@@ -14,6 +12,14 @@ def use_orm():
     """
     return getattr(utils.settings(), 'GIPS_ORM', True)
 
+def inventory_backend():
+    """Check GIPS_INVENTORY_BACKEND for which inventory DB to use.
+
+    'django' (the default) uses the Django ORM; 'sqlite' uses the
+    embedded backend in dbinv.sqlite, which needs no Django setup.
+    """
+    return getattr(utils.settings(), 'GIPS_INVENTORY_BACKEND', 'django')
+
 setup_complete = False
 driver_for_dbinv_feature_toggle = 'unspecified'
 
@@ -31,7 +37,11 @@ def setup():
             raise Exception("Inventory database does not support '{}'.  Set"
                     " GIPS_ORM = False to use the filesystem inventory"
                     " instead.".format(driver_for_dbinv_feature_toggle))
+        if inventory_backend() == 'sqlite':
+            setup_complete = True
+            return
         with utils.error_handler("Error initializing Django ORM"):
+            import django
             os.environ.setdefault("DJANGO_SETTINGS_MODULE", "gips.inventory.orm.settings")
             django.setup()
     setup_complete = True
@@ -21,12 +21,29 @@
 #   along with this program. If not, see <http://www.gnu.org/licenses/>
 ################################################################################
 
+import ctypes
 import numpy
 import multiprocessing
+from multiprocessing.sharedctypes import RawArray
 
 
 def _worker(chunk):
     """ Worker function (has access to global variables set in _mr_init """
+    output = _process(chunk)
+
+    # write using write function if provided
+    if wfunc is not None:
+        wfunc((output, chunk))
+        return None
+    elif sharedout is not None:
+        sharedout[:, chunk[1]:chunk[1] + chunk[3], chunk[0]:chunk[0] + chunk[2]] = output
+        return None
+    else:
+        return output
+
+
+def _process(chunk):
+    """ Read and process a chunk, returning its output """
     # read chunk of data and make sure it is 3-D: BxYxX
     data = rfunc(chunk)
     shape = data.shape
@@ -35,61 +52,125 @@ def _worker(chunk):
         shape = data.shape
 
     # make output array for this chunk
-    output = numpy.empty((outshape[0], shape[1], shape[2]))
-    output[:] = numpy.nan
+    output = numpy.empty((outshape[0], shape[1], shape[2]), dtype=outdtype)
+    output.fill(outnodata)
 
-    # only run on valid pixel signatures unless keepnodata set
-    if keepnodata:
-        valid = numpy.ones((shape[1], shape[2])).astype('bool')
+    # run processing function, only on valid pixel signatures unless keepnodata set
+    if keepnodata or data.dtype.kind not in 'fc':
+        output[:] = pfunc(data.reshape((shape[0], -1))).reshape(output.shape)
     else:
-        valid = numpy.all(~numpy.isnan(data), axis=0)
+        valid = _valid_mask(data)
+        output[:, valid] = pfunc(data[:, valid])
+    return output
 
-    # run processing function
-    output[:, valid] = pfunc(data[:, valid])
 
-    # write using write function if provided
-    if wfunc is not None:
-        wfunc((output, chunk))
-        return None
-    else:
-        return output
+def _valid_mask(data):
+    """ Mask of pixels with no NaN in any band, reusing the mask buffers between chunks """
+    global _maskbufs
+    shape = data.shape[1:]
+    if _maskbufs is None or _maskbufs[0].shape != shape:
+        _maskbufs = (numpy.empty(shape, dtype='bool'), numpy.empty(shape, dtype='bool'))
+    valid, isnan = _maskbufs
+    valid.fill(True)
+    for band in data:
+        numpy.isnan(band, out=isnan)
+        valid &= ~isnan
+    return valid
+
+
+def _fill_value(dtype, nodata=None):
+    """ Value for output pixels with no result, NaN for floats or 0 if nodata isn't given """
+    if nodata is not None:
+        return nodata
+    return numpy.nan if numpy.dtype(dtype).kind in 'fc' else 0
+
+
+def _chunk_worker(chunk):
+    """ Process a chunk, returning it along with its output """
+    return chunk, _process(chunk)
 
 
 class MapReduce(object):
     """ General purpose class for performing map reduction functions """
 
-    def __init__(self, inshape, outshape, rfunc, pfunc, wfunc=None, nproc=2, keepnodata=False):
-        """ Create multiprocessing pool """
+    def __init__(self, inshape, outshape, rfunc, pfunc, wfunc=None, nproc=2, keepnodata=False,
+                 shared=False, outdtype='float64', nodata=None):
+        """ Create multiprocessing pool
+
+        The output is of type outdtype, with pixels that aren't processed set
+        to nodata (by default NaN for floats and 0 otherwise).
+        If shared is set, the output is allocated once in shared memory before
+        the workers are forked; they write their chunks straight into it
+        instead of sending them back to be copied into a new array.
+        """
         self.inshape = inshape
         self.outshape = outshape
+        self.outdtype = numpy.dtype(outdtype)
+        self.nodata = _fill_value(outdtype, nodata)
+        self.output = None
+        sharedbuf = None
+        if shared:
+            sharedbuf = RawArray(ctypes.c_char, int(numpy.prod(outshape)) * self.outdtype.itemsize)
+            self.output = self._shared_view(sharedbuf, outshape, self.outdtype)
         self.pool = multiprocessing.Pool(nproc, initializer=self._mr_init,
-                                         initargs=(inshape, outshape, rfunc, pfunc, wfunc, keepnodata))
+                                         initargs=(inshape, outshape, rfunc, pfunc, wfunc, keepnodata,
+                                                   sharedbuf, self.outdtype, self.nodata))
 
     def run(self, nchunks=100, chunks=None):
-        """ Run the multiprocessing pool """
+        """ Run the multiprocessing pool over chunks (see chunk & plan_chunks) """
         if chunks is None:
             self.chunks = self.chunk(self.inshape, nchunks=nchunks)
         else:
             self.chunks = chunks
         self.dataparts = self.pool.map(_worker, self.chunks)
 
+    def stream(self, writer, nchunks=100, chunks=None):
+        """ Run the multiprocessing pool, passing each chunk's output to writer
+
+        writer(output, chunk) is called in this process as each chunk finishes,
+        in no particular order, so it is the output's only writer and outputs
+        aren't kept once written.  Outputs are always passed to writer, so
+        aren't also written into a shared output or by wfunc.
+        """
+        if chunks is None:
+            self.chunks = self.chunk(self.inshape, nchunks=nchunks)
+        else:
+            self.chunks = chunks
+        for chunk, output in self.pool.imap_unordered(_chunk_worker, self.chunks):
+            writer(output, chunk)
+
     def assemble(self):
         """ Reassemble output parts into single array """
-        dataout = numpy.empty(self.outshape)
+        if self.output is not None:
+            return self.output.squeeze()
+        dataout = numpy.empty(self.outshape, dtype=self.outdtype)
         for i, ch in enumerate(self.chunks):
             dataout[:, ch[1]:ch[1] + ch[3], ch[0]:ch[0] + ch[2]] = self.dataparts[i]
         return dataout.squeeze()
 
     @staticmethod
-    def _mr_init(_inshape, _outshape, _rfunc, _pfunc, _wfunc, _keepnodata):
+    def _mr_init(_inshape, _outshape, _rfunc, _pfunc, _wfunc, _keepnodata, _sharedbuf=None,
+                 _outdtype='float64', _nodata=None):
         """ Initializer sets globals for processes """
-        global inshape, outshape, rfunc, pfunc, wfunc, keepnodata
+        global inshape, outshape, rfunc, pfunc, wfunc, keepnodata, sharedout
+        global outdtype, outnodata, _maskbufs
         inshape = _inshape
         outshape = _outshape
         rfunc = _rfunc
         pfunc = _pfunc
         wfunc = _wfunc
         keepnodata = _keepnodata
+        outdtype = numpy.dtype(_outdtype)
+        outnodata = _fill_value(outdtype, _nodata)
+        _maskbufs = None
+        sharedout = None
+        if _sharedbuf is not None:
+            sharedout = MapReduce._shared_view(_sharedbuf, _outshape, outdtype)
+
+    @staticmethod
+    def _shared_view(sharedbuf, shape, dtype='float64'):
+        """ Numpy array of the given shape backed by a shared memory buffer """
+        return numpy.frombuffer(sharedbuf, dtype=dtype).reshape(shape)
 
     @staticmethod
     def chunk(shape, nchunks=100):
@@ -104,6 +185,43 @@ class MapReduce(object):
             chunks.append([0, sum(chszs[:ichunk]), shape[2], chszs[ichunk]])
         return chunks
 
+    @staticmethod
+    def plan_chunks(shape, numbands=1, memory=128.0, indtype='float64', outdtype='float64',
+                    blocksize=None, minchunks=1):
+        """ Create 2-D chunks of input data size (B x Y x X) within a memory budget
+
+        memory is the budget for each chunk in MB, counting roughly two copies
+        of the input (as read, and its valid pixels) and two of the output
+        (as allocated, and as returned by the processing function).  Chunks
+        are whole multiples of blocksize, the (X, Y) block size of the files
+        read, so no block is read by two workers; full-width strips are used
+        unless a strip of one block row doesn't fit.  The strips are made
+        thinner if needed to give at least minchunks chunks.
+        """
+        nbands, ysize, xsize = shape
+        bx, by = blocksize if blocksize is not None else (xsize, 1)
+        bx, by = min(bx, xsize), min(by, ysize)
+        pixelsize = (2 * nbands * numpy.dtype(indtype).itemsize
+                     + 2 * numbands * numpy.dtype(outdtype).itemsize)
+        maxpixels = max(int(memory * 2 ** 20 / pixelsize), 1)
+
+        if maxpixels >= xsize * by:
+            width = xsize
+            height = max(maxpixels // xsize // by, 1) * by
+            # make strips thinner for parallelism, keeping them block-aligned
+            nstrips = -(-ysize // max(by, 1)) # number of block rows
+            height = min(height, -(-nstrips // minchunks) * by)
+        else:
+            height = by
+            width = max(maxpixels // by // bx, 1) * bx
+        height, width = min(height, ysize), min(width, xsize)
+
+        chunks = []
+        for y in range(0, ysize, height):
+            for x in range(0, xsize, width):
+                chunks.append([x, y, min(width, xsize - x), min(height, ysize - y)])
+        return chunks
+
     @staticmethod
     def get_shapes(arrin, numbands):
         """ Create in and out shapes based on input array and output numbands) """
@@ -115,19 +233,32 @@ class MapReduce(object):
         return (inshape, outshape)
 
 
-def map_reduce_array(arrin, pfunc, numbands=1, nchunks=100, nproc=2, keepnodata=False):
-    """ Apply user defined pfunc to a numpy array using multiple processors """
+def map_reduce_array(arrin, pfunc, numbands=1, nchunks=None, nproc=2, keepnodata=False,
+                     shared=False, memory=128.0, outdtype='float64', nodata=None):
+    """ Apply user defined pfunc to a numpy array using multiple processors
+
+    Unless nchunks is given, chunks are planned to use about memory MB each
+    (see MapReduce.plan_chunks).  Set shared to have the workers write into
+    one shared output array.  The output is of type outdtype, with nodata
+    where pfunc wasn't run (see MapReduce).
+    """
     (inshape, outshape) = MapReduce.get_shapes(arrin, numbands)
 
     # read data from global input array
     rfunc = lambda chunk: arrin[:, chunk[1]:chunk[1] + chunk[3], chunk[0]:chunk[0] + chunk[2]]
 
-    mr = MapReduce(inshape, outshape, rfunc=rfunc, pfunc=pfunc, nproc=nproc, keepnodata=keepnodata)
-    mr.run(nchunks=nchunks)
+    mr = MapReduce(inshape, outshape, rfunc=rfunc, pfunc=pfunc, nproc=nproc, keepnodata=keepnodata,
+                   shared=shared, outdtype=outdtype, nodata=nodata)
+    chunks = None
+    if nchunks is None:
+        chunks = MapReduce.plan_chunks(inshape, numbands, memory, indtype=arrin.dtype,
+                                       outdtype=outdtype, minchunks=nproc)
+    mr.run(nchunks=nchunks, chunks=chunks)
     return mr.assemble()
 
 
-def _test_map_reduce_array(arrin, pfunc, numbands=1, nchunks=100, nproc=2, keepnodata=False):
+def _test_map_reduce_array(arrin, pfunc, numbands=1, nchunks=100, nproc=2, keepnodata=False,
+                           outdtype='float64', nodata=None):
     """ Test map_reduce_array functions without using multiprocessing """
 
     (inshape, outshape) = MapReduce.get_shapes(arrin, numbands)
@@ -137,9 +268,9 @@ def _test_map_reduce_array(arrin, pfunc, numbands=1, nchunks=100, nproc=2, keepn
 
     chunks = MapReduce.chunk(inshape, nchunks=nchunks)
 
-    MapReduce._mr_init(inshape, outshape, rfunc, pfunc, None, keepnodata)
+    MapReduce._mr_init(inshape, outshape, rfunc, pfunc, None, keepnodata, None, outdtype, nodata)
 
-    dataout = numpy.empty(outshape)
+    dataout = numpy.empty(outshape, dtype=outdtype)
     for ch in chunks:
         dataout[:, ch[1]:ch[1] + ch[3], ch[0]:ch[0] + ch[2]] = _worker(ch)
     return dataout
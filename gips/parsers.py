@@ -98,6 +98,12 @@ class GIPSParser(argparse.ArgumentParser):
         group.add_argument('--size', help='Compute size of data specified (MiB)',
                            default=False, action='store_true')
         group.add_argument('--update', help='Force fetch and/ or update data (if supported)', default=False, action='store_true')
+        h = ('Number of assets to fetch concurrently (defaults to the'
+             ' driver\'s \'fetch-workers\' setting, normally 1)')
+        group.add_argument('--fetch-workers', help=h, default=None, type=int)
+        h = ('Search for each date\'s data only when it is needed, releasing'
+             ' it afterwards; bounds memory & startup time for large inventories')
+        group.add_argument('--lazy', help=h, default=False, action='store_true')
         parser.add_argument(
             '--chunksize', help='Chunk size in MB', default=128.0, type=float
         )
@@ -124,6 +130,9 @@ class GIPSParser(argparse.ArgumentParser):
              '\'chunksize\', and `\format\' are passed through.  '
              '\'numprocs\' is set to 1.')
         group.add_argument('--batchout', help=h, default=None)
+        h = ('Number of (tile, date) units to process concurrently, each in'
+             ' its own process (compare --numprocs, which is passed to gippy)')
+        group.add_argument('--workers', help=h, default=1, type=int)
         self.parent_parsers.append(parser)
         return parser
 
@@ -160,6 +169,18 @@ class GIPSParser(argparse.ArgumentParser):
         group.add_argument('--crop', help=h, default=False, action='store_true')
         h = 'Crop out spatial extent to include all pixels touched by the polygons(s)'
         group.add_argument('--alltouch', help=h, default=False, action='store_true')
+        h = ('Working memory in MB for gdalwarp when mosaicking to a raster mask'
+             ' (defaults to the GIPS_WARP_MEMORY setting, else gdalwarp\'s default)')
+        group.add_argument('--warp-memory', help=h, default=None, type=int)
+        h = ('Threads gdalwarp warps with when mosaicking to a raster mask, or ALL_CPUS'
+             ' (defaults to the GIPS_WARP_THREADS setting, else 1)')
+        group.add_argument('--warp-threads', help=h, default=None)
+        h = ('Creation options (NAME=VALUE) of files mosaicked to a raster mask'
+             ' (defaults to the GIPS_WARP_CREATION_OPTIONS setting)')
+        group.add_argument('--co', help=h, nargs='*', default=None, dest='creation_options')
+        h = ('GDAL block cache size in MB, for all warping including --res'
+             ' (defaults to the GIPS_GDAL_CACHEMAX setting, else GDAL\'s default)')
+        group.add_argument('--gdal-cachemax', help=h, default=None, type=int)
         self.parent_parsers.append(parser)
         return parser
 
@@ -188,7 +209,7 @@ class GIPSParser(argparse.ArgumentParser):
 
 
 def set_gippy_options(args):
-    """ Set gippy options from parsed command line arguments """
+    """ Set gippy & GDAL warp options from parsed command line arguments """
     if 'verbose' in args:
         gippy.Options.SetVerbose(args.verbose)
     if 'format' in args:
@@ -197,3 +218,6 @@ def set_gippy_options(args):
         gippy.Options.SetChunkSize(args.chunksize)
     if 'numprocs' in args:
         gippy.Options.SetNumCores(args.numprocs)
+    if 'warp_memory' in args:
+        utils.set_warp_options(args.warp_memory, args.warp_threads,
+                               args.creation_options, args.gdal_cachemax)
@@ -57,9 +57,10 @@ def main():
 
         # if DB inventory is enabled, update it to contain the newly archived assets
         if orm.use_orm():
-            for a in archived_assets:
-                dbinv.update_or_add_asset(asset=a.asset, sensor=a.sensor, tile=a.tile, date=a.date,
-                                          name=a.archived_filename, driver=cls.name.lower())
+            with dbinv.batch():
+                for a in archived_assets:
+                    dbinv.update_or_add_asset(asset=a.asset, sensor=a.sensor, tile=a.tile, date=a.date,
+                                              name=a.archived_filename, driver=cls.name.lower())
 
     utils.gips_exit()
 
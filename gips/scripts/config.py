@@ -25,8 +25,6 @@ import os, sys
 import pprint
 import traceback
 
-import django
-from django.core.management import call_command
 
 import gips
 from gips import __version__ as version
@@ -40,6 +38,9 @@ def migrate_database():
     """Migrate the database if the ORM is turned on."""
     if not orm.use_orm():
         return
+    if orm.inventory_backend() == 'sqlite':
+        return # the embedded backend creates its tables as needed
+    from django.core.management import call_command
     print 'Migrating database'
     orm.setup()
     call_command('migrate', interactive=False)
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+################################################################################
+#    GIPS: Geospatial Image Processing System
+#
+#    AUTHOR: Matthew Hanson
+#    EMAIL:  matt.a.hanson@gmail.com
+#
+#    Copyright (C) 2014-2018 Applied Geosolutions
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>
+################################################################################
+
+from gips.parsers import GIPSParser
+from gips.inventory import ProjectInventory
+from gips.utils import Colors, VerboseOut
+from gips import utils
+
+__version__ = '0.1.0'
+
+
+def main():
+    title = Colors.BOLD + 'GIPS Project Time Series Cubes (v%s)' % __version__ + Colors.OFF
+
+    parser = GIPSParser(datasources=False, description=title)
+    parser.add_projdir_parser()
+    group = parser.add_argument_group('cube options')
+    h = 'Rebuild products even if the cube of them is up to date'
+    group.add_argument('--overwrite', help=h, default=False, action='store_true')
+    args = parser.parse_args()
+
+    utils.gips_script_setup(None, args.stop_on_error)
+
+    with utils.error_handler('Cube error'):
+        VerboseOut(title)
+        for projdir in args.projdir:
+            VerboseOut('Building time series cube of %s' % projdir)
+            inv = ProjectInventory(projdir, args.products)
+            inv.build_cube(overwrite=args.overwrite)
+
+    utils.gips_exit()
+
+
+if __name__ == "__main__":
+    main()
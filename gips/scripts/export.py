@@ -110,6 +110,7 @@ def run_export(args):
                         datadir=datadir, tree=args.tree, overwrite=args.overwrite,
                         res=args.res, interpolation=args.interpolation,
                         crop=args.crop, alltouch=args.alltouch,
+                        workers=args.mosaic_workers, process_workers=args.workers,
                     )
                     inv = ProjectInventory(datadir)
                     inv.pprint()
@@ -143,7 +144,11 @@ def main():
     parser0 = GIPSParser(description=title)
     parser0.add_inventory_parser(site_required=True)
     parser0.add_process_parser()
-    parser0.add_project_parser()
+    parser = parser0.add_project_parser()
+    group = parser.add_argument_group('mosaic options')
+    h = ('Number of (date, sensor, product) mosaics to create concurrently, each in'
+         ' its own process (compare --workers, used for processing)')
+    group.add_argument('--mosaic-workers', help=h, default=1, type=int)
     parser0.add_warp_parser()
     args = parser0.parse_args()
 
@@ -64,6 +64,8 @@ def main(jobid):
     args.pclouds = 100.
     args.chunksize = 128.0
     args.numprocs = 1
+    args.workers = 1
+    args.mosaic_workers = 1
     args.notld = True
     args.fetch = True
     args.crop = False
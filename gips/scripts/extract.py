@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+################################################################################
+#    GIPS: Geospatial Image Processing System
+#
+#    AUTHOR: Matthew Hanson
+#    EMAIL:  matt.a.hanson@gmail.com
+#
+#    Copyright (C) 2014-2018 Applied Geosolutions
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>
+################################################################################
+
+from __future__ import print_function
+
+import csv
+
+from gips import __version__
+from gips.parsers import GIPSParser
+from gips.core import SpatialExtent, TemporalExtent
+from gips.utils import Colors, VerboseOut
+from gips import utils
+from gips.inventory import DataInventory
+
+
+def run_extract(args):
+
+    cls = utils.gips_script_setup(args.command, args.stop_on_error)
+
+    with utils.error_handler():
+        features = list(utils.open_vector(args.site, args.key, args.where))
+        # one inventory over every tile any feature touches
+        tiles = set()
+        for coverage in cls.Asset.Repository.vector2tiles_many(
+                features, args.pcov, args.ptile, args.tiles):
+            tiles.update(coverage)
+        VerboseOut('Extracting {} features from {} tiles'.format(len(features), len(tiles)), 2)
+        extent = SpatialExtent(cls, tiles=sorted(tiles), pcov=args.pcov, ptile=args.ptile)
+        inv = DataInventory(cls, extent, TemporalExtent(args.dates, args.days), **vars(args))
+
+        with open(args.outfile, 'w') as f:
+            writer = csv.writer(f, **getattr(utils.settings(), 'STATS_FORMAT', {}))
+            writer.writerow(['feature', 'date', 'product', 'band', 'value'])
+            for (key, date, product, band, value) in inv.extract(features):
+                writer.writerow([key, date.strftime('%Y-%j'), product, band, value])
+
+
+def main():
+    title = Colors.BOLD + 'GIPS Data Extraction (v%s)' % __version__ + Colors.OFF
+    print(title)
+
+    parser0 = GIPSParser(description=title)
+    parser = parser0.add_inventory_parser(site_required=True)
+    group = parser.add_argument_group('extraction options')
+    h = ('CSV file for the values, one row per feature, date, product, and band;'
+         ' a polygon\'s value is the mean of its pixels')
+    group.add_argument('--outfile', help=h, default='extract.csv')
+    args = parser0.parse_args()
+
+    run_extract(args)
+
+    utils.gips_exit() # produce a summary error report then quit with a proper exit status
+
+
+if __name__ == "__main__":
+    main()
@@ -34,6 +34,9 @@ desired, eg:
 
     gips_inventory modis --rectify
     gips_inventory prism --rectify
+
+After the first rectify, only date directories modified since the previous
+one are visited; add --full to rescan the whole archive.
 """
 
 from __future__ import print_function
@@ -60,6 +63,11 @@ def main():
                             'database by comparing it against the present state of the data repos.',
                        action='store_true',
                        default=False)
+    group.add_argument('--rectify-workers', type=int, default=1,
+                       help='Number of threads scanning the archive during --rectify')
+    group.add_argument('--full', action='store_true', default=False,
+                       help='With --rectify, scan the whole archive instead of only the '
+                            'date directories changed since the last rectify')
     args = parser0.parse_args()
 
     cls = utils.gips_script_setup(args.command, args.stop_on_error)
@@ -74,14 +82,11 @@ def main():
                                  " GIPS_ORM = True.")
             for k, v in vars(args).items():
                 # Let the user know not to expect other options to effect rectify
-                if v and k not in ('rectify', 'verbose', 'command'):
+                if v and k not in ('rectify', 'rectify_workers', 'full', 'verbose', 'command'):
                     msg = "INFO: Option '--{}' is has no effect on --rectify."
                     utils.verbose_out(msg.format(k), 1)
             print("Rectifying inventory DB with filesystem archive:")
-            print("Rectifying assets:")
-            dbinv.rectify_assets(cls.Asset)
-            print("Rectifying products:")
-            dbinv.rectify_products(cls)
+            dbinv.rectify(cls, args.rectify_workers, args.full)
             return
 
         extents = SpatialExtent.factory(
@@ -81,7 +81,7 @@ def main():
                 )
 
             else:
-                inv.process(overwrite=args.overwrite)
+                inv.process(overwrite=args.overwrite, workers=args.workers)
         if args.batchout:
             with open(args.batchout, 'w') as ofile:
                 ofile.writelines(tdl)
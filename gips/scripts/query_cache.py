@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+################################################################################
+#    GIPS: Geospatial Image Processing System
+#
+#    AUTHOR: Matthew Hanson
+#    EMAIL:  matt.a.hanson@gmail.com
+#
+#    Copyright (C) 2014-2018 Applied Geosolutions
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>
+################################################################################
+
+from datetime import datetime
+
+from gips import __version__ as gipsversion
+from gips.parsers import GIPSParser
+from gips.utils import Colors
+from gips import utils
+from gips.data import query_cache
+
+
+def main():
+    title = Colors.BOLD + 'GIPS Query Cache Utility (v%s)' % gipsversion + Colors.OFF
+
+    # argument parsing
+    parser = GIPSParser(description=title)
+    group = parser.add_argument_group('query cache options')
+    group.add_argument('--purge', default=False, action='store_true',
+                       help='Remove matching entries instead of listing them')
+    group.add_argument('--asset', default=None,
+                       help='Only entries for this asset type')
+    group.add_argument('--tile', default=None, help='Only entries for this tile')
+    group.add_argument('--negative', default=False, action='store_true',
+                       help='Only entries recording that nothing was found')
+    group.add_argument('--expired', default=False, action='store_true',
+                       help='Only expired entries')
+    args = parser.parse_args()
+
+    cls = utils.gips_script_setup(args.command, args.stop_on_error)
+
+    print title
+
+    with utils.error_handler('Query cache error'):
+        path = cls.Asset.query_cache_path()
+        filters = dict(asset=args.asset, tile=args.tile,
+                       negative=args.negative, expired=args.expired)
+        if args.purge:
+            count = query_cache.purge(path, **filters)
+            print '{} entries removed from {}'.format(count, path)
+        else:
+            entries = query_cache.entries(path, **filters)
+            fmt = '{:<12}{:<10}{:<12}{:<8}{:<21}{}'
+            print fmt.format('asset', 'tile', 'date', 'found', 'expires', 'kwargs')
+            for e in entries:
+                expires = ('never' if e['expires'] is None else
+                    datetime.fromtimestamp(e['expires']).strftime('%Y-%m-%d %H:%M:%S'))
+                print fmt.format(e['asset'], e['tile'], e['date'],
+                                 'no' if e['result'] == 'null' else 'yes',
+                                 expires, e['kwargs'])
+            print '{} entries in {}'.format(len(entries), path)
+
+    utils.gips_exit() # produce a summary error report then quit with a proper exit status
+
+
+if __name__ == "__main__":
+    main()
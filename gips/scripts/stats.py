@@ -23,58 +23,91 @@
 
 import os
 import csv
+from itertools import groupby, izip
+
+import numpy
 
 import gippy
 from gips.parsers import GIPSParser
 from gips.inventory import ProjectInventory
 from gips.utils import Colors, VerboseOut, basename
 from gips import utils
+from gips import zonal, statistics
 
 __version__ = '0.1.0'
 
+def zone_stats(inv, args):
+    """ Write zonal stats of each product in inv as columns in an npz file """
+    zcache = zonal.ZoneCache(args.zones, os.path.join(inv.projdir, '.zones'),
+                             args.key, args.where)
+    for p_type in sorted(inv.requested_products):
+        utils.verbose_out('Computing zonal stats for {}'.format(p_type), 2)
+        columns = zonal.project_zonal_stats(inv, p_type, zcache, args.percentiles or [],
+                                            args.workers, args.bins)
+        numpy.savez_compressed(
+            os.path.join(inv.projdir, p_type + '_zonal_stats.npz'), **columns)
+
+
 def main():
     title = Colors.BOLD + 'GIPS Image Statistics (v%s)' % __version__ + Colors.OFF
 
     parser0 = GIPSParser(datasources=False, description=title)
     parser0.add_projdir_parser()
-    group = parser0.add_argument_group('masking options')
+    group = parser0.add_argument_group('zonal statistics options')
+    h = ('Vector file of zones; computes stats of each feature instead of each image,'
+         ' saved as columns in PRODUCT_zonal_stats.npz')
+    group.add_argument('--zones', help=h, default=None)
+    group.add_argument('-k', '--key', help='Attribute identifying each zone (defaults to FID)',
+                       default='')
+    group.add_argument('-w', '--where', help='attribute=value pairs to limit zones', default='')
+    group = parser0.add_argument_group('statistics options')
+    h = 'Also compute these percentiles, added as pQ columns (approximated from a histogram)'
+    group.add_argument('--percentiles', help=h, nargs='*', default=None, type=float)
+    group.add_argument('--bins', help='Number of histogram bins for approximating percentiles',
+                       default=1000, type=int)
+    group.add_argument('--workers', help='Number of images to compute concurrently',
+                       default=1, type=int)
     args = parser0.parse_args()
 
     utils.gips_script_setup(stop_on_error=args.stop_on_error)
     print title
 
     # TODO - check that at least 1 of filemask or pmask is supplied
-    header = ['date', 'band', 'min', 'max', 'mean', 'sd', 'skew', 'count']
+    percentiles = args.percentiles or []
+    header = ['date', 'band'] + statistics.STATS + ['p%g' % q for q in percentiles]
 
     with utils.error_handler():
         for projdir in args.projdir:
             VerboseOut('Stats for Project directory: %s' % projdir, 1)
             inv = ProjectInventory(projdir, args.products)
 
+            if args.zones is not None:
+                zone_stats(inv, args)
+                continue
+
             p_dates = {} # map each product to its list of valid dates
             for date in inv.dates:
                 for p in inv.products(date):
                     p_dates.setdefault(p, []).append(date)
             p_dates = {p: sorted(dl) for p, dl in p_dates.items()}
 
-            for p_type, valid_dates in p_dates.items():
+            # images are computed in parallel but written in (product, date) order
+            jobs = [(p_type, date) for p_type in sorted(p_dates) for date in p_dates[p_type]]
+            results = statistics.imap_image_stats(
+                [inv[date][p_type] for (p_type, date) in jobs],
+                percentiles, args.bins, args.workers)
+            sf = getattr(utils.settings(), 'STATS_FORMAT', {})
+            for p_type, p_results in groupby(izip(jobs, results), key=lambda r: r[0][0]):
                 stats_fn = os.path.join(projdir, p_type + '_stats.txt')
                 with open(stats_fn, 'w') as stats_fo:
-                    sf = getattr(utils.settings(), 'STATS_FORMAT', {})
                     writer = csv.writer(stats_fo, **sf)
                     writer.writerow(header)
-
-                    # print date, band description, and stats
-                    for date in valid_dates:
-                        img = inv[date].open(p_type)
+                    for (_, date), bands in p_results:
+                        # print date, band description, and stats
                         date_str = date.strftime('%Y-%j')
-                        utils.verbose_out('Computing stats for {} {}'.format(
-                                p_type, date_str), 2)
-                        for b in img:
-                            stats = [str(s) for s in b.Stats()]
-                            writer.writerow(
-                                    [date_str, b.Description()] + stats)
-                        img = None
+                        utils.verbose_out('Computed stats for {} {}'.format(p_type, date_str), 2)
+                        for bname, stats in bands:
+                            writer.writerow([date_str, bname] + [str(s) for s in stats])
 
     utils.gips_exit() # produce a summary error report then quit with a proper exit status
 
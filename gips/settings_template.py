@@ -73,7 +73,11 @@ REPOS = {
     'modis': {
         'repository': '$TLD/modis',
         'username': EARTHDATA_USER,
-        'password': EARTHDATA_PASS
+        'password': EARTHDATA_PASS,
+        # any driver may set these to fetch assets concurrently:
+        # 'fetch-workers': 4,
+        # 'fetch-host-limits': {'e4ftl01.cr.usgs.gov': 2},
+        # 'fetch-host-default-limit': 2, # for hosts not listed above
     },
     'sentinel2': {
         'repository': '$TLD/sentinel2',
@@ -141,3 +145,24 @@ REPOS = {
     }
 """
 GIPS_ORM = False
+# Backend for the inventory database when GIPS_ORM is True:  'django' (the
+# default) uses the Django ORM; 'sqlite' uses GIPS' embedded SQLite backend,
+# which needs no Django setup, on the sqlite3 file in DATABASES['inventory']
+# GIPS_INVENTORY_BACKEND = 'sqlite'
+
+# Most files each process keeps open when reading project time series in
+# chunks, eg for map_reduce; capped at half the process's open file limit
+# GIPS_OPEN_FILES = 256
+
+# gdalwarp options for mosaicking to a raster mask (gips_export -r):  working
+# memory in MB (-wm), threads to warp with (-multi & NUM_THREADS; a number or
+# ALL_CPUS), and creation options of the output file
+# GIPS_WARP_MEMORY = 512
+# GIPS_WARP_THREADS = 'ALL_CPUS'
+# GIPS_WARP_CREATION_OPTIONS = ['TILED=YES', 'COMPRESS=LZW']
+# GDAL's block cache in MB for all of GIPS' warping (GDAL_CACHEMAX)
+# GIPS_GDAL_CACHEMAX = 1024
+
+# Directory to keep rasterized site masks in between runs, keyed by the site's
+# file and the output grid; they are always kept in memory for the run
+# GIPS_MASK_CACHE = '/archive/cache/masks'
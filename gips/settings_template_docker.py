@@ -76,6 +76,10 @@ REPOS = {
         'repository': prepend('modis'),
         'username': EARTHDATA_USER,
         'password': EARTHDATA_PASS,
+        # any driver may set these to fetch assets concurrently:
+        # 'fetch-workers': 4,
+        # 'fetch-host-limits': {'e4ftl01.cr.usgs.gov': 2},
+        # 'fetch-host-default-limit': 2, # for hosts not listed above
     },
     'sentinel2': {
         'repository': prepend('sentinel2'),
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+################################################################################
+#    GIPS: Geospatial Image Processing System
+#
+#    Copyright (C) 2018 Applied Geosolutions
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>
+################################################################################
+
+""" Image band statistics computed a block at a time
+
+Moments are merged block by block (Chan et al's parallel algorithm), so only
+one block of a band is in memory at once.  Percentiles are approximated from
+a histogram of fixed-width bins between the band's min and max, which takes
+a second pass over the band; they are within a bin width of the exact value.
+Like gippy's GeoRaster.Stats(), results are float32, so they print the same.
+"""
+
+import multiprocessing
+
+import numpy
+import gippy
+
+STATS = ['min', 'max', 'mean', 'sd', 'skew', 'count']
+
+
+def merge_moments(a, b):
+    """ Merge the (count, mean, 2nd & 3rd central moment sums) of two sets of values
+
+    Elements may be arrays, to merge many pairs at once; counts must be > 0.
+    """
+    (na, mean_a, m2_a, m3_a), (nb, mean_b, m2_b, m3_b) = a, b
+    n = na + nb
+    delta = mean_b - mean_a
+    m3 = (m3_a + m3_b + delta ** 3 * na * nb * (na - nb) / (1.0 * n * n)
+          + 3 * delta * (na * m2_b - nb * m2_a) / (1.0 * n))
+    m2 = m2_a + m2_b + delta ** 2 * na * nb / (1.0 * n)
+    mean = mean_a + delta * nb / (1.0 * n)
+    return n, mean, m2, m3
+
+
+def sd_skew(n, m2, m3):
+    """ Population sd and skew, as gippy's Stats() computes them, from merge_moments """
+    var = numpy.true_divide(m2, n)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        skew = numpy.where(var > 0, numpy.true_divide(m3, n) / var ** 1.5, 0.0)
+    return numpy.sqrt(var), skew
+
+
+class Moments(object):
+    """ Running count, min, max, mean, and 2nd & 3rd central moment sums """
+
+    def __init__(self):
+        self.n = 0
+        self.min = numpy.inf
+        self.max = -numpy.inf
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.m3 = 0.0
+
+    def add(self, values):
+        """ Add an array of values """
+        nb = values.size
+        if nb == 0:
+            return
+        mean_b = values.mean()
+        d = values - mean_b
+        (self.n, self.mean, self.m2, self.m3) = merge_moments(
+            (self.n, self.mean, self.m2, self.m3),
+            (nb, mean_b, (d * d).sum(), (d * d * d).sum()))
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+
+    def stats(self):
+        """ STATS, with population sd and skew as gippy's Stats() computes them """
+        if self.n == 0:
+            return [self.min, self.max] + [numpy.nan] * 3 + [0]
+        sd, skew = sd_skew(self.n, self.m2, self.m3)
+        return [self.min, self.max, self.mean, float(sd), float(skew), self.n]
+
+
+def hist_percentiles(hist, edges, percentiles):
+    """ Approximate percentiles of the values counted in a histogram """
+    cum = numpy.cumsum(hist)
+    n = cum[-1]
+    result = []
+    for q in percentiles:
+        rank = q / 100.0 * (n - 1)
+        i = min(numpy.searchsorted(cum, rank, side='right'), len(hist) - 1)
+        before = cum[i - 1] if i > 0 else 0
+        frac = min(max((rank - before + 0.5) / max(hist[i], 1), 0.0), 1.0)
+        result.append(edges[i] + frac * (edges[i + 1] - edges[i]))
+    return result
+
+
+def _blocks(band, rows):
+    """ Yield the data type and valid values of each block of rows of a band """
+    xsize, ysize = band.XSize(), band.YSize()
+    nodata = band.NoDataValue()
+    for y in range(0, ysize, rows):
+        h = min(rows, ysize - y)
+        arr = numpy.asarray(band.Read(gippy.Recti(0, y, xsize, h)))
+        dtype, arr = arr.dtype, arr.astype('float64').ravel()
+        yield dtype, arr[(arr != nodata) & ~numpy.isnan(arr)]
+
+
+def band_stats(band, percentiles=(), bins=1000, rows=None):
+    """ STATS of a gippy band, then approximations of each of percentiles
+
+    Blocks of rows are read at a time, by default as many as fit in gippy's
+    chunk size (--chunksize).
+    """
+    if rows is None:
+        rows = max(int(gippy.Options.ChunkSize() * 2 ** 20 / (band.XSize() * 8 * 4)), 1)
+    moments = Moments()
+    for dtype, values in _blocks(band, rows):
+        moments.add(values)
+    if moments.n == 0:
+        # no valid pixels:  min & max are left at the type's max & min, as gippy does
+        info = numpy.iinfo(dtype) if dtype.kind in 'iu' else numpy.finfo(dtype)
+        moments.min, moments.max = info.max, info.min
+    stats = moments.stats()
+    if not percentiles or moments.n == 0:
+        pct = [numpy.nan] * len(percentiles)
+    elif moments.min == moments.max:
+        pct = [moments.min] * len(percentiles)
+    else:
+        hist = numpy.zeros(bins, dtype='int64')
+        edges = numpy.linspace(moments.min, moments.max, bins + 1)
+        for dtype, values in _blocks(band, rows):
+            hist += numpy.histogram(values, bins=edges)[0]
+        pct = hist_percentiles(hist, edges, percentiles)
+    return [numpy.float32(s) for s in stats + pct]
+
+
+def image_stats(filename, percentiles=(), bins=1000):
+    """ [(band description, band_stats)] for each band of an image file """
+    img = gippy.GeoImage(filename)
+    results = [(b.Description(), band_stats(b, percentiles, bins)) for b in img]
+    img = None
+    return results
+
+
+def _image_stats_worker(args):
+    return image_stats(*args)
+
+
+def imap_image_stats(filenames, percentiles=(), bins=1000, workers=1):
+    """ Yield image_stats of each file in order, computed by a pool if workers > 1 """
+    jobs = [(fn, percentiles, bins) for fn in filenames]
+    if workers <= 1 or len(jobs) <= 1:
+        for j in jobs:
+            yield _image_stats_worker(j)
+        return
+    pool = multiprocessing.Pool(min(workers, len(jobs)))
+    try:
+        # imap preserves submission order so output is deterministic
+        for result in pool.imap(_image_stats_worker, jobs, chunksize=1):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""Time DataInventory construction as the number of tiles grows.
+
+Uses a stand-in data class so only the inventory's own bookkeeping is
+measured:  each tile has data on one day in `revisit`, staggered between
+tiles the way satellite overpasses are, so the tiles x dates cross product
+grows much faster than the number of real (tile, date) pairs.
+"""
+
+from __future__ import print_function
+
+import datetime
+from timeit import Timer
+
+import mock
+
+from gips import inventory
+from gips.inventory import DataInventory
+
+days = 365
+revisit = 16
+iters = 3
+start = datetime.date(2017, 1, 1)
+
+
+class Data(object):
+    """Minimal stand-in for a gips Data class; counts instantiations."""
+    created = 0
+    Asset = mock.Mock()
+
+    def __init__(self, tile, date, search=False):
+        Data.created += 1
+        self.valid = True
+
+    def filter(self, **kwargs):
+        return True
+
+    @classmethod
+    def RequestedProducts(cls, products=None):
+        return products
+
+
+class Temporal(object):
+    def prune_dates(self, dates):
+        return sorted(set(dates))
+
+    def __str__(self):
+        return 'all'
+
+
+def spatial(ntiles):
+    tile_dates = {
+        'tile%04d' % t: {start + datetime.timedelta(days=d)
+                         for d in range(t % revisit, days, revisit)}
+        for t in range(ntiles)}
+    return mock.Mock(sitename='tiles', tiles=tile_dates.keys(),
+                     tile_dates=tile_dates)
+
+
+def main():
+    with mock.patch.object(inventory.orm, 'use_orm', return_value=False):
+        print('{:>8}{:>12}{:>12}{:>12}'.format(
+            'tiles', 'pairs', 'cross', 'seconds'))
+        for ntiles in (1, 10, 100, 1000):
+            s = spatial(ntiles)
+            Data.created = 0
+            best = min(Timer(lambda: DataInventory(Data, s, Temporal()))
+                       .repeat(iters, 1))
+            ndates = len(set().union(*s.tile_dates.values()))
+            print('{:>8}{:>12}{:>12}{:>12.4f}'.format(
+                ntiles, Data.created / iters, ntiles * ndates, best))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""Compare the peak memory of map_reduce_array workers by output dtype.
+
+Runs a classification that yields small integers over a random input, once
+per output dtype, and reports the peak resident memory of the largest
+worker, the size of the assembled result, and the time taken.  float64
+outputs, returned to the parent, are how map_reduce worked before outputs
+took a dtype; the other rows show the savings of smaller dtypes, and of
+writing into shared memory instead of returning each chunk.
+
+Each run is made in a fresh process, whose workers are the only children
+counted by getrusage(RUSAGE_CHILDREN), so each reading is of that run alone.
+"""
+
+from __future__ import print_function
+
+import time
+import resource
+import multiprocessing
+
+import numpy
+
+from gips import mapreduce
+
+shape = (6, 2000, 2000)
+nchunks = 20
+iters = 3
+
+arrin = None # the input, made by main before any runs are forked
+
+
+def classify(data):
+    return numpy.digitize(data.mean(axis=0), [0.25, 0.5, 0.75])
+
+
+def run(outdtype, shared, queue):
+    """ Run map_reduce, putting (worker peak RSS MB, output MB, seconds) on queue """
+    start = time.time()
+    (inshape, outshape) = mapreduce.MapReduce.get_shapes(arrin, 1)
+    rfunc = lambda ch: arrin[:, ch[1]:ch[1] + ch[3], ch[0]:ch[0] + ch[2]]
+    mr = mapreduce.MapReduce(inshape, outshape, rfunc, classify,
+                             outdtype=outdtype, shared=shared)
+    mr.run(nchunks=nchunks)
+    out = mr.assemble()
+    mr.pool.close()
+    mr.pool.join() # workers must be waited for to be counted
+    seconds = time.time() - start
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024.0 # KB on linux
+    queue.put((peak, out.nbytes / 2.0 ** 20, seconds))
+
+
+def measure(outdtype, shared):
+    """ Largest worker peak RSS, output size, and best time over iters fresh runs """
+    readings = []
+    for _ in range(iters):
+        queue = multiprocessing.Queue()
+        proc = multiprocessing.Process(target=run, args=(outdtype, shared, queue))
+        proc.start()
+        readings.append(queue.get())
+        proc.join()
+    return (max(r[0] for r in readings), readings[0][1], min(r[2] for r in readings))
+
+
+def main():
+    global arrin
+    arrin = numpy.random.random(shape)
+    arrin[:, ::97, ::89] = numpy.nan
+    print('{:>22}{:>18}{:>14}{:>12}'.format('dtype', 'worker peak MB', 'output MB', 'seconds'))
+    for label, outdtype, shared in (('float64 (before)', 'float64', False),
+                                    ('float32', 'float32', False),
+                                    ('int16', 'int16', False),
+                                    ('uint8', 'uint8', False),
+                                    ('uint8, shared', 'uint8', True)):
+        print('{:>22}{:>18.1f}{:>14.2f}{:>12.4f}'.format(label, *measure(outdtype, shared)))
+
+
+if __name__ == '__main__':
+    main()
@@ -145,13 +145,66 @@ def m_fetch(mocker):
 df_args = (['rad', 'ndvi', 'bqashadow'], ['012030'],
            core.TemporalExtent('2017-08-01'))
 
-def t_data_fetch_error_case(mocker, m_discover_asset, m_query_service, m_fetch):
+@pytest.fixture
+def m_get_setting(mocker):
+    """Serial fetching, no host limits, & no query cache."""
+    settings = {'fetch-workers': 1, 'fetch-host-limits': {},
+                'fetch-host-default-limit': 2, 'query-cache': False}
+    return mocker.patch.object(landsatData.Asset, 'get_setting',
+                               side_effect=lambda k: settings[k])
+
+def t_data_fetch_error_case(mocker, m_get_setting, m_discover_asset,
+                            m_query_service, m_fetch):
     """Test error case of data.core.Data.fetch.
 
     It should return [], and shouldn't raise an exception."""
     m_fetch.side_effect = RuntimeError('aaah!')
     assert landsatData.fetch(*df_args) == []
 
+def t_data_fetch_concurrently(mocker, m_get_setting, m_discover_asset,
+                              m_query_service, m_fetch):
+    """Confirm concurrent fetching archives inline, as landsat does serially."""
+    m_fetch.return_value = ['an-asset']
+    m_archive_assets = mocker.patch.object(landsatData, 'archive_assets')
+    actual = landsatData.fetch(*df_args, fetch_workers=2)
+    # every download is archived by its own fetch, & the stage is left alone
+    assert (m_fetch.call_count > 0 and not m_archive_assets.called
+            and all(c[1]['archive'] for c in m_fetch.call_args_list)
+            and actual == ['an-asset'] * m_fetch.call_count)
+
+def t_data_fetch_concurrently_staged(mocker, m_get_setting, m_discover_asset,
+                                     m_query_service, m_fetch):
+    """Confirm drivers that stage downloads are archived once all are done."""
+    mocker.patch.object(landsatData, 'inline_archive', False)
+    m_archive_assets = mocker.patch.object(landsatData, 'archive_assets',
+                                           return_value=['an-asset'])
+    actual = landsatData.fetch(*df_args, fetch_workers=2)
+    assert (m_fetch.call_count > 0 and m_archive_assets.call_count == 1
+            and actual == ['an-asset'])
+
+def t_data_fetch_concurrently_error_case(mocker, m_get_setting,
+        m_discover_asset, m_query_service, m_fetch):
+    """Concurrent fetch errors are reported, not raised, & nothing archived."""
+    m_fetch.side_effect = RuntimeError('aaah!')
+    m_archive_assets = mocker.patch.object(landsatData, 'archive_assets')
+    assert (landsatData.fetch(*df_args, fetch_workers=2) == []
+            and not m_archive_assets.called)
+
+def t_data_fetch_concurrently_system_exit(mocker, m_get_setting,
+        m_discover_asset, m_query_service, m_fetch):
+    """A SystemExit in a fetch thread is passed back, so the pool doesn't hang."""
+    m_fetch.side_effect = SystemExit(1)
+    with pytest.raises(SystemExit):
+        landsatData.fetch(*df_args, fetch_workers=2)
+
+def t_host_throttle_default():
+    """Hosts without a limit of their own get the default limit."""
+    throttle = data_core._HostThrottle({'a.com': 3}, 2)
+    with throttle.slot('http://a.com/x'), throttle.slot('http://b.com/y'):
+        pass
+    assert (throttle._semaphores['a.com']._initial_value == 3
+            and throttle._semaphores['b.com']._initial_value == 2)
+
 
 def t_Asset_dates():
     """Test Asset's start and end dates, using SAR."""
@@ -226,6 +279,20 @@ def t_Data_archive_assets_update_case(orm, mocker, asset_and_replacement):
     m_os_remove.assert_any_call(stale_product_toa)
     assert m_os_remove.call_count == 2
 
+def t_CloudCoverAsset_filter_sidecar_caching(tmpdir, mpo):
+    """Confirm cloud cover is read from the sidecar after the first filter."""
+    fn = str(tmpdir.join('LC08_L1TP_012030_20170801_20170811_01_T1.tar.gz'))
+    m_cloud_cover = mpo(landsat.landsatAsset, 'cloud_cover')
+    m_cloud_cover.return_value = 42.0
+
+    first = landsat.landsatAsset(fn).filter(pclouds=50)
+    # a fresh object has nothing in self.meta, so must use the sidecar
+    second = landsat.landsatAsset(fn).filter(pclouds=30)
+
+    assert (m_cloud_cover.call_count == 1
+            and (first, second) == (True, False)
+            and landsat.landsatAsset(fn).read_sidecar() == {'cloud-cover': 42.0})
+
 def t_query_service_caching(mpo):
     bn, url = 'basename.hdf', 'http://www.himom.com/'
     m_available = mpo(modis.modisAsset, 'available')
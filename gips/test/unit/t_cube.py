@@ -0,0 +1,51 @@
+"""Unit tests for gips.inventory.cube."""
+
+import os
+import datetime
+
+import mock
+import numpy
+
+from gips.inventory import cube
+
+
+def _project(tmpdir, dates, product='ndvi'):
+    """Mock ProjectInventory with one file per date, read from a 3 x 5 x 4 series."""
+    series = numpy.arange(len(dates) * 5 * 4, dtype='float32').reshape((len(dates), 5, 4))
+    series[1, 2, 3] = -1
+    data = {}
+    for d in dates:
+        fn = tmpdir.join('{}_{}.tif'.format(d.strftime('%Y%j'), product))
+        fn.ensure()
+        # as Data, products lists product names & indexing gives a filename
+        data[d] = mock.MagicMock(products=[product])
+        data[d].__getitem__.side_effect = {product: str(fn)}.__getitem__
+    img = mock.MagicMock()
+    img.YSize.return_value, img.XSize.return_value = 5, 4
+    img[0].NoDataValue.return_value = -1
+    img.TimeSeries.side_effect = lambda days, ch: series[:, ch[1]:ch[1] + ch[3], ch[0]:ch[0] + ch[2]]
+    inv = mock.Mock(projdir=str(tmpdir), dates=dates, data=data, requested_products=[product])
+    inv.get_timeseries.return_value = img
+    return inv, series
+
+
+def t_cube_build_and_read(mocker, tmpdir):
+    """Confirm a built cube reads back time series, and isn't used once its files change."""
+    mocker.patch.object(cube.gippy, 'Recti', side_effect=lambda *ch: list(ch))
+    dates = [datetime.date(2017, 1, 1) + datetime.timedelta(days=16 * i) for i in range(3)]
+    inv, series = _project(tmpdir, dates)
+    expected = series.copy()
+    expected[1, 2, 3] = numpy.nan
+
+    c = cube.build(inv, rows=2) # rows=2 to build from several strips
+
+    assert c.products == ['ndvi'] and c.dates('ndvi') == dates
+    assert c.covers(inv, 'ndvi', dates)
+    numpy.testing.assert_array_equal(c.read('ndvi', dates), expected)
+    numpy.testing.assert_array_equal(c.read('ndvi', [dates[0], dates[2]], [1, 1, 2, 3]),
+                                     expected[[0, 2], 1:4, 1:3])
+    # a product file changed since the cube was built
+    fn = inv.data[dates[1]]['ndvi']
+    later = c.index['products']['ndvi']['built'] + 60
+    os.utime(fn, (later, later))
+    assert not cube.Cube.open(str(tmpdir)).covers(inv, 'ndvi', dates)
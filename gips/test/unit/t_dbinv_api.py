@@ -72,9 +72,13 @@ def t_rectify_products(mocker):
         'h12v04/2012338/h12v04_2012338_MCD.tif',                # not enough _-delimited tokens
     )]
     all_filenames = rubbish_filenames + asset_filenames + product_filenames
-    # simulate iglob() - match against artificial filenames
+    # simulate iglob() - match against artificial filenames & their tile & date directories
+    all_paths = set(all_filenames)
+    all_paths.update([os.path.dirname(fn) for fn in all_filenames]
+                     + [os.path.dirname(os.path.dirname(fn)) for fn in all_filenames])
     mock_iglob = mocker.patch('gips.inventory.dbinv.glob.iglob')
-    mock_iglob.side_effect = lambda pat: [fn for fn in all_filenames if fnmatch.fnmatchcase(fn, pat)]
+    mock_iglob.side_effect = lambda pat: sorted(
+        p for p in all_paths if p.count(os.sep) == pat.count(os.sep) and fnmatch.fnmatchcase(p, pat))
 
     # handle staleness of DB entries similarly to t_rectify_assets:
     for fn in ('h09v09/2012336/h09v09_2012336_MCD_quality.tif', # just product_filenames
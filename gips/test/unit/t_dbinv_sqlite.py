@@ -0,0 +1,162 @@
+import os
+import datetime
+import threading
+import time
+
+import pytest
+
+from gips.inventory import dbinv, orm
+from gips.inventory.dbinv import sqlite
+
+
+@pytest.fixture
+def sqlite_inv(mocker, tmpdir):
+    """Route dbinv calls to a fresh embedded sqlite inventory."""
+    mocker.patch.object(orm, 'inventory_backend', return_value='sqlite')
+    mocker.patch.object(sqlite, 'database_path',
+                        return_value=str(tmpdir.join('inv.sqlite3')))
+    mocker.patch.object(sqlite, '_local', threading.local())
+    yield sqlite
+
+
+def _add_assets(dates, tile='h12v04'):
+    with dbinv.batch():
+        for d in dates:
+            dbinv.add_asset(driver='modis', asset='MCD43A2', sensor='MCD',
+                            tile=tile, date=d, name='{}-{}.hdf'.format(tile, d))
+
+
+def t_search_and_list(sqlite_inv):
+    """Confirm searching & listing, including IN lists longer than a statement allows."""
+    dates = [datetime.date(2000, 1, 1) + datetime.timedelta(days=i)
+             for i in range(sqlite_inv._max_params + 10)]
+    _add_assets(dates)
+    _add_assets(dates[:2], tile='h12v05')
+
+    found = dbinv.asset_search(driver='modis', tile__in=['h12v04'],
+                               date__in=dates).order_by('date')
+
+    assert [a.date for a in found] == dates
+    assert found[0].name == 'h12v04-2000-01-01.hdf'
+    assert dbinv.list_tiles('modis') == ['h12v04', 'h12v05']
+    assert dbinv.list_dates('modis', 'h12v05') == dates[:2]
+    assert len(dbinv.asset_search(driver='landsat')) == 0
+
+
+def t_datetime_dates(sqlite_inv):
+    """Confirm datetimes, as some drivers' assets have, are stored & searched as dates."""
+    d = datetime.date(2017, 8, 1)
+    dbinv.add_asset(driver='landsat', asset='C1', sensor='LC8', tile='012030',
+                    date=datetime.datetime(2017, 8, 1), name='a.tar.gz')
+
+    found = dbinv.asset_search(driver='landsat', date=datetime.datetime(2017, 8, 1))
+
+    assert [a.date for a in found] == [d]
+    assert [a.name for a in dbinv.asset_search(driver='landsat', date=d)] == ['a.tar.gz']
+
+
+def t_update_or_add_and_delete(sqlite_inv):
+    """Confirm update_or_add_* replaces in place & delete_product removes."""
+    d = datetime.date(2012, 12, 1)
+    key = dict(driver='modis', product='ndvi', tile='h12v04', date=d, sensor='MCD')
+    first = dbinv.update_or_add_product(name='a.tif', **key)
+    second = dbinv.update_or_add_product(name='b.tif', **key)
+
+    assert first.id == second.id
+    assert [p.name for p in dbinv.product_search(driver='modis')] == ['b.tif']
+    dbinv.delete_product(driver='modis', product='ndvi', tile='h12v04', date=d)
+    assert len(dbinv.product_search(driver='modis')) == 0
+
+
+def t_batch_rollback(sqlite_inv):
+    """Confirm a failed batch leaves no partial writes behind."""
+    with pytest.raises(RuntimeError):
+        with dbinv.batch():
+            _add_assets([datetime.date(2012, 12, 1)])
+            raise RuntimeError('AAAAAH!')
+    assert len(dbinv.asset_search(driver='modis')) == 0
+
+
+@pytest.mark.parametrize('workers', (1, 2))
+def t_rectify_products(sqlite_inv, mocker, tmpdir, workers):
+    """Confirm bulk rectify adds, updates, and deletes records to match the archive."""
+    from gips.data.modis import modisData
+    mocker.patch.object(modisData.Asset.Repository, 'data_path',
+                        return_value=str(tmpdir))
+    names = {}
+    for (tile, date_str, sensor, product) in (('h12v04', '2012336', 'MCD', 'ndvi'),
+                                              ('h12v05', '2012337', 'MOD', 'temp8td')):
+        fn = tmpdir.join(tile, date_str, '_'.join((tile, date_str, sensor, product)) + '.tif')
+        fn.ensure()
+        names[product] = str(fn)
+    d = datetime.date(2012, 12, 1)
+    dbinv.add_product(driver='modis', product='ndvi', sensor='MCD', tile='h12v04',
+                      date=d, name='/moved/ndvi.tif')
+    dbinv.add_product(driver='modis', product='fsnow', sensor='MCD', tile='h12v04',
+                      date=d, name='/stale/fsnow.tif')
+
+    dbinv.rectify_products(modisData, workers=workers)
+
+    actual = {p.product: (p.tile, p.date, p.sensor, p.name)
+              for p in dbinv.product_search(driver='modis')}
+    assert actual == {
+        'ndvi': ('h12v04', d, 'MCD', names['ndvi']),
+        'temp8td': ('h12v05', datetime.date(2012, 12, 2), 'MOD', names['temp8td']),
+    }
+
+
+class _DatetimeAsset(object):
+    """Stands in for drivers' assets, eg landsat's, whose dates are datetimes."""
+    _assets = {'C1': {'pattern': r'^L_.*\.tar\.gz$'}}
+    Repository = None # set by tests
+
+    def __init__(self, filename):
+        (_, self.tile, date_str) = os.path.basename(filename)[:-7].split('_')
+        self.date = datetime.datetime.strptime(date_str, '%Y%j')
+        self.sensor = 'LC8'
+
+
+def t_rectify_assets_twice_datetime_dates(sqlite_inv, mocker, tmpdir):
+    """Confirm rectify matches archived assets with datetime dates to their records."""
+    repo = mocker.Mock(**{'data_path.return_value': str(tmpdir)})
+    repo.name = 'landsat'
+    mocker.patch.object(_DatetimeAsset, 'Repository', repo)
+    fn = tmpdir.join('012030', '2017213', 'L_012030_2017213.tar.gz')
+    fn.ensure()
+
+    dbinv.rectify_assets(_DatetimeAsset)
+    dbinv.rectify_assets(_DatetimeAsset) # must not try to add the asset again
+
+    assert [(a.tile, a.date, a.name) for a in dbinv.asset_search(driver='landsat')] == [
+        ('012030', datetime.date(2017, 8, 1), str(fn))]
+
+
+def t_incremental_rectify(sqlite_inv, mocker, tmpdir):
+    """Confirm rectify only visits date directories changed since the last one."""
+    from gips.data.modis import modisData
+    mocker.patch.object(modisData.Asset.Repository, 'path',
+                        side_effect=lambda subdir='': os.path.join(str(tmpdir), subdir))
+
+    def make_product(date_str):
+        fn = tmpdir.join('tiles', 'h12v04', date_str,
+                         'h12v04_{}_MCD_ndvi.tif'.format(date_str))
+        fn.ensure()
+        return str(fn)
+
+    first_fn = make_product('2012336')
+    dbinv.rectify(modisData) # no watermark yet, so the whole archive is scanned
+    # pretend the archive predates the last rectify, then change it
+    old = time.time() - 3600
+    for d in (('tiles',), ('tiles', 'h12v04'), ('tiles', 'h12v04', '2012336')):
+        os.utime(str(tmpdir.join(*d)), (old, old))
+    dbinv.api._write_watermark(modisData.Asset.Repository, old + 600)
+    second_fn = make_product('2012337')
+    key = dict(driver='modis', product='ndvi', sensor='MCD', tile='h12v04')
+    dbinv.update_or_add_product(date=datetime.date(2012, 12, 1), name='/bogus', **key)
+
+    dbinv.rectify(modisData)
+
+    names = lambda: sorted(p.name for p in dbinv.product_search(driver='modis'))
+    assert names() == sorted(['/bogus', second_fn]) # unchanged directory wasn't visited
+    dbinv.rectify(modisData, full=True)
+    assert names() == sorted([first_fn, second_fn])
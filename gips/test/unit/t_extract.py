@@ -0,0 +1,52 @@
+"""Unit tests for gips.inventory.extract."""
+
+import mock
+import numpy
+import pytest
+from osgeo import osr
+
+from gips.inventory import extract
+
+
+def _feature(key, wkt, projection):
+    return mock.Mock(**{'Value.return_value': key, 'WKT.return_value': wkt,
+                        'Projection.return_value': projection})
+
+
+def t_sample(mocker):
+    """Confirm points take their pixel's value & polygons the mean of their valid pixels."""
+    mocker.patch.object(extract.gippy, 'Recti', side_effect=lambda *win: list(win))
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(32618)
+    projection = srs.ExportToWkt()
+    arr = numpy.arange(100, dtype='float64').reshape((10, 10))
+    arr[5, 5] = -1 # nodata
+    band = mock.Mock(**{'Description.return_value': 'red', 'NoDataValue.return_value': -1})
+    band.Read.side_effect = lambda win: arr[win[1]:win[1] + win[3], win[0]:win[0] + win[2]]
+    img = mock.MagicMock(**{'Affine.return_value': [0, 10, 0, 100, 0, -10],
+                            'XSize.return_value': 10, 'YSize.return_value': 10,
+                            'Projection.return_value': projection})
+    img.__iter__.return_value = iter([band])
+    square = 'POLYGON (({0} 40, {1} 40, {1} 60, {0} 60, {0} 40))'
+    features = [_feature('point', 'POINT (35 45)', projection),
+                _feature('outside', 'POINT (-50 -50)', projection),
+                _feature('square', square.format(10, 30), projection),
+                _feature('nodata', square.format(40, 60), projection)]
+
+    actual = {key: (b, v) for (key, b, v) in extract.sample(img, extract.Targets(features))}
+
+    assert actual == {'point': ('red', 53.0),
+                      'square': ('red', 46.5),
+                      'nodata': ('red', pytest.approx((44 + 45 + 54) / 3.0))}
+
+
+def t_targets_mask_cached(mocker):
+    """Confirm a feature's mask is made once per grid & window, and matches pixel centers."""
+    m_pixel_mask = mocker.patch.object(extract, 'pixel_mask', wraps=extract.pixel_mask)
+    targets = extract.Targets([])
+    geom = extract.ogr.CreateGeometryFromWkt('POLYGON ((10 40, 30 40, 30 60, 10 60, 10 40))')
+    affine, win = [0, 10, 0, 100, 0, -10], [1, 4, 2, 2]
+
+    masks = [targets.mask('proj', affine, win, 'square', geom) for _ in range(3)]
+
+    assert m_pixel_mask.call_count == 1 and masks[0].all() and masks[0].shape == (2, 2)
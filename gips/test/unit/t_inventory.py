@@ -9,6 +9,7 @@ from django.forms.models import model_to_dict
 
 from .data import asset_filenames, expected_assets, expected_products
 
+from gips import inventory
 from gips.inventory import DataInventory, dbinv
 from gips.data.modis.modis import modisData, modisAsset
 from gips.core import SpatialExtent, TemporalExtent
@@ -94,3 +95,224 @@ def t_data_inventory_load(orm):
         assert (ep['sensor'] == sensor and
                 ep['product'] == product and
                 ep['name'] == fname)
+
+
+def t_process_worker_error_isolation(mocker):
+    """Confirm _process_worker returns errors instead of raising them."""
+    mocker.patch.object(inventory.orm, 'use_orm', return_value=False)
+    date = datetime.date(2012, 12, 1)
+    good_data = mocker.Mock(filenames={('MCD', 'ndvi'): 'ndvi.tif'},
+                            sensors={'ndvi': 'MCD'})
+    bad_data = mocker.Mock()
+    bad_data.process.side_effect = RuntimeError('AAAAAH!')
+    inventory._process_init({(date, 'h12v04'): good_data,
+                             (date, 'h12v05'): bad_data})
+
+    good = inventory._process_worker(((date, 'h12v04'), (), {'overwrite': True}))
+    bad = inventory._process_worker(((date, 'h12v05'), (), {'overwrite': True}))
+
+    good_data.process.assert_called_once_with(overwrite=True)
+    assert good == (date, 'h12v04', good_data.filenames, good_data.sensors, None)
+    assert bad[:4] == (date, 'h12v05', None, None)
+    assert bad[4][0] == 'AAAAAH!' and 'RuntimeError' in bad[4][1]
+
+
+def t_process_worker_system_exit(mocker):
+    """Confirm _process_worker returns SystemExit as an error, and sets the library error handler."""
+    mocker.patch.object(inventory.utils, 'error_handler', inventory.utils.cli_error_handler)
+    date = datetime.date(2012, 12, 1)
+    data = mocker.Mock()
+    data.process.side_effect = SystemExit(1)
+    inventory._process_init({(date, 'h12v04'): data})
+
+    actual = inventory._process_worker(((date, 'h12v04'), (), {}))
+
+    assert inventory.utils.error_handler is inventory.utils.lib_error_handler
+    assert actual[:4] == (date, 'h12v04', None, None)
+    assert 'SystemExit' in actual[4][1]
+
+
+@pytest.mark.parametrize('backend, closed', (('django', True), ('sqlite', False)))
+def t_close_db_connections(mocker, backend, closed):
+    """Confirm django connections are closed before forking, unless django isn't in use."""
+    import django.db
+    mocker.patch.object(inventory.orm, 'use_orm', return_value=True)
+    mocker.patch.object(inventory.orm, 'inventory_backend', return_value=backend)
+    m_close_all = mocker.patch.object(django.db.connections, 'close_all')
+
+    inventory._close_db_connections()
+
+    assert m_close_all.called == closed
+
+
+def t_mosaic_worker_error_isolation(mocker):
+    """Confirm _mosaic_worker mosaics one unit & returns errors instead of raising them."""
+    mocker.patch.object(inventory.orm, 'use_orm', return_value=False)
+    date = datetime.date(2012, 12, 1)
+    tiles = mocker.Mock()
+    tiles.mosaic_product.side_effect = [None, RuntimeError('AAAAAH!')]
+    inventory._process_init({(date, 'MCD', 'ndvi'): (tiles, 'out'),
+                             (date, 'MCD', 'lswi'): (tiles, 'out')})
+
+    good = inventory._mosaic_worker(((date, 'MCD', 'ndvi'), {'overwrite': True}))
+    bad = inventory._mosaic_worker(((date, 'MCD', 'lswi'), {'overwrite': True}))
+
+    assert tiles.mosaic_product.call_args_list == [
+        mocker.call('MCD', 'ndvi', 'out', overwrite=True),
+        mocker.call('MCD', 'lswi', 'out', overwrite=True),
+    ]
+    assert good == (date, 'MCD', 'ndvi', None)
+    assert bad[:3] == (date, 'MCD', 'lswi')
+    assert bad[3][0] == 'AAAAAH!' and 'RuntimeError' in bad[3][1]
+
+
+def t_mosaic_worker_system_exit(mocker):
+    """Confirm _mosaic_worker returns SystemExit as an error instead of dying."""
+    date = datetime.date(2012, 12, 1)
+    tiles = mocker.Mock()
+    tiles.mosaic_product.side_effect = SystemExit(1)
+    inventory._process_init({(date, 'MCD', 'ndvi'): (tiles, 'out')})
+
+    actual = inventory._mosaic_worker(((date, 'MCD', 'ndvi'), {}))
+
+    assert actual[:3] == (date, 'MCD', 'ndvi') and 'SystemExit' in actual[3][1]
+
+
+def t_mosaic_process_workers(mocker):
+    """Confirm mosaic processes products with the given number of workers first."""
+    inv = mocker.Mock(dates=[])
+    inv._iter_dates.return_value = []
+
+    inventory.DataInventory.mosaic.__func__(inv, 'out', process_workers=4)
+
+    inv.process.assert_called_once_with(overwrite=False, workers=4)
+
+
+def t_data_inventory_sparse_tile_dates(mocker):
+    """Confirm only (tile, date) pairs present in the repo are searched."""
+    mocker.patch.object(inventory.orm, 'use_orm', return_value=False)
+    d1, d2, d3 = [datetime.date(2012, 12, d) for d in (1, 2, 3)]
+    spatial = mocker.Mock(sitename='tiles', tiles=['h12v04', 'h12v05'],
+                          tile_dates={'h12v04': {d1, d3}, 'h12v05': {d2, d3}})
+    temporal = mocker.Mock()
+    temporal.prune_dates.side_effect = lambda dates: sorted(set(dates) - {d1})
+    dataclass = mocker.Mock()
+
+    inv = DataInventory(dataclass, spatial, temporal)
+
+    assert dataclass.call_args_list == [
+        mocker.call('h12v05', d2, search=True),
+        mocker.call('h12v04', d3, search=True),
+        mocker.call('h12v05', d3, search=True),
+    ]
+    assert sorted(inv.data.keys()) == [d2, d3]
+    assert sorted(inv.data[d3].tiles.keys()) == ['h12v04', 'h12v05']
+
+
+def t_data_inventory_lazy(mocker):
+    """Confirm lazy inventories search each date only when it's needed."""
+    mocker.patch.object(inventory.orm, 'use_orm', return_value=False)
+    d1, d2 = datetime.date(2012, 12, 1), datetime.date(2012, 12, 2)
+    spatial = mocker.Mock(sitename='tiles', tiles=['h12v04', 'h12v05'],
+                          tile_dates={'h12v04': {d1, d2}, 'h12v05': {d2}})
+    temporal = mocker.Mock()
+    temporal.prune_dates.side_effect = lambda dates: sorted(set(dates))
+    dataclass = mocker.Mock()
+    # h12v04 on d1 is filtered out, leaving d1 without any tiles
+    dataclass.return_value.filter.side_effect = [False, True, True]
+
+    inv = DataInventory(dataclass, spatial, temporal, lazy=True)
+    assert inv.dates == [d1, d2]
+    dataclass.assert_not_called()
+
+    visited = [(date, sorted(tiles.tiles)) for date, tiles in inv._iter_dates()]
+
+    assert visited == [(d2, ['h12v04', 'h12v05'])]
+    assert dataclass.call_count == 3
+    assert not any(inv.data[d].materialized for d in inv.dates)
+
+
+def t_process_parallel_lazy_batches(mocker):
+    """Confirm lazy inventories are processed in parallel a batch of dates at a time."""
+    mocker.patch.object(inventory.orm, 'use_orm', return_value=False)
+    dates = [datetime.date(2012, 12, d) for d in (1, 2, 3)]
+    spatial = mocker.Mock(sitename='tiles', tiles=['h12v04', 'h12v05'],
+                          tile_dates={'h12v04': set(dates), 'h12v05': set(dates)})
+    temporal = mocker.Mock()
+    temporal.prune_dates.side_effect = lambda dates: sorted(set(dates))
+    dataclass = mocker.Mock()
+    inv = DataInventory(dataclass, spatial, temporal, lazy=True)
+    held = [] # materialized dates while each pool runs
+
+    def run_pool(workers, units, worker, jobs):
+        held.append([d for d in dates if inv.data[d].materialized])
+        return [k + ({}, {}, None) for (k, _, _) in jobs]
+    mocker.patch.object(inv, '_run_pool', side_effect=run_pool)
+
+    inv._process_parallel(1) # 4 units per batch, so 2 dates at a time
+
+    assert held == [dates[:2], dates[2:]]
+    assert not any(inv.data[d].materialized for d in dates)
+
+
+def t_map_reduce_chunks_fit_time_series(mocker):
+    """Confirm map_reduce's chunks fit memory with every date's bands read at once."""
+    from gips import mapreduce
+    m_mr = mocker.patch.object(inventory, 'MapReduce')
+    m_mr.plan_chunks.side_effect = mapreduce.MapReduce.plan_chunks
+    dates = [datetime.date(2017, 1, 1) + datetime.timedelta(days=7 * i) for i in range(50)]
+    inv = mock.Mock(dates=dates, **{'data_size.return_value': (2, 1000, 800),
+                                    'block_size.return_value': (800, 16)})
+    memory = 64.0
+
+    inventory.ProjectInventory.map_reduce.__func__(
+        inv, mocker.Mock(), products=['ndvi', 'lswi'], memory=memory)
+
+    chunks = m_mr.return_value.run.call_args[1]['chunks']
+    pixelsize = 2 * (2 * 50) * 8 + 2 * 1 * 8 # two copies each of input stack & output
+    assert all(ch[2] * ch[3] * pixelsize <= memory * 2 ** 20 for ch in chunks)
+    assert sum(ch[3] for ch in chunks) == 1000
+
+
+def t_map_reduce_filename_shared(mocker):
+    """Confirm map_reduce to a file with shared set streams chunks without a shared output."""
+    import numpy
+    from gips import mapreduce
+    m_mr = mocker.patch.object(inventory, 'MapReduce', wraps=mapreduce.MapReduce)
+    m_mr.plan_chunks = mapreduce.MapReduce.plan_chunks
+    mocker.patch.object(inventory.gippy, 'Recti', side_effect=lambda *ch: ch)
+    arrin = numpy.arange(2 * 30 * 20, dtype='float64').reshape((2, 30, 20))
+    bands = [mock.Mock()]
+    inv = mock.Mock(dates=[datetime.date(2017, 1, 1)], requested_products=['ndvi', 'lswi'],
+                    **{'data_size.return_value': arrin.shape,
+                       'block_size.return_value': (20, 4),
+                       'new_image.return_value': bands})
+    readfunc = lambda ch: arrin[:, ch[1]:ch[1] + ch[3], ch[0]:ch[0] + ch[2]]
+
+    rv = inventory.ProjectInventory.map_reduce.__func__(
+        inv, lambda data: data.sum(axis=0), readfunc=readfunc, memory=0.001,
+        filename='out.tif', shared=True)
+
+    assert rv == 'out.tif'
+    assert 'shared' not in m_mr.call_args[1]
+    actual = numpy.zeros((30, 20))
+    for (output, (x, y, w, h)), _ in bands[0].Write.call_args_list:
+        actual[y:y + h, x:x + w] = output
+    numpy.testing.assert_array_equal(arrin.sum(axis=0), actual)
+
+
+def t_image_cache_lru(mocker):
+    """Confirm cached GeoImages are reused & the least recent closed to stay in budget."""
+    m_geoimage = mocker.patch.object(inventory.gippy, 'GeoImage',
+                                     side_effect=lambda fns: mock.Mock(filenames=fns))
+    cache = inventory._ImageCache(maxfiles=4)
+
+    a = cache.get(['a1.tif', 'a2.tif'])
+    b = cache.get(['b1.tif', 'b2.tif'])
+    assert cache.get(['a1.tif', 'a2.tif']) is a # a is now most recent
+    c = cache.get(['c1.tif'])                   # over budget, so b is dropped
+
+    assert m_geoimage.call_count == 3
+    assert cache.images.values() == [a, c]
+    assert cache.nfiles == 3
+    assert b not in cache.images.values()
@@ -0,0 +1,109 @@
+import numpy
+
+from gips import mapreduce
+
+
+def _pfunc(data):
+    """Sum each pixel's signature, into two bands to exercise band handling."""
+    total = data.sum(axis=0)
+    return numpy.vstack((total, -total))
+
+
+def _input():
+    arrin = numpy.arange(4 * 30 * 20, dtype='float64').reshape((4, 30, 20))
+    arrin[1, 5, 7] = numpy.nan
+    return arrin
+
+
+def t_map_reduce_array_shared():
+    """Confirm workers writing into shared memory produce the same output."""
+    arrin = _input()
+    expected = mapreduce._test_map_reduce_array(arrin, _pfunc, numbands=2, nchunks=7)
+
+    actual = mapreduce.map_reduce_array(arrin, _pfunc, numbands=2, nchunks=7, shared=True)
+
+    assert numpy.isnan(actual[:, 5, 7]).all()
+    numpy.testing.assert_array_equal(expected, actual)
+
+
+def t_plan_chunks_strips():
+    """Confirm full-width strips are block-aligned, fit the budget & cover the image."""
+    shape = (50 * 6, 1000, 800)
+    memory = 64.0
+    chunks = mapreduce.MapReduce.plan_chunks(shape, numbands=2, memory=memory,
+                                             blocksize=(800, 16))
+
+    pixelsize = 2 * shape[0] * 8 + 2 * 2 * 8
+    assert all(ch[0] == 0 and ch[2] == 800 for ch in chunks)
+    assert all(ch[1] % 16 == 0 for ch in chunks)
+    assert all(ch[2] * ch[3] * pixelsize <= memory * 2 ** 20 for ch in chunks)
+    assert sum(ch[3] for ch in chunks) == 1000
+
+
+def t_plan_chunks_blocks():
+    """Confirm 2-D blocks are used when one block row is over budget."""
+    chunks = mapreduce.MapReduce.plan_chunks((100, 1000, 10000), memory=4.0,
+                                             blocksize=(256, 256))
+
+    assert len(set(ch[3] for ch in chunks)) == 2 # 3 full block rows + 1 partial
+    assert all(ch[0] % 256 == 0 and ch[1] % 256 == 0 for ch in chunks)
+    assert sum(ch[2] * ch[3] for ch in chunks) == 1000 * 10000
+
+
+def t_map_reduce_array_planned():
+    """Confirm planned chunks give the same output as nchunks strips."""
+    arrin = _input()
+    expected = mapreduce._test_map_reduce_array(arrin, _pfunc, numbands=2, nchunks=7)
+
+    actual = mapreduce.map_reduce_array(arrin, _pfunc, numbands=2, memory=0.01)
+
+    numpy.testing.assert_array_equal(expected, actual)
+
+
+def t_map_reduce_stream():
+    """Confirm streamed chunks can be written into place to give the same output."""
+    arrin = _input()
+    expected = mapreduce._test_map_reduce_array(arrin, _pfunc, numbands=2, nchunks=7)
+    (inshape, outshape) = mapreduce.MapReduce.get_shapes(arrin, 2)
+    rfunc = lambda ch: arrin[:, ch[1]:ch[1] + ch[3], ch[0]:ch[0] + ch[2]]
+    mr = mapreduce.MapReduce(inshape, outshape, rfunc, _pfunc)
+    actual = numpy.zeros(outshape)
+
+    def writer(output, ch):
+        actual[:, ch[1]:ch[1] + ch[3], ch[0]:ch[0] + ch[2]] = output
+
+    mr.stream(writer, nchunks=7)
+
+    numpy.testing.assert_array_equal(expected, actual)
+
+
+def t_map_reduce_stream_shared():
+    """Confirm chunks are still passed to the writer when the output is shared."""
+    arrin = _input()
+    expected = mapreduce._test_map_reduce_array(arrin, _pfunc, numbands=2, nchunks=7)
+    (inshape, outshape) = mapreduce.MapReduce.get_shapes(arrin, 2)
+    rfunc = lambda ch: arrin[:, ch[1]:ch[1] + ch[3], ch[0]:ch[0] + ch[2]]
+    mr = mapreduce.MapReduce(inshape, outshape, rfunc, _pfunc, shared=True)
+    actual = numpy.zeros(outshape)
+
+    def writer(output, ch):
+        actual[:, ch[1]:ch[1] + ch[3], ch[0]:ch[0] + ch[2]] = output
+
+    mr.stream(writer, nchunks=7)
+
+    numpy.testing.assert_array_equal(expected, actual)
+
+
+def t_map_reduce_array_outdtype():
+    """Confirm outputs take the given dtype, with nodata where pixels weren't processed."""
+    arrin = _input()
+    classify = lambda data: (data.sum(axis=0) > 4000).astype('uint8')
+    expected = numpy.array(mapreduce._test_map_reduce_array(arrin, classify, nchunks=7))
+    expected[numpy.isnan(expected)] = 255
+
+    actual = mapreduce.map_reduce_array(arrin, classify, nchunks=7, shared=True,
+                                        outdtype='uint8', nodata=255)
+
+    assert actual.dtype == numpy.uint8
+    assert actual[5, 7] == 255
+    numpy.testing.assert_array_equal(expected.squeeze().astype('uint8'), actual)
@@ -85,7 +85,7 @@ def t_fetch_asset_found_case(mocker):
 
     ### assertions
     assert len(actual) == 1 and actual[0].endswith(asset_fn)
-    assert mocker.call(listing_url, verbosity=2) == managed_request.call_args_list[0]
+    assert mocker.call(listing_url, verbosity=2, raise_errors=True) == managed_request.call_args_list[0]
     listing.readlines.assert_called_once_with()
     # request assertions:  response = request.get(...) && response.iter_content()
     managed_request.assert_called_with(listing_url + '/' + asset_fn)
@@ -160,3 +160,18 @@ def t_http_matching_listings(mocker, fetch_mocks, a_type, tile, date, asset_fn,
             and open.call_args[0][0] == 'some-file-path'
             # file write assertions:  open(...) as fd && fd.write(...)
             and (asset_content,) == file.write.call_args[0])
+
+def t_query_earthdata_shares_listing(mpo, mocker):
+    """Confirm one directory listing serves every tile for a given date."""
+    modis.modisAsset.earthdata_listing.cache_clear()
+    managed_request = mpo(modis.modisRepository, 'managed_request')
+    managed_request.return_value.readlines.return_value = MOD11A1_listing
+    date = dt(2012, 12, 1, 0, 0)
+
+    actual = [modis.modisAsset.query_earthdata('MOD11A1', t, date)['basename']
+              for t in ('h12v03', 'h12v04', 'h12v05')]
+
+    assert (managed_request.call_count == 1
+            and actual == ['MOD11A1.A2012336.h12v03.005.2012339180912.hdf',
+                           'MOD11A1.A2012336.h12v04.005.2012339180517.hdf',
+                           'MOD11A1.A2012336.h12v05.005.2012339042544.hdf'])
@@ -0,0 +1,118 @@
+"""Unit tests for gips.data.query_cache & Asset.cached_query_service."""
+
+import datetime
+
+import pytest
+
+from gips.data import query_cache
+from gips.data.modis import modis
+
+
+atd = ('MOD11A1', 'h12v04', datetime.date(2012, 12, 1))
+
+@pytest.fixture
+def cache_path(tmpdir):
+    return str(tmpdir.join('query-cache.sqlite3'))
+
+
+@pytest.mark.parametrize('result', (None, {'basename': 'a.hdf', 'url': 'u'}))
+def t_store_and_lookup(cache_path, result):
+    """Positive & negative results both survive the round trip."""
+    query_cache.store(cache_path, 'modis', *(atd + ({}, result, None)))
+    hit, actual = query_cache.lookup(cache_path, 'modis', *(atd + ({},)))
+    assert hit and actual == result and all(
+        type(v) is str for v in (actual or {}).values())
+
+
+def t_lookup_expired_and_kwargs(cache_path):
+    """Expired entries are misses, as are entries with other kwargs."""
+    query_cache.store(cache_path, 'modis', *(atd + ({}, None, -1)))
+    query_cache.store(cache_path, 'modis',
+                      *(atd + ({'pclouds': 50}, None, None)))
+    expired = query_cache.lookup(cache_path, 'modis', *(atd + ({},)))
+    other_kwargs = query_cache.lookup(
+        cache_path, 'modis', *(atd + ({'pclouds': 20},)))
+    assert (expired == other_kwargs == (False, None)
+            and query_cache.purge(cache_path, expired=True) == 1
+            and len(query_cache.entries(cache_path)) == 1)
+
+
+def t_cached_query_service(mpo, cache_path):
+    """Confirm a second query is answered from the cache."""
+    settings = {'query-cache': True, 'query-cache-settled-days': 30}
+    mpo(modis.modisAsset, 'get_setting').side_effect = lambda k: settings[k]
+    mpo(modis.modisAsset, 'query_cache_path').return_value = cache_path
+    m_query_service = mpo(modis.modisAsset, 'query_service')
+    m_query_service.return_value = None
+
+    results = [modis.modisAsset.cached_query_service(*atd) for _ in range(2)]
+
+    # the date is long settled, so its negative result never expires
+    assert (results == [None, None] and m_query_service.call_count == 1
+            and query_cache.entries(cache_path)[0]['expires'] is None)
+
+
+def t_cached_query_service_refresh(mpo, cache_path):
+    """Confirm refresh queries the service regardless & updates the cache."""
+    settings = {'query-cache': True, 'query-cache-settled-days': 30}
+    mpo(modis.modisAsset, 'get_setting').side_effect = lambda k: settings[k]
+    mpo(modis.modisAsset, 'query_cache_path').return_value = cache_path
+    m_query_service = mpo(modis.modisAsset, 'query_service')
+    m_query_service.side_effect = [None, {'basename': 'a.hdf', 'url': 'u'}]
+
+    modis.modisAsset.cached_query_service(*atd)
+    refreshed = modis.modisAsset.cached_query_service(*atd, refresh=True)
+
+    assert refreshed == {'basename': 'a.hdf', 'url': 'u'}
+    assert m_query_service.call_count == 2
+    assert modis.modisAsset.cached_query_service(*atd) == refreshed
+
+
+@pytest.mark.parametrize('update', (False, True))
+def t_need_to_fetch_update_refreshes(mpo, update):
+    """Confirm need_to_fetch only trusts the query cache when not updating."""
+    mpo(modis.modisAsset, 'discover_asset').return_value = None
+    m_cqs = mpo(modis.modisAsset, 'cached_query_service')
+    m_cqs.return_value = None
+
+    assert not modis.modisData.need_to_fetch(*(atd + (update,)))
+    m_cqs.assert_called_once_with(*atd, refresh=update)
+
+
+def t_cached_query_service_failure(mpo, cache_path):
+    """Confirm a failed query isn't cached, so the next call queries again."""
+    settings = {'query-cache': True, 'query-cache-settled-days': 30}
+    mpo(modis.modisAsset, 'get_setting').side_effect = lambda k: settings[k]
+    mpo(modis.modisAsset, 'query_cache_path').return_value = cache_path
+    m_query_service = mpo(modis.modisAsset, 'query_service')
+    m_query_service.side_effect = [IOError('listing unavailable'), None]
+
+    with pytest.raises(IOError):
+        modis.modisAsset.cached_query_service(*atd)
+    assert query_cache.entries(cache_path) == []
+
+    assert modis.modisAsset.cached_query_service(*atd) is None
+    assert m_query_service.call_count == 2
+
+
+@pytest.mark.parametrize('code', (404, 503))
+def t_cached_query_service_http_errors(mpo, cache_path, code):
+    """Confirm a missing date directory is cached as no asset, but a server error raises."""
+    import urllib2
+    from gips.data import core
+    settings = {'query-cache': True, 'query-cache-settled-days': 30, 'source': 'usgs'}
+    mpo(modis.modisAsset, 'get_setting').side_effect = lambda k: settings[k]
+    mpo(modis.modisAsset, 'query_cache_path').return_value = cache_path
+    mpo(modis.modisRepository, 'get_setting').return_value = 'setting'
+    m_urlopen = mpo(core.urllib2, 'urlopen')
+    m_urlopen.side_effect = urllib2.HTTPError('url', code, 'reason', {}, None)
+    modis.modisAsset.earthdata_listing.cache_clear()
+    atd8 = ('MOD11A2', 'h12v04', datetime.date(2012, 12, 2)) # no composite that day
+
+    if code == 404:
+        assert modis.modisAsset.cached_query_service(*atd8) is None
+        assert len(query_cache.entries(cache_path)) == 1
+    else:
+        with pytest.raises(IOError):
+            modis.modisAsset.cached_query_service(*atd8)
+        assert query_cache.entries(cache_path) == []
@@ -0,0 +1,33 @@
+"""Unit tests for gips.statistics."""
+
+import numpy
+import pytest
+
+from gips import statistics
+
+
+def t_moments_blockwise():
+    """Confirm moments merged block by block match computing them all at once."""
+    values = numpy.random.RandomState(0).gamma(2.0, size=10000) + 100
+    moments = statistics.Moments()
+    for block in numpy.array_split(values, 7):
+        moments.add(block)
+    moments.add(numpy.zeros(0))
+
+    d = values - values.mean()
+    expected = [values.min(), values.max(), values.mean(), values.std(),
+                (d ** 3).mean() / values.std() ** 3, len(values)]
+    assert moments.stats() == pytest.approx(expected)
+
+
+def t_hist_percentiles():
+    """Confirm histogram percentiles are within a bin width of exact ones."""
+    values = numpy.random.RandomState(0).normal(size=10000)
+    edges = numpy.linspace(values.min(), values.max(), 1001)
+    hist = numpy.histogram(values, bins=edges)[0]
+
+    actual = statistics.hist_percentiles(hist, edges, [1, 25, 50, 90])
+
+    binwidth = edges[1] - edges[0]
+    expected = numpy.percentile(values, [1, 25, 50, 90])
+    assert numpy.all(numpy.abs(numpy.array(actual) - expected) <= binwidth)
@@ -0,0 +1,83 @@
+"""Unit tests for gips.data.tile_index & Repository.vector2tiles_many."""
+
+import pytest
+
+from gips.data import tile_index
+
+
+@pytest.fixture
+def tiles_shp(tmpdir):
+    """Two 10 x 10 tiles, 'A' & 'B', side by side."""
+    from osgeo import ogr, osr
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(32618)
+    shp = str(tmpdir.join('tiles.shp'))
+    layer = ogr.GetDriverByName('ESRI Shapefile').CreateDataSource(shp).CreateLayer(
+        'tiles', srs, ogr.wkbPolygon)
+    layer.CreateField(ogr.FieldDefn('tile', ogr.OFTString))
+    for name, x in (('A', 0), ('B', 10)):
+        feat = ogr.Feature(layer.GetLayerDefn())
+        feat.SetField('tile', name)
+        feat.SetGeometry(ogr.CreateGeometryFromWkt(
+            'POLYGON (({0} 0, {1} 0, {1} 10, {0} 10, {0} 0))'.format(x, x + 10)))
+        layer.CreateFeature(feat)
+    feat = layer = None
+    return shp, srs.ExportToWkt()
+
+
+def t_tile_index_coverage_and_cache(mocker, tiles_shp):
+    """Confirm coverage matches vector2tiles' & the saved index is reused."""
+    shp, wkt = tiles_shp
+    mocker.patch.object(tile_index, '_indexes', {})
+    m_open_vector = mocker.patch.object(tile_index.utils, 'open_vector')
+    m_open_vector.return_value = mocker.Mock(**{'Filename.return_value': shp,
+                                                'LayerName.return_value': ''})
+    feature2tile = lambda f: f.GetField('tile')
+    m_build = mocker.patch.object(tile_index, 'build', side_effect=tile_index.build)
+
+    index = tile_index.get('modis', shp, feature2tile)
+    site = index.warp('POLYGON ((5 2, 15 2, 15 7, 5 7, 5 2))', wkt)
+
+    assert tile_index.get('modis', shp, feature2tile) is index
+    assert index.coverage(site) == {'A': (0.5, 0.25), 'B': (0.5, 0.25)}
+    assert index.coverage(site, pcov=60) == {}
+    assert index.coverage(site, tilelist=['B']) == {'B': (0.5, 0.25)}
+    tile_index._indexes.clear()
+    saved = tile_index.get('modis', shp, feature2tile)
+    assert m_build.call_count == 1
+    assert saved.tiles == ['A', 'B'] and saved.coverage(site) == index.coverage(site)
+
+
+def t_vector2tiles_many(mocker, tiles_shp):
+    """Confirm vector2tiles_many gives each vector's vector2tiles result, in order."""
+    from gips.data.modis.modis import modisRepository
+    shp, wkt = tiles_shp
+    mocker.patch.object(tile_index, '_indexes', {})
+    m_open_vector = mocker.patch.object(tile_index.utils, 'open_vector')
+    m_open_vector.return_value = mocker.Mock(**{'Filename.return_value': shp,
+                                                'LayerName.return_value': ''})
+    mocker.patch.object(modisRepository, 'get_setting', return_value=shp)
+    mocker.patch.object(modisRepository, '_tile_attribute', 'tile')
+    vectors = [mocker.Mock(**{'WKT.return_value': w, 'Projection.return_value': wkt})
+               for w in ('POLYGON ((1 1, 9 1, 9 9, 1 9, 1 1))',
+                         'POLYGON ((11 1, 19 1, 19 9, 11 9, 11 1))')]
+
+    coverages = modisRepository.vector2tiles_many(vectors)
+
+    assert [sorted(c) for c in coverages] == [['A'], ['B']]
+    assert modisRepository.vector2tiles(vectors[1]) == coverages[1]
+
+
+def t_vector2tiles_many_override(mocker):
+    """Confirm drivers overriding vector2tiles are used through SpatialExtent.factory."""
+    from gips.core import SpatialExtent
+    from gips.data.aod.aod import aodData, aodRepository
+    features = [mocker.Mock(), mocker.Mock()]
+    mocker.patch('gips.core.open_vector', return_value=iter(features))
+    m_tile_index = mocker.patch.object(aodRepository, 'tile_index')
+
+    extents = SpatialExtent.factory(aodData, site='site.shp')
+
+    m_tile_index.assert_not_called()
+    assert [e.site for e in extents] == features
+    assert all(e.coverage == {aodRepository._the_tile: (1, 1)} for e in extents)
@@ -1,6 +1,7 @@
 """Unit tests for code found in gips.utils."""
 
 import sys
+import os
 import datetime
 
 import pytest
@@ -36,6 +37,53 @@ def t_remove_files_no_ext(mocker):
     assert m_os_remove.call_count == 2
 
 
+def t_list_files_caching(tmpdir):
+    """list_files should list a directory once, until it changes."""
+    [tmpdir.join(fn).write('') for fn in ('a.hdf', 'b.tif')]
+    tmpdir.mkdir('subdir')
+    os.utime(str(tmpdir), (0, 0)) # so its listing is cacheable
+    first = utils.list_files(str(tmpdir))
+    tmpdir.join('c.tif').write('') # bypasses the cache, but alters mtime
+    os.utime(str(tmpdir), (1, 1))
+    second = utils.list_files(str(tmpdir))
+    assert (sorted(first) == ['a.hdf', 'b.tif']
+            and utils._file_listings[str(tmpdir)] == (1, second)
+            and sorted(second) == ['a.hdf', 'b.tif', 'c.tif']
+            and utils.find_files(r'.*\.tif$', str(tmpdir)) ==
+                [str(tmpdir.join(fn)) for fn in second if fn.endswith('.tif')])
+
+
+def t_list_files_cache_bound(mocker, tmpdir):
+    """list_files should only keep the most recently used listings."""
+    mocker.patch.object(utils, '_file_listings', utils.OrderedDict())
+    mocker.patch.object(utils, '_max_file_listings', 2)
+    dirs = [str(tmpdir.mkdir(d)) for d in ('a', 'b', 'c')]
+    [os.utime(d, (0, 0)) for d in dirs] # so their listings are cacheable
+    utils.list_files(dirs[0])
+    utils.list_files(dirs[1])
+    utils.list_files(dirs[0]) # a is now most recent
+    utils.list_files(dirs[2]) # so b is dropped
+    assert utils._file_listings.keys() == [dirs[0], dirs[2]]
+
+
+def t_list_files_threads(mocker, tmpdir):
+    """list_files should keep its cache consistent when called from many threads."""
+    from multiprocessing.pool import ThreadPool
+    mocker.patch.object(utils, '_file_listings', utils.OrderedDict())
+    mocker.patch.object(utils, '_max_file_listings', 4)
+    dirs = [str(tmpdir.mkdir(str(i))) for i in range(20)]
+    for d in dirs:
+        open(os.path.join(d, 'a.tif'), 'w').close()
+        os.utime(d, (0, 0)) # so their listings are cacheable
+    pool = ThreadPool(8)
+    try:
+        listings = pool.map(utils.list_files, dirs * 50)
+    finally:
+        pool.close()
+    assert (listings == [('a.tif',)] * len(listings)
+            and len(utils._file_listings) == 4)
+
+
 def t_settings_user(mocker):
     """gips.settings should load user settings first."""
     mocker.patch.object(utils.os.path, 'isfile').return_value = True
@@ -251,3 +299,99 @@ def t_cli_error_handler_continuable_case(mocker):
 def t_prune_unhashable(mocker, input, expected):
     actual = utils.prune_unhashable(input)
     assert expected == actual
+
+
+def t_mosaic(mocker, tmpdir):
+    """Confirm mosaic combines tiles over the vector's bounds, masked to its layer."""
+    import mock
+    import numpy
+    from osgeo import gdal, ogr, osr
+    m_geoimage = mocker.patch.object(utils.gippy, 'GeoImage')
+    mocker.patch.object(utils, 'settings', return_value=mocker.Mock(GIPS_MASK_CACHE=None))
+    mocker.patch.object(utils, '_site_masks', utils.OrderedDict())
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(32618)
+    wkt = srs.ExportToWkt()
+    # two 10 x 10 tiles of 10m pixels, side by side
+    images = []
+    for i in range(2):
+        fn = str(tmpdir.join('tile%d.tif' % i))
+        ds = gdal.GetDriverByName('GTiff').Create(fn, 10, 10, 1, gdal.GDT_Byte)
+        ds.SetGeoTransform((100 * i, 10, 0, 100, 0, -10))
+        ds.SetProjection(wkt)
+        ds.GetRasterBand(1).SetNoDataValue(0)
+        ds.GetRasterBand(1).WriteArray(numpy.full((10, 10), i + 1, dtype='uint8'))
+        ds = None
+        img = mock.MagicMock(**{'Filename.return_value': fn, 'Projection.return_value': wkt,
+                                'NumBands.return_value': 1})
+        img[0].NoDataValue.return_value = 0
+        images.append(img)
+    m_images = mock.MagicMock(**{'NumImages.return_value': 2})
+    m_images.__getitem__.side_effect = images.__getitem__
+    # an L shape; the notch at its upper right is partly over 2 columns & rows of pixels
+    shape = 'POLYGON ((50 20, 150 20, 150 55, 105 55, 105 80, 50 80, 50 20))'
+    shp = str(tmpdir.join('site.shp'))
+    layer = ogr.GetDriverByName('ESRI Shapefile').CreateDataSource(shp).CreateLayer(
+        'site', srs, ogr.wkbPolygon)
+    feat = ogr.Feature(layer.GetLayerDefn())
+    feat.SetGeometry(ogr.CreateGeometryFromWkt(shape))
+    layer.CreateFeature(feat)
+    feat = layer = None
+    vector = mock.Mock(**{'WKT.return_value': shape, 'Projection.return_value': wkt,
+                          'Filename.return_value': shp, 'LayerName.return_value': ''})
+    outfile = str(tmpdir.join('mosaic.tif'))
+
+    utils.mosaic(m_images, outfile, vector)
+
+    ds = gdal.Open(outfile)
+    expected = numpy.array([[1] * 5 + [2] * 5] * 6, dtype='uint8')
+    expected[:2, 6:] = 0
+    assert ds.GetGeoTransform() == (50, 10, 0, 80, 0, -10)
+    assert ds.GetRasterBand(1).GetNoDataValue() == 0
+    numpy.testing.assert_array_equal(ds.ReadAsArray(), expected)
+    m_geoimage.assert_called_once_with(outfile, True)
+
+
+def t_site_mask_cache(mocker, tmpdir):
+    """Confirm site masks are rasterized once per grid, in memory & in GIPS_MASK_CACHE."""
+    from osgeo import gdal, ogr, osr
+    cachedir = str(tmpdir.join('masks'))
+    mocker.patch.object(utils, 'settings', return_value=mocker.Mock(GIPS_MASK_CACHE=cachedir))
+    mocker.patch.object(utils, '_site_masks', utils.OrderedDict())
+    m_rasterize = mocker.patch.object(gdal, 'RasterizeLayer', side_effect=gdal.RasterizeLayer)
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(32618)
+    shp = str(tmpdir.join('site.shp'))
+    layer = ogr.GetDriverByName('ESRI Shapefile').CreateDataSource(shp).CreateLayer(
+        'site', srs, ogr.wkbPolygon)
+    feat = ogr.Feature(layer.GetLayerDefn())
+    feat.SetGeometry(ogr.CreateGeometryFromWkt('POLYGON ((1 1, 19 1, 19 19, 1 19, 1 1))'))
+    layer.CreateFeature(feat)
+    feat = layer = None
+    vector = mocker.Mock(**{'Filename.return_value': shp, 'LayerName.return_value': ''})
+    grid = (srs.ExportToWkt(), [0.0, 10.0, 0.0, 40.0, 0.0, -10.0], 4, 4)
+
+    first = utils.site_mask(vector, grid)
+    assert utils.site_mask(vector, grid) is first # from memory
+    utils._site_masks.clear()
+    from_disk = utils.site_mask(vector, grid)
+    utils.site_mask(vector, grid[:3] + (5,))       # another grid is rasterized anew
+
+    assert m_rasterize.call_count == 2
+    assert first.tolist() == [[0] * 4] * 2 + [[1, 1, 0, 0]] * 2
+    assert from_disk.tolist() == first.tolist()
+    assert len(os.listdir(cachedir)) == 2
+
+
+def t_warp_args(mocker):
+    """Confirm gdalwarp arguments come from settings, overridden by set_warp_options."""
+    mocker.patch.object(utils, '_warp_options', {})
+    m_settings = mocker.patch.object(utils, 'settings')
+    m_settings.return_value = mocker.Mock(
+        GIPS_WARP_MEMORY=512, GIPS_WARP_THREADS=1, GIPS_GDAL_CACHEMAX=None,
+        GIPS_WARP_CREATION_OPTIONS=['TILED=YES'])
+    assert utils.warp_args() == ['-wm', '512', '-co', 'TILED=YES']
+
+    utils.set_warp_options(threads='ALL_CPUS', creation_options=[])
+
+    assert utils.warp_args() == ['-wm', '512', '-multi', '-wo', 'NUM_THREADS=ALL_CPUS']
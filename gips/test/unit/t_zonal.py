@@ -0,0 +1,95 @@
+"""Unit tests for gips.zonal."""
+
+import os
+
+import numpy
+import pytest
+
+from gips import zonal
+
+
+def t_summarize():
+    """Confirm per-zone stats match computing them zone by zone with numpy."""
+    rs = numpy.random.RandomState(0)
+    zone = rs.randint(1, 6, size=1000)
+    zone[zone == 3] = 4 # zone 3 has no values, so gets no row
+    values = rs.normal(size=1000)
+
+    actual = zonal.summarize(zone, values, percentiles=(10, 50, 95))
+
+    assert list(actual['zone_id']) == [1, 2, 4, 5]
+    for i, z in enumerate(actual['zone_id']):
+        v = values[zone == z]
+        assert actual['count'][i] == len(v)
+        assert actual['mean'][i] == pytest.approx(v.mean())
+        assert actual['sd'][i] == pytest.approx(v.std())
+        d = v - v.mean()
+        assert actual['skew'][i] == pytest.approx((d ** 3).mean() / v.std() ** 3)
+        assert (actual['min'][i], actual['max'][i]) == (v.min(), v.max())
+        for q in (10, 50, 95): # approximate, to within a bin width
+            assert abs(actual['p%g' % q][i] - numpy.percentile(v, q)) <= (v.max() - v.min()) / 1000
+
+
+def t_zonal_stats_blocks(mocker, tmpdir):
+    """Confirm zonal stats accumulated a row at a time match those of the whole image."""
+    rs = numpy.random.RandomState(0)
+    zones = rs.randint(0, 4, size=(6, 5)).astype('int32')
+    image = rs.normal(size=(6, 5))
+    image[2, 3] = -9999 # nodata
+    zonefile = str(tmpdir.join('zones.npy'))
+    numpy.save(zonefile, zones)
+    band = mocker.Mock(**{'NoDataValue.return_value': -9999, 'Description.return_value': 'b'})
+    band.Read.side_effect = lambda ch: image[ch[1]:ch[1] + ch[3], ch[0]:ch[0] + ch[2]]
+    mocker.patch.object(zonal.gippy, 'GeoImage', return_value=[band])
+    mocker.patch.object(zonal.gippy, 'Recti', side_effect=lambda *ch: list(ch))
+    valid = (zones > 0) & (image != -9999)
+    expected = zonal.summarize(zones[valid], image[valid], percentiles=(50,), bins=10)
+
+    [(bname, actual)] = zonal.zonal_stats('image.tif', zonefile, 3, (50,), bins=10, rows=1)
+
+    assert bname == 'b' and sorted(actual) == sorted(expected)
+    for name in expected:
+        numpy.testing.assert_allclose(actual[name], expected[name])
+
+
+def t_zone_cache_incomplete(mocker, tmpdir):
+    """Confirm zones are rasterized again if an earlier run left no keys file."""
+    site = tmpdir.join('site.shp')
+    site.ensure()
+    zones = numpy.array([[0, 1], [2, 2]], dtype='int32')
+    m_rasterize = mocker.patch.object(zonal, 'rasterize', return_value=(zones, ['a', 'b']))
+    cachedir = str(tmpdir.join('zones'))
+    grid = ('WKT', [0.0, 1.0, 0.0, 2.0, 0.0, -1.0], 2, 2)
+    cache = zonal.ZoneCache(str(site), cachedir)
+    path, _ = cache.get(grid)
+    tmpdir.join('zones', os.path.basename(path)[:-4] + '.json').remove() # interrupted run
+
+    path, keys = zonal.ZoneCache(str(site), cachedir).get(grid)
+
+    assert m_rasterize.call_count == 2
+    assert keys == ['a', 'b']
+    numpy.testing.assert_array_equal(numpy.load(path), zones)
+    assert len(tmpdir.join('zones').listdir()) == 2 # no temporary files left behind
+
+
+def t_rasterize_layer_name(mocker, tmpdir):
+    """Confirm the site's named layer is rasterized, not the first one."""
+    from osgeo import ogr, osr
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(32618)
+    src = ogr.GetDriverByName('ESRI Shapefile').CreateDataSource(str(tmpdir))
+    for name, wkt in (('first', 'POLYGON ((0 0, 1 0, 1 1, 0 1, 0 0))'),
+                      ('second', 'POLYGON ((0 0, 2 0, 2 2, 0 2, 0 0))')):
+        layer = src.CreateLayer(name, srs, ogr.wkbPolygon)
+        feat = ogr.Feature(layer.GetLayerDefn())
+        feat.SetGeometry(ogr.CreateGeometryFromWkt(wkt))
+        layer.CreateFeature(feat)
+    src = None
+    mocker.patch.object(zonal.utils, 'open_vector', return_value=mocker.Mock(**{
+        'Filename.return_value': str(tmpdir), 'LayerName.return_value': 'second'}))
+    grid = (srs.ExportToWkt(), [0.0, 1.0, 0.0, 2.0, 0.0, -1.0], 2, 2)
+
+    zones, keys = zonal.rasterize('db:second', grid)
+
+    assert keys == [0]
+    numpy.testing.assert_array_equal(zones, [[1, 1], [1, 1]])
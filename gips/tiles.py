@@ -81,53 +81,59 @@ class Tiles(object):
         if self.spatial.site is None:
             raise Exception('Site required for creating mosaics')
         start = datetime.now()
-        bname = self.date.strftime('%Y%j')
-
-        # look in each Data() and dig out its (sensor, product_type) pairs
-        sp_pile = [(s, p) for d in self.tiles.values() for (s, p) in d.filenames
-                        if p in self.products.products]
-        # work on each product in turn, gathering up filenames as needed
-        for (sensor, product) in sp_pile:
-            # create data directory when it is needed
-            mkdir(datadir)
-            # TODO - this is assuming a tif file.  Use gippy FileExtension function when it is exposed
-            fn = '{}_{}_{}.tif'.format(bname, sensor, product)
-            final_fp = os.path.join(datadir, fn)
-            if not os.path.exists(final_fp) or overwrite:
-                err_msg = ("Error mosaicking " + final_fp + ". Did you forget"
-                           " to specify a resolution (`--res x x`)?")
-                with utils.error_handler(err_msg, continuable=True), \
-                        utils.make_temp_dir(dir=datadir,
-                                            prefix='mosaic') as tmp_dir:
-                    tmp_fp = os.path.join(tmp_dir, fn) # for safety
-
-                    #try:
-                    #    filenames = [self.tiles[t].filenames[(sensor, product)] for t in self.tiles]
-                    #except KeyError:
-                    #    # from pdb import set_trace; set_trace()
-                    #    print "skipping: ", self.date, datadir, sensor, product
-                    #    continue
-
-                    filenames = [str(self.tiles[t].filenames[(sensor, product)])
-                                 for t in self.tiles
-                                 if (sensor, product) in self.tiles[t].filenames
-                    ]
-
-                    images = gippy.GeoImages(filenames)
-                    if self.spatial.rastermask is not None:
-                        gridded_mosaic(images, tmp_fp,
-                                       self.spatial.rastermask, interpolation)
-                    elif self.spatial.site is not None and res is not None:
-                        CookieCutter(
-                            images, self.spatial.site, tmp_fp, res[0], res[1],
-                            crop, interpolation, {}, alltouch,
-                        )
-                    else:
-                        mosaic(images, tmp_fp, self.spatial.site)
-                    os.rename(tmp_fp, final_fp)
+        for (sensor, product) in self.mosaic_pile():
+            err_msg = ("Error mosaicking {} {} {}. Did you forget to specify a"
+                       " resolution (`--res x x`)?".format(self.date, sensor, product))
+            with utils.error_handler(err_msg, continuable=True):
+                self.mosaic_product(sensor, product, datadir, res, interpolation,
+                                    crop, overwrite, alltouch)
         t = datetime.now() - start
         VerboseOut('%s: created project files for %s tiles in %s' % (self.date, len(self.tiles), t), 2)
 
+    def mosaic_pile(self):
+        """ Sorted (sensor, product) pairs of the requested products found in any tile """
+        # look in each Data() and dig out its (sensor, product_type) pairs
+        return sorted(set((s, p) for d in self.tiles.values() for (s, p) in d.filenames
+                          if p in self.products.products))
+
+    def mosaic_product(self, sensor, product, datadir, res=None, interpolation=0,
+                       crop=False, overwrite=False, alltouch=False):
+        """Combine the tiles of one (sensor, product) into a mosaic in datadir.
+
+        The mosaic is made in a temporary directory then moved into place, so
+        a failed or concurrent mosaic never leaves a partial file behind.
+        """
+        if self.spatial.site is None:
+            raise Exception('Site required for creating mosaics')
+        bname = self.date.strftime('%Y%j')
+        # create data directory when it is needed
+        mkdir(datadir)
+        # TODO - this is assuming a tif file.  Use gippy FileExtension function when it is exposed
+        fn = '{}_{}_{}.tif'.format(bname, sensor, product)
+        final_fp = os.path.join(datadir, fn)
+        if os.path.exists(final_fp) and not overwrite:
+            return
+        with utils.make_temp_dir(dir=datadir, prefix='mosaic') as tmp_dir:
+            tmp_fp = os.path.join(tmp_dir, fn) # for safety
+
+            filenames = [str(self.tiles[t].filenames[(sensor, product)])
+                         for t in self.tiles
+                         if (sensor, product) in self.tiles[t].filenames
+            ]
+
+            images = gippy.GeoImages(filenames)
+            if self.spatial.rastermask is not None:
+                gridded_mosaic(images, tmp_fp,
+                               self.spatial.rastermask, interpolation)
+            elif self.spatial.site is not None and res is not None:
+                CookieCutter(
+                    images, self.spatial.site, tmp_fp, res[0], res[1],
+                    crop, interpolation, {}, alltouch,
+                )
+            else:
+                mosaic(images, tmp_fp, self.spatial.site)
+            os.rename(tmp_fp, final_fp)
+
     def asset_coverage(self):
         """ Calculates % coverage of site for each asset """
         asset_coverage = {}
@@ -204,3 +210,43 @@ class Tiles(object):
             except (TypeError, KeyError):
                 sys.stdout.write(p_type_str)
         sys.stdout.write('\n')
+
+
+class LazyTiles(Tiles):
+    """ Tiles that searches for its Data objects only when they are needed
+
+    Holds just the ids of the tiles that have a directory for the date.
+    The first access to self.tiles instantiates, validates and filters
+    their Data objects; release() drops them again so that inventories
+    spanning many dates can be worked through one date at a time.
+    """
+
+    def __init__(self, dataclass, spatial, date, products=None, tile_ids=(), **kwargs):
+        super(LazyTiles, self).__init__(dataclass, spatial, date, products, **kwargs)
+        self.tile_ids = sorted(tile_ids)
+        self.filter_kwargs = kwargs
+        self._tiles = None
+
+    @property
+    def tiles(self):
+        """ Mapping of tile IDs to Data instances, searched on first use """
+        if self._tiles is None:
+            self._tiles = {}
+            for t in self.tile_ids:
+                data_obj = self.dataclass(t, self.date, search=True)
+                if data_obj.valid and data_obj.filter(**self.filter_kwargs):
+                    self._tiles[t] = data_obj
+        return self._tiles
+
+    @tiles.setter
+    def tiles(self, value):
+        # Tiles.__init__ assigns {}; leave that to mean 'not searched yet'
+        self._tiles = value or None
+
+    @property
+    def materialized(self):
+        return self._tiles is not None
+
+    def release(self):
+        """ Drop the Data objects; they are searched for again if needed """
+        self._tiles = None
@@ -35,6 +35,9 @@ import traceback
 import datetime
 import time
 import json
+import hashlib
+import threading
+from collections import OrderedDict
 
 import numpy as np
 import requests
@@ -42,6 +45,11 @@ import requests
 import gippy
 from gippy import GeoVector
 
+try:
+    from scandir import scandir # os.scandir isn't available until python 3.5
+except ImportError:
+    scandir = None
+
 
 class Colors():
     _c = '\033['
@@ -206,19 +214,50 @@ def make_temp_dir(suffix='', prefix='tmp', dir=None):
             verbose_out('GIPS_DEBUG: Orphaning {}'
                         .format(absolute_pathname), 1)
 
+_file_listings = OrderedDict() # {path: (mtime, filenames)}, most recently used last; see list_files
+_max_file_listings = 256
+_file_listings_lock = threading.Lock() # list_files is called from fetch & rectify threads
+
+def list_files(path):
+    """Return the names of the regular files in the given directory.
+
+    Symbolic links to regular files are included.  The listings of the
+    most recently used _max_file_listings directories are cached, keyed
+    on the directory's mtime so later changes are seen; a listing made
+    within a second of the directory's last change isn't cached, since
+    mtime may be too coarse to notice a further change within that
+    second.  The cache is shared between threads; directories are listed
+    outside its lock.  Raises OSError as os.listdir.
+    """
+    mtime = os.stat(path).st_mtime
+    with _file_listings_lock:
+        cached = _file_listings.pop(path, None)
+        if cached is not None and cached[0] == mtime:
+            _file_listings[path] = cached
+            return cached[1]
+    if scandir is not None: # saves a stat per entry on most filesystems
+        names = tuple(e.name for e in scandir(path) if e.is_file())
+    else:
+        names = tuple(f for f in os.listdir(path)
+                      if os.path.isfile(os.path.join(path, f)))
+    if time.time() - mtime > 1:
+        with _file_listings_lock:
+            _file_listings[path] = (mtime, names)
+            while len(_file_listings) > _max_file_listings:
+                _file_listings.popitem(last=False)
+    return names
+
+
 def find_files(regex, path='.'):
     """Find filenames in the given directory that match the regex.
 
     Returns a list of matching filenames; each includes the given path.
     Only regular files and symbolic links to regular files are returned.
+    The directory listing is shared with other callers; see list_files.
     """
     compiled_re = re.compile(regex)
-    ret = []
-    for f in os.listdir(path):
-        fpath = os.path.join(path, f)
-        if os.path.isfile(fpath) and compiled_re.match(f):
-            ret.append(fpath)
-    return ret
+    return [os.path.join(path, f) for f in list_files(path)
+            if compiled_re.match(f)]
 
 
 ##############################################################################
@@ -377,25 +416,84 @@ def transform(filename, srs):
     return fout
 
 
+_site_masks = OrderedDict() # {hash: mask}, most recently used last; see site_mask
+_max_site_masks = 8
+
+
+def _site_mask_hash(vector, grid):
+    """ Hash identifying vector's layer (by file, as stored) and grid """
+    fname = vector.Filename()
+    stat = os.stat(fname) if os.path.exists(fname) else None
+    ident = [os.path.abspath(fname) if stat else fname, vector.LayerName(),
+             [stat.st_size, stat.st_mtime] if stat else None, grid]
+    return hashlib.sha1(json.dumps(ident)).hexdigest()
+
+
+def site_mask(vector, grid):
+    """ uint8 mask of the pixels of grid touched by vector's layer (1) or not (0)
+
+    grid is (projection, affine, xsize, ysize).  Masks are rasterized once
+    and kept for the run, so every product and date mosaicked over the same
+    site and grid reuses them.  If the GIPS_MASK_CACHE setting names a
+    directory, they are also saved there, keyed by a hash of the vector
+    file and grid, and reused by later runs.
+    """
+    from osgeo import gdal, ogr
+    h = _site_mask_hash(vector, grid)
+    if h in _site_masks:
+        _site_masks[h] = _site_masks.pop(h)
+        return _site_masks[h]
+    cachedir = getattr(settings(), 'GIPS_MASK_CACHE', None)
+    path = os.path.join(cachedir, h + '.npy') if cachedir else None
+    if path is not None and os.path.exists(path):
+        mask = np.load(path, mmap_mode='r')
+    else:
+        projection, affine, xsize, ysize = grid
+        vds = ogr.Open(vector.Filename())
+        layer = vds.GetLayer(0) if vector.LayerName() == '' else vds.GetLayer(vector.LayerName())
+        ds = gdal.GetDriverByName('MEM').Create('', xsize, ysize, 1, gdal.GDT_Byte)
+        ds.SetProjection(projection)
+        ds.SetGeoTransform(affine)
+        # the layer is warped to the grid's projection as needed
+        gdal.RasterizeLayer(ds, [1], layer, burn_values=[1], options=['ALL_TOUCHED=TRUE'])
+        mask = ds.GetRasterBand(1).ReadAsArray()
+        ds = vds = None
+        verbose_out('Rasterized mask of {} onto {} x {} grid'.format(
+            vector.Filename(), xsize, ysize), 4)
+        if path is not None:
+            mkdir(cachedir)
+            # saved under a temporary name, so a mask file is only used once
+            # complete; concurrent processes may be saving the same mask
+            tmp = '{}.{}.tmp.npy'.format(path[:-4], os.getpid())
+            np.save(tmp, mask)
+            try:
+                os.rename(tmp, path)
+            except OSError:
+                if not os.path.exists(path):
+                    raise
+                os.remove(tmp)
+    _site_masks[h] = mask
+    while len(_site_masks) > _max_site_masks:
+        _site_masks.popitem(last=False)
+    return mask
+
+
 def crop2vector(img, vector):
-    """ Crop a GeoImage down to a vector - only used by mosaic """
-    # transform vector to srs of image
-    vecname = transform(vector.Filename(), img.Projection())
-    warped_vec = open_vector(vecname)
-    # rasterize the vector
-    td = tempfile.mkdtemp()
-    mask = gippy.GeoImage(os.path.join(td, vector.LayerName()), img, gippy.GDT_Byte, 1)
-    maskname = mask.Filename()
-    mask = None
-    cmd = 'gdal_rasterize -at -burn 1 -l %s %s %s' % (warped_vec.LayerName(), vecname, maskname)
-    result = commands.getstatusoutput(cmd)
-    VerboseOut('%s: %s' % (cmd, result), 4)
-    mask = gippy.GeoImage(maskname)
-    img.AddMask(mask[0]).Process().ClearMasks()
-    mask = None
-    shutil.rmtree(os.path.dirname(maskname))
-    shutil.rmtree(os.path.dirname(vecname))
-    # VerboseOut('Cropped to vector in %s' % (datetime.now() - start), 3)
+    """ Crop a GeoImage down to a vector, setting pixels outside it to nodata """
+    grid = (img.Projection(), [float(a) for a in img.Affine()][:6], img.XSize(), img.YSize())
+    mask = site_mask(vector, grid)
+    xsize, ysize = img.XSize(), img.YSize()
+    rows = max(int(gippy.Options.ChunkSize() * 2 ** 20 / (xsize * 8)), 1)
+    for y in range(0, ysize, rows):
+        h = min(rows, ysize - y)
+        outside = np.asarray(mask[y:y + h]) == 0
+        if not outside.any():
+            continue
+        chunk = gippy.Recti(0, y, xsize, h)
+        for band in img:
+            data = np.array(band.Read(chunk)).reshape((h, xsize))
+            data[outside] = band.NoDataValue()
+            band.Write(data, chunk)
     return img
 
 
@@ -458,7 +556,13 @@ def vectorize(img, vector, oformat=None):
 
 
 def mosaic(images, outfile, vector):
-    """ Mosaic multiple files together, but do not warp """
+    """ Mosaic multiple files together, but do not warp
+
+    The files are combined through an in-memory VRT covering the vector's
+    bounds, and written once, a block of rows at a time, with pixels not
+    touched by the vector's layer set to nodata.
+    """
+    from osgeo import gdal
     nd = images[0][0].NoDataValue()
     srs = images[0].Projection()
     # check they all have same projection
@@ -470,14 +574,32 @@ def mosaic(images, outfile, vector):
     # transform vector to image projection
     geom = wktloads(transform_shape(vector.WKT(), vector.Projection(), srs))
 
-    extent = geom.bounds
-    ullr = "%f %f %f %f" % (extent[0], extent[3], extent[2], extent[1])
+    # later files are on top, as for gdal_merge.py
+    vrtname = '/vsimem/{}.vrt'.format(os.path.basename(outfile))
+    vrt = gdal.BuildVRT(vrtname, filenames, outputBounds=geom.bounds,
+                        srcNodata=nd, VRTNodata=nd)
+    xsize, ysize, nbands = vrt.RasterXSize, vrt.RasterYSize, vrt.RasterCount
+    affine = vrt.GetGeoTransform()
+    out = gdal.GetDriverByName('GTiff').Create(
+        outfile, xsize, ysize, nbands, vrt.GetRasterBand(1).DataType)
+    out.SetGeoTransform(affine)
+    out.SetProjection(srs)
+    for b in range(nbands):
+        out.GetRasterBand(b + 1).SetNoDataValue(nd)
+
+    mask = site_mask(vector, (srs, list(affine), xsize, ysize))
+    rows = max(int(gippy.Options.ChunkSize() * 2 ** 20 / (xsize * nbands * 8)), 1)
+    for y in range(0, ysize, rows):
+        h = min(rows, ysize - y)
+        outside = np.asarray(mask[y:y + h]) == 0
+        for b in range(nbands):
+            data = vrt.GetRasterBand(b + 1).ReadAsArray(0, y, xsize, h)
+            data[outside] = nd
+            out.GetRasterBand(b + 1).WriteArray(data, 0, y)
+    out = vrt = None
+    gdal.Unlink(vrtname)
+    verbose_out('Mosaicked {} files into {}'.format(len(filenames), outfile), 4)
 
-    # run merge command
-    nodatastr = '-n %s -a_nodata %s -init %s' % (nd, nd, nd)
-    cmd = 'gdal_merge.py -o %s -ul_lr %s %s %s' % (outfile, ullr, nodatastr, " ".join(filenames))
-    result = commands.getstatusoutput(cmd)
-    VerboseOut('%s: %s' % (cmd, result), 4)
     imgout = gippy.GeoImage(outfile, True)
     imgout.SetMeta(
         'GIPS_MOSAIC_SOURCES',
@@ -486,11 +608,62 @@ def mosaic(images, outfile, vector):
     for b in range(0, images[0].NumBands()):
         imgout[b].CopyMeta(images[0][b])
     imgout.CopyColorTable(images[0])
-    return crop2vector(imgout, vector)
+    return imgout
+
+
+_warp_options = {} # overrides of the GIPS_WARP_* settings; see set_warp_options
+
+
+def set_warp_options(memory=None, threads=None, creation_options=None, cachemax=None):
+    """ Override the GIPS_WARP_* & GIPS_GDAL_CACHEMAX settings for this process
+
+    Options left as None keep their settings.  cachemax (MB) is applied as
+    GDAL's GDAL_CACHEMAX right away, so it applies to all of GDAL's I/O in
+    this process, including gippy's CookieCutter.
+    """
+    for k, v in (('memory', memory), ('threads', threads),
+                 ('creation_options', creation_options)):
+        if v is not None:
+            _warp_options[k] = v
+    if cachemax is None:
+        cachemax = getattr(settings(), 'GIPS_GDAL_CACHEMAX', None)
+    if cachemax is not None:
+        from osgeo import gdal
+        gdal.SetConfigOption('GDAL_CACHEMAX', str(cachemax))
+
+
+def warp_options():
+    """ (memory, threads, creation_options) for gdalwarp, from settings & set_warp_options """
+    s = settings()
+    defaults = {
+        'memory': getattr(s, 'GIPS_WARP_MEMORY', None),
+        'threads': getattr(s, 'GIPS_WARP_THREADS', None),
+        'creation_options': getattr(s, 'GIPS_WARP_CREATION_OPTIONS', []),
+    }
+    defaults.update(_warp_options)
+    return defaults['memory'], defaults['threads'], defaults['creation_options']
+
+
+def warp_args():
+    """ gdalwarp command line arguments for the warp options (see warp_options) """
+    memory, threads, creation_options = warp_options()
+    args = []
+    if memory is not None:
+        args += ['-wm', str(memory)]
+    if threads is not None and str(threads) != '1':
+        args += ['-multi', '-wo', 'NUM_THREADS={}'.format(threads)]
+    for co in creation_options:
+        args += ['-co', co]
+    return args
 
 
 def gridded_mosaic(images, outfile, rastermask, interpolation=0):
-    """ Mosaic multiple files to grid and mask specified in rastermask """
+    """ Mosaic multiple files to grid and mask specified in rastermask
+
+    gdalwarp creates outfile on rastermask's grid directly, initialized
+    to nodata, with the memory, threads & creation options of warp_args.
+    """
+    from osgeo import gdal
     nd = images[0][0].NoDataValue()
     mask_img = gippy.GeoImage(rastermask)
     srs = mask_img.Projection()
@@ -498,34 +671,30 @@ def gridded_mosaic(images, outfile, rastermask, interpolation=0):
     for f in range(1, images.NumImages()):
         filenames.append(images[f].Filename())
 
-    imgout = gippy.GeoImage(outfile, mask_img,
-                            images[0].DataType(), images[0].NumBands())
-
-    imgout.SetNoData(nd)
-    #imgout.ColorTable(images[0])
-
-    # Write an image that is completely NoDataValue so we can use gdalwarp to
-    # mosaic into it. This is done in chunks because allocating the entire thing
-    # at once can blow up memory for high-res data (e.g., 10m S2 tiles)
-    nband = images[0].NumBands()
-    chunks = imgout.Chunks()
-    for chunk in chunks:
-        nddata = np.full((chunk.y1(), chunk.x1()), nd)
-        for i_b in range(nband):
-            imgout[i_b].Write(nddata, chunk)
-    imgout = None
+    # target grid is exactly the rastermask's
+    x0, dx, _, y0, _, dy = [float(a) for a in mask_img.Affine()][:6]
+    xsize, ysize = mask_img.XSize(), mask_img.YSize()
+    xs, ys = sorted([x0, x0 + dx * xsize]), sorted([y0, y0 + dy * ysize])
 
     # run warp command
     resampler = ['near', 'bilinear', 'cubic']
-    cmd = "gdalwarp -t_srs '{}' -r {} {} {}".format(
+    cmd = ("gdalwarp -t_srs '{}' -te {} {} {} {} -ts {} {} -ot {} -r {}"
+           " -dstnodata {} -wo INIT_DEST=NO_DATA {} {} {}").format(
         srs,
+        repr(xs[0]), repr(ys[0]), repr(xs[1]), repr(ys[1]),
+        xsize, ysize,
+        gdal.GetDataTypeName(images[0].DataType()),
         resampler[interpolation],
+        repr(nd),
+        " ".join("'{}'".format(a) for a in warp_args()),
         " ".join(filenames),
         outfile
     )
     status, output = commands.getstatusoutput(cmd)
     verbose_out(' COMMAND: {}\n exit_status: {}\n output: {}'
                 .format(cmd, status, output ), 4)
+    if status != 0:
+        raise Exception('gdalwarp failed with exit status {}: {}'.format(status, output))
 
     imgout = gippy.GeoImage(outfile, True)
     imgout.SetMeta(
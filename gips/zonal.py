@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+################################################################################
+#    GIPS: Geospatial Image Processing System
+#
+#    Copyright (C) 2018 Applied Geosolutions
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>
+################################################################################
+
+""" Zonal statistics of images over the features of a vector file
+
+The features are rasterized once per image grid into a raster of zone ids
+(0 where there is no feature; where features overlap, the last one wins),
+which is cached on disk.  A pixel is in a feature's zone if the feature
+contains its center, so features too small or thin to contain any pixel
+center have no zone, and like zones without valid pixels, no statistics;
+how many is reported when the features are rasterized.  Statistics of all zones are then accumulated a
+block at a time, so memory use is bounded by the block size and number of
+zones, not the image size.  As in gips.statistics, percentiles are
+approximated from a histogram of fixed-width bins between each zone's min
+and max, which takes a second pass; they are within a bin width of exact.
+"""
+
+import os
+import json
+import hashlib
+import multiprocessing
+
+import numpy
+import gippy
+
+from gips import utils
+from gips.statistics import hist_percentiles, merge_moments, sd_skew
+
+STATS = ['count', 'mean', 'sd', 'skew', 'min', 'max']
+
+
+def grid(img):
+    """ (projection, affine, xsize, ysize) of a GeoImage """
+    return (img.Projection(), [float(a) for a in img.Affine()][:6], img.XSize(), img.YSize())
+
+
+def rasterize(site, grid, key='', where=''):
+    """ Rasterize site's features onto grid, returning (zones, keys)
+
+    zones is an int32 array of zone ids, where zone i is the feature whose
+    key value (FID if key isn't given) is keys[i - 1].  site is a file or
+    db layer, as for utils.open_vector.
+    """
+    from osgeo import gdal, ogr, osr
+    projection, affine, xsize, ysize = grid
+    v = utils.open_vector(site)
+    src = ogr.Open(v.Filename())
+    layer = src.GetLayer(0) if v.LayerName() == '' else src.GetLayer(v.LayerName())
+    if where != '':
+        layer.SetAttributeFilter(where)
+    target = osr.SpatialReference(projection)
+    trans = osr.CoordinateTransformation(layer.GetSpatialRef(), target)
+
+    mem = ogr.GetDriverByName('Memory').CreateDataSource('zones')
+    zlayer = mem.CreateLayer('zones', target, ogr.wkbUnknown)
+    zlayer.CreateField(ogr.FieldDefn('zone', ogr.OFTInteger))
+    keys = []
+    for feat in layer:
+        geom = feat.GetGeometryRef().Clone()
+        geom.Transform(trans)
+        zfeat = ogr.Feature(zlayer.GetLayerDefn())
+        zfeat.SetGeometry(geom)
+        zfeat.SetField('zone', len(keys) + 1)
+        zlayer.CreateFeature(zfeat)
+        keys.append(feat.GetField(key) if key != '' else feat.GetFID())
+
+    ds = gdal.GetDriverByName('MEM').Create('', xsize, ysize, 1, gdal.GDT_Int32)
+    ds.SetProjection(projection)
+    ds.SetGeoTransform(affine)
+    gdal.RasterizeLayer(ds, [1], zlayer, options=['ATTRIBUTE=zone'])
+    zones = ds.GetRasterBand(1).ReadAsArray()
+    ds = None
+    missing = len(keys) - numpy.count_nonzero(numpy.bincount(zones.ravel())[1:])
+    if missing > 0:
+        utils.verbose_out('{} of {} features contain no pixel centers, so have no'
+                          ' zonal statistics'.format(missing, len(keys)), 2)
+    return zones, keys
+
+
+class ZoneCache(object):
+    """ Rasterized zones of a site's features, per grid, cached in cachedir
+
+    Cached zones are keyed by the site file's path, size, and modification
+    time, key, where, and the grid, so they are remade when any changes.
+    For a db layer (see utils.open_vector), only its name is used, so
+    changes to it aren't noticed.
+    """
+
+    def __init__(self, site, cachedir, key='', where=''):
+        self.site = os.path.abspath(site) if os.path.exists(site) else site
+        self.cachedir = cachedir
+        self.key = key
+        self.where = where
+        self._keys = {}
+
+    def _hash(self, grid):
+        ident = [self.site, self.key, self.where, grid]
+        if os.path.exists(self.site):
+            stat = os.stat(self.site)
+            ident[1:1] = [stat.st_size, stat.st_mtime]
+        return hashlib.sha1(json.dumps(ident)).hexdigest()
+
+    def get(self, grid):
+        """ Path of the .npy file of zones on grid, and the zones' keys """
+        h = self._hash(grid)
+        path = os.path.join(self.cachedir, h + '.npy')
+        keypath = path[:-4] + '.json'
+        if h not in self._keys:
+            if os.path.exists(keypath):
+                with open(keypath) as f:
+                    self._keys[h] = json.load(f)
+            else:
+                utils.verbose_out('Rasterizing {} zones'.format(self.site), 2)
+                zones, keys = rasterize(self.site, grid, self.key, self.where)
+                utils.mkdir(self.cachedir)
+                # each file is written under a temporary name then renamed, keys
+                # last, so zones are only used once both files are complete
+                tmp = '{}.{}.tmp'.format(path[:-4], os.getpid())
+                numpy.save(tmp + '.npy', zones)
+                os.rename(tmp + '.npy', path)
+                with open(tmp + '.json', 'w') as f:
+                    json.dump(keys, f)
+                os.rename(tmp + '.json', keypath)
+                self._keys[h] = keys
+        return path, self._keys[h]
+
+
+class ZoneStats(object):
+    """ Per-zone moments, as statistics.Moments, of values added a block at a time """
+
+    def __init__(self, nzones):
+        n = nzones + 1 # zone 0 is outside every feature
+        self.count = numpy.zeros(n, dtype='int64')
+        self.mean = numpy.zeros(n)
+        self.m2 = numpy.zeros(n)
+        self.m3 = numpy.zeros(n)
+        self.min = numpy.full(n, numpy.inf)
+        self.max = numpy.full(n, -numpy.inf)
+
+    def add(self, zone, values):
+        """ Add values, each in the zone of the same position in zone """
+        n = len(self.count)
+        nb = numpy.bincount(zone, minlength=n)
+        z = numpy.nonzero(nb)[0] # only zones with values can be merged
+        mean_b = numpy.zeros(n)
+        mean_b[z] = numpy.bincount(zone, values, minlength=n)[z] / nb[z].astype('float64')
+        d = values - mean_b[zone]
+        (self.count[z], self.mean[z], self.m2[z], self.m3[z]) = merge_moments(
+            (self.count[z], self.mean[z], self.m2[z], self.m3[z]),
+            (nb[z], mean_b[z], numpy.bincount(zone, d * d, minlength=n)[z],
+             numpy.bincount(zone, d * d * d, minlength=n)[z]))
+        numpy.minimum.at(self.min, zone, values)
+        numpy.maximum.at(self.max, zone, values)
+
+    def bin_index(self, zone, values, bins):
+        """ Index of each value in a flattened zones x bins histogram """
+        lo, hi = self.min[zone], self.max[zone]
+        width = numpy.where(hi > lo, hi - lo, 1.0)
+        b = numpy.minimum(((values - lo) / width * bins).astype('int64'), bins - 1)
+        return zone * bins + b
+
+    def columns(self, hist=None, percentiles=()):
+        """ Statistics as a dict of columns, given the histogram if percentiles
+
+        Columns are zone_id, STATS, and 'p<q>' for each q in percentiles, with
+        a row for each zone with any values.  hist is the zones x bins array
+        of counts of values at each bin_index.
+        """
+        present = numpy.nonzero(self.count)[0]
+        n = self.count[present]
+        sd, skew = sd_skew(n, self.m2[present], self.m3[present])
+        columns = {
+            'zone_id': present,
+            'count': n,
+            'mean': self.mean[present],
+            'sd': sd,
+            'skew': skew,
+            'min': self.min[present],
+            'max': self.max[present],
+        }
+        pct = numpy.zeros((len(present), len(percentiles)))
+        if percentiles:
+            for i, z in enumerate(present):
+                lo, hi = self.min[z], self.max[z]
+                if lo == hi:
+                    pct[i] = lo
+                else:
+                    edges = numpy.linspace(lo, hi, hist.shape[1] + 1)
+                    pct[i] = hist_percentiles(hist[z], edges, percentiles)
+        for j, q in enumerate(percentiles):
+            columns['p%g' % q] = pct[:, j]
+        return columns
+
+
+def summarize(zone, values, percentiles=(), bins=1000):
+    """ Statistics of values grouped by zone id, as ZoneStats.columns gives them """
+    zs = ZoneStats(int(zone.max()) if zone.size else 0)
+    zs.add(zone, values)
+    hist = None
+    if percentiles:
+        hist = numpy.bincount(zs.bin_index(zone, values, bins),
+                              minlength=len(zs.count) * bins).reshape((-1, bins))
+    return zs.columns(hist, percentiles)
+
+
+def zonal_stats(filename, zonefile, nzones, percentiles=(), bins=1000, rows=None):
+    """ Zonal statistics of each band of an image, as [(band description, columns)]
+
+    Blocks of rows are read at a time, by default as many as fit in gippy's
+    chunk size (--chunksize); blocks without any zones aren't read.  Bands
+    are read a second time if percentiles are wanted.
+    """
+    img = gippy.GeoImage(filename)
+    zones = numpy.load(zonefile, mmap_mode='r')
+    ysize, xsize = zones.shape
+    if rows is None:
+        rows = max(int(gippy.Options.ChunkSize() * 2 ** 20 / (xsize * 8 * 3)), 1)
+
+    def blocks(band):
+        """ Yield the zones & values of the valid zoned pixels of each block """
+        nodata = band.NoDataValue()
+        for y in range(0, ysize, rows):
+            z = numpy.array(zones[y:y + rows])
+            if not z.any():
+                continue
+            arr = numpy.array(band.Read(gippy.Recti(0, y, xsize, z.shape[0])), dtype='float64')
+            arr = arr.reshape(z.shape)
+            valid = (z > 0) & (arr != nodata) & ~numpy.isnan(arr)
+            yield z[valid], arr[valid]
+
+    results = []
+    for band in img:
+        zs = ZoneStats(nzones)
+        for z, v in blocks(band):
+            zs.add(z, v)
+        hist = None
+        if percentiles:
+            hist = numpy.zeros(len(zs.count) * bins, dtype='int64')
+            for z, v in blocks(band):
+                hist += numpy.bincount(zs.bin_index(z, v, bins), minlength=hist.size)
+            hist = hist.reshape((-1, bins))
+        results.append((band.Description(), zs.columns(hist, percentiles)))
+    img = None
+    return results
+
+
+def _zonal_worker(args):
+    return zonal_stats(*args)
+
+
+def project_zonal_stats(inv, product, zcache, percentiles=(), workers=1, bins=1000):
+    """ Zonal statistics of product over a ProjectInventory, as columns
+
+    Columns are zone (the feature's key), date (YYYY-DOY), band, then as
+    for ZoneStats.columns.  Dates are computed by a pool of that many processes if
+    workers > 1; rows are in date order regardless.
+    """
+    dates = [d for d in inv.dates if product in inv.products(d)]
+    jobs, keys = [], []
+    for d in dates:
+        filename = inv[d][product]
+        img = gippy.GeoImage(filename)
+        zonefile, zkeys = zcache.get(grid(img))
+        img = None
+        jobs.append((filename, zonefile, len(zkeys), percentiles, bins))
+        keys.append(zkeys)
+    if workers > 1 and len(jobs) > 1:
+        pool = multiprocessing.Pool(min(workers, len(jobs)))
+        try:
+            results = pool.map(_zonal_worker, jobs, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_zonal_worker(j) for j in jobs]
+
+    parts = []
+    for d, zkeys, bands in zip(dates, keys, results):
+        for bname, columns in bands:
+            n = len(columns['zone_id'])
+            columns['zone'] = numpy.array([u'%s' % k for k in zkeys])[columns['zone_id'] - 1]
+            columns['date'] = numpy.array([d.strftime('%Y-%j')] * n)
+            columns['band'] = numpy.array([bname] * n)
+            parts.append(columns)
+    names = ['zone', 'date', 'band'] + STATS + ['p%g' % q for q in percentiles]
+    if not parts:
+        return {name: numpy.zeros(0) for name in names}
+    return {name: numpy.concatenate([c[name] for c in parts]) for name in names}